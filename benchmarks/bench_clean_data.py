@@ -0,0 +1,119 @@
+"""
+Compares clean_data and balance_data with the implementation before the rewrite, which
+lowercased the whole corpus for every rule and deleted elements with np.delete.
+
+Usage (from the repository root, with the environment of the app):
+    python -m benchmarks.bench_clean_data --sizes 10000 100000 1000000
+
+The preprocessing of the texts is the same for both implementations and is not measured.
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.corpus import generate_corpus
+from tatorte_classifier.machine_learning.train_model import balance_data, clean_data
+
+
+def _legacy_change_category(x, y, old_category, new_category, condition):
+    y[np.intersect1d(np.where(condition(x))[0], np.where(y == old_category)[0])] = new_category
+    return y
+
+
+def _legacy_drop_all_containing_keyword(x, y, keyword, category=None):
+    str_contain = np.vectorize(lambda x: keyword in x.lower())
+    idxs = np.where(str_contain(x))
+    if category is not None:
+        idxs = np.intersect1d(idxs, np.where(y == category))
+    y = np.delete(y, idxs)
+    x = np.delete(x, idxs)
+    return x, y
+
+
+def legacy_clean_data(x, y):
+    str_contain = np.vectorize(lambda x: "verkehrskontroll" in x.lower())
+    y = _legacy_change_category(x, y, 5, 4, str_contain)
+    str_contain = np.vectorize(lambda x: "eingebroch" in x.lower())
+    y = _legacy_change_category(x, y, 4, 3, str_contain)
+    x, y = _legacy_drop_all_containing_keyword(x, y, "alkohol")
+    x, y = _legacy_drop_all_containing_keyword(x, y, "dienstagmorg", category=3)
+    x, y = _legacy_drop_all_containing_keyword(x, y, "fahrrad", category=3)
+    return x, y
+
+
+def legacy_balance_data(x, y, n_per_class):
+    for i in np.unique(y):
+        idxs = np.where(y == i)[0]
+        np.random.shuffle(idxs)
+        idxs = idxs[: (len(idxs) - n_per_class)]
+        x = np.delete(x, idxs)
+        y = np.delete(y, idxs)
+    return x, y
+
+
+def _time(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def run(sizes, n_per_class_fraction=0.1):
+    results = []
+    for size in sizes:
+        x, y = generate_corpus(size)
+        n_per_class = int(size * n_per_class_fraction)
+
+        (legacy_x, legacy_y), legacy_clean = _time(legacy_clean_data, x, y.copy())
+        _, legacy_balance = _time(legacy_balance_data, legacy_x, legacy_y, n_per_class)
+
+        # passing the texts as tokens skips the preprocessing
+        (clean_x, clean_y), clean = _time(lambda: clean_data(x, y, tokens=x))
+        _, balance = _time(balance_data, clean_x, clean_y, n_per_class)
+
+        assert np.array_equal(legacy_x, clean_x) and np.array_equal(legacy_y, clean_y)
+        results.append(
+            {
+                "size": size,
+                "legacy_clean": legacy_clean,
+                "clean": clean,
+                "legacy_balance": legacy_balance,
+                "balance": balance,
+            }
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    args = parser.parse_args()
+
+    print(
+        "{:>9} {:>14} {:>14} {:>8} {:>14} {:>14} {:>8}".format(
+            "texts",
+            "clean before",
+            "clean after",
+            "speedup",
+            "balance before",
+            "balance after",
+            "speedup",
+        )
+    )
+    for result in run(args.sizes):
+        print(
+            "{:>9} {:>13.3f}s {:>13.3f}s {:>7.1f}x {:>13.3f}s {:>13.3f}s {:>7.1f}x".format(
+                result["size"],
+                result["legacy_clean"],
+                result["clean"],
+                result["legacy_clean"] / result["clean"],
+                result["legacy_balance"],
+                result["balance"],
+                result["legacy_balance"] / result["balance"],
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
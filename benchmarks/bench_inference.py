@@ -0,0 +1,88 @@
+"""
+Latency of predicting a single text with a sgd model: the sklearn pipeline, the ArrayPipeline of
+a model directory and the compact inference of linear_inference.py, which get_prediction uses.
+
+Usage (from the repository root, with the environment of the app):
+    python -m benchmarks.bench_inference --train-size 20000 --requests 2000
+
+Every text is predicted once before the measurement, so the stems are cached like in a running
+server. The largest difference of the probabilities to the pipeline is reported as well.
+"""
+
+import os
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+from benchmarks.corpus import generate_corpus
+from tatorte_classifier.machine_learning.linear_inference import compile_model
+from tatorte_classifier.machine_learning.model import Model
+from tatorte_classifier.machine_learning.model_format import load_model_dir, save_model_dir
+
+
+def _latencies(predict, descs) -> np.ndarray:
+    times = np.empty(len(descs))
+    for i, desc in enumerate(descs):
+        start = time.perf_counter()
+        predict(desc)
+        times[i] = time.perf_counter() - start
+    return times
+
+
+def run(train_size: int, n_requests: int, loss: str = "log") -> list:
+    x, y = generate_corpus(train_size)
+    model = Model("sgd", {"loss": loss, "max_iter": 20, "tol": None, "random_state": 0}, {})
+    model.pipeline.fit(x, y)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "model")
+        save_model_dir(model, path)
+        # memory mapped like in the server, the compact inference reads the mapped arrays
+        array_model = load_model_dir(path)
+        compact = compile_model(array_model)
+        descs, _ = generate_corpus(n_requests, seed=1)
+        return _measure(model, array_model, compact, descs)
+
+
+def _measure(model, array_model, compact, descs) -> list:
+    paths = [
+        ("pipeline", lambda desc: model.pipeline.predict_proba([desc])[0]),
+        ("arrays", lambda desc: array_model.pipeline.predict_proba([desc])[0]),
+        ("compact", compact.predict_proba_one),
+    ]
+    expected = model.pipeline.predict_proba(descs)
+    results = []
+    for name, predict in paths:
+        # warm up the stem cache and numpy
+        probas = np.vstack([predict(desc) for desc in descs])
+        times = _latencies(predict, descs)
+        results.append(
+            {
+                "path": name,
+                "p50": float(np.percentile(times, 50)),
+                "p99": float(np.percentile(times, 99)),
+                "max_diff": float(np.abs(probas - expected).max()),
+            }
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--train-size", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--loss", default="log", choices=["log", "modified_huber"])
+    args = parser.parse_args()
+
+    print("{:>10} {:>12} {:>12} {:>12}".format("path", "p50", "p99", "max diff"))
+    for result in run(args.train_size, args.requests, args.loss):
+        print(
+            "{:>10} {:>10.1f}us {:>10.1f}us {:>12.2e}".format(
+                result["path"], result["p50"] * 1e6, result["p99"] * 1e6, result["max_diff"]
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
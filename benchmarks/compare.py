@@ -0,0 +1,95 @@
+"""
+Compares two result files of benchmarks/suite.py.
+
+Usage (from the repository root):
+    python -m benchmarks.compare baseline.json results.json --threshold 0.2
+
+A benchmark regressed, if its seconds grew by more than the threshold (0.2 means 20% slower).
+The exit code is 1 if any benchmark regressed, so it can fail a CI job. Benchmarks which are
+only in one of the files are listed, but don't count as regressions.
+"""
+
+import sys
+import json
+import argparse
+
+
+def compare(baseline: dict, results: dict, threshold: float = 0.2) -> list:
+    """Compare the seconds of every benchmark and corpus size
+
+    Arguments:
+        baseline {dict} -- The results of the old version
+        results {dict} -- The results of the new version
+
+    Keyword Arguments:
+        threshold {float} -- Relative slowdown which counts as a regression (default: {0.2})
+
+    Returns:
+        list -- {"benchmark", "size", "baseline", "seconds", "ratio", "regression"} for every
+                benchmark, baseline or seconds is None if it is missing in one of the files
+    """
+
+    old = {(r["benchmark"], r["size"]): r["seconds"] for r in baseline["results"]}
+    new = {(r["benchmark"], r["size"]): r["seconds"] for r in results["results"]}
+    rows = []
+    for key in list(old) + [key for key in new if key not in old]:
+        seconds = new.get(key)
+        ratio = seconds / old[key] if key in old and seconds is not None and old[key] else None
+        rows.append(
+            {
+                "benchmark": key[0],
+                "size": key[1],
+                "baseline": old.get(key),
+                "seconds": seconds,
+                "ratio": ratio,
+                "regression": ratio is not None and ratio > 1 + threshold,
+            }
+        )
+    return rows
+
+
+def _format_seconds(seconds) -> str:
+    if seconds is None:
+        return "-"
+    if seconds < 0.01:
+        return "{:.1f}us".format(seconds * 1e6)
+    return "{:.3f}s".format(seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("baseline")
+    parser.add_argument("results")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.results) as f:
+        results = json.load(f)
+    rows = compare(baseline, results, args.threshold)
+
+    print(
+        "{:>22} {:>9} {:>12} {:>12} {:>8}".format("benchmark", "texts", "before", "after", "ratio")
+    )
+    for row in rows:
+        print(
+            "{:>22} {:>9} {:>12} {:>12} {:>8} {}".format(
+                row["benchmark"],
+                row["size"],
+                _format_seconds(row["baseline"]),
+                _format_seconds(row["seconds"]),
+                "-" if row["ratio"] is None else "{:.2f}x".format(row["ratio"]),
+                "REGRESSION" if row["regression"] else "",
+            )
+        )
+    regressions = [row for row in rows if row["regression"]]
+    if regressions:
+        print("{} of {} benchmarks regressed".format(len(regressions), len(rows)))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Synthetic corpus shaped like the police reports in the texts collection: German sentences for
+the 5 categories, mixed with the boilerplate of press releases (telephone numbers, links,
+emails) and the keywords of the cleaning rules.
+
+Usage:
+    from benchmarks.corpus import generate_corpus
+
+    x, y = generate_corpus(10000)
+"""
+from typing import Tuple
+
+import numpy as np
+
+CATEGORY_SENTENCES = {
+    0: [
+        "In der Nacht brannte der Dachstuhl eines Einfamilienhauses vollständig aus.",
+        "Die Feuerwehr konnte das Feuer nach zwei Stunden löschen.",
+        "Ein Anwohner bemerkte den Rauch und alarmierte die Rettungskräfte.",
+        "Die Brandursache ist noch unklar, ein Brandstifter wird nicht ausgeschlossen.",
+    ],
+    1: [
+        "Die Mordkommission hat die Ermittlungen übernommen.",
+        "Der Mann wurde leblos in seiner Wohnung aufgefunden.",
+        "Die Obduktion ergab, dass das Opfer gewaltsam getötet wurde.",
+        "Ein Tatverdächtiger wurde noch am Abend festgenommen.",
+    ],
+    2: [
+        "Zwei Unbekannte schlugen den Geschädigten und raubten seine Geldbörse.",
+        "Der Täter war in die Wohnung eingebrochen und entwendete Schmuck.",
+        "Das Opfer erlitt bei dem Überfall leichte Verletzungen.",
+        "Die Täter flüchteten mit einem gestohlenen Fahrrad in unbekannte Richtung.",
+    ],
+    3: [
+        "Bei einem Verkehrsunfall auf der Kreuzung wurden zwei Personen verletzt.",
+        "Der Autofahrer übersah beim Abbiegen den Radfahrer.",
+        "Der Sachschaden wird auf etwa zehntausend Euro geschätzt.",
+        "Bei einer Verkehrskontrolle stellten die Beamten Alkoholgeruch fest.",
+    ],
+    4: [
+        "Bei der Durchsuchung fanden die Beamten Kokain und Cannabis.",
+        "Der Dealer wurde auf frischer Tat festgenommen.",
+        "Die Drogen wurden sichergestellt, ein Strafverfahren wurde eingeleitet.",
+        "Am Dienstagmorgen wurden mehrere Wohnungen wegen Drogenhandels durchsucht.",
+    ],
+}
+
+COMMON_SENTENCES = [
+    "Die Polizei sucht nach Zeugen.",
+    "Am Montagabend gegen 22 Uhr meldete sich ein Zeuge bei der Polizei.",
+    "Die Ermittlungen dauern an.",
+    "Hinweise nimmt jede Polizeidienststelle entgegen.",
+]
+
+CONTACT_SENTENCES = [
+    "Rückfragen bitte an: Polizeipräsidium, Tel.: 0395/5582-2223, Fax: 0395/5582-2026",
+    "E-Mail: pressestelle.pp@polizei.berlin.de",
+    "http://www.polizei.berlin.de/presse/meldung-{}.html",
+    "Weitere Informationen: https://twitter.com/polizei_{} und facebook: https://facebook.com/pp",
+]
+
+
+def generate_corpus(n: int, seed: int = 0, n_sentences: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+    """Generate a synthetic corpus of police reports
+
+    Arguments:
+        n {int} -- Number of texts
+
+    Keyword Arguments:
+        seed {int} -- Seed of the random generator (default: {0})
+        n_sentences {int} -- Mean number of sentences of a text (default: {5})
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray] -- The texts (object array) and the categories
+    """
+
+    random = np.random.RandomState(seed)
+    y = random.randint(0, len(CATEGORY_SENTENCES), size=n)
+    x = np.empty(n, dtype=object)
+    for i, category in enumerate(y):
+        sentences = CATEGORY_SENTENCES[category]
+        text = [
+            sentences[j] for j in random.randint(0, len(sentences), random.poisson(n_sentences))
+        ]
+        if random.random_sample() < 0.3:
+            # reports often mention things of other categories
+            other_sentences = CATEGORY_SENTENCES[random.randint(len(CATEGORY_SENTENCES))]
+            text.append(other_sentences[random.randint(len(other_sentences))])
+        text.append(COMMON_SENTENCES[random.randint(len(COMMON_SENTENCES))])
+        contact = CONTACT_SENTENCES[random.randint(len(CONTACT_SENTENCES))]
+        text.append(contact.format(random.randint(100000)))
+        x[i] = " ".join(text)
+    return x, y
@@ -0,0 +1,271 @@
+"""
+Benchmark suite on the synthetic corpus of benchmarks/corpus.py, for catching performance
+regressions between two versions of the code.
+
+Usage (from the repository root, with the environment of the app and requirements-dev.txt):
+    python -m benchmarks.suite --sizes 1000 10000 --output results.json
+    python -m benchmarks.compare baseline.json results.json
+
+For every corpus size it times loading the training data from the texts collection, the
+DataPreprocessor, clean_data and balance_data, train_model for every classifier and the single
+and batch predictions of the trained models. The texts collection is an in-memory mongomock
+collection, so no Mongo server is needed (and its speed isn't measured). Throughput benchmarks
+report the best of --repeat runs, latency benchmarks the percentiles of --requests single
+predictions after every text was predicted once, so the stems are cached like in a running
+server. "seconds" is the number compare.py compares.
+"""
+
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+from contextlib import contextmanager
+from unittest import mock
+
+import numpy as np
+import sklearn
+
+from benchmarks.corpus import generate_corpus
+from configuration import COMPACT_INFERENCE, TRAINING_BATCH_SIZE
+from tatorte_classifier.machine_learning.get_prediction import (
+    get_batch_prediction_lists,
+    get_prediction_list,
+)
+from tatorte_classifier.machine_learning.preprocess_data import DataPreprocessor
+from tatorte_classifier.machine_learning.train_model import balance_data, clean_data, train_model
+
+# the classifiers with params like the ones of the frontend, all of them predict probabilities
+CLASSIFIERS = {
+    "sgd": {"loss": "log", "alpha": 0.0001, "max_iter": 100, "random_state": 0},
+    "svm": {"kernel": "linear", "probability": True, "random_state": 0},
+    "nn": {"hidden_layer_sizes": (50, 50), "max_iter": 200, "random_state": 0},
+}
+
+
+@contextmanager
+def in_memory_texts():
+    """Replace the texts collection of database.py with an in-memory mongomock collection
+
+    Yields:
+        module -- database.py
+    """
+
+    try:
+        import mongomock
+    except ImportError:
+        raise ImportError("The benchmark suite needs mongomock, pip install -r requirements-dev.txt")
+    from tatorte_classifier import database
+
+    with mock.patch.object(database, "texts", mongomock.MongoClient().db.texts):
+        yield database
+
+
+def _time(function, repeat: int):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return result, times
+
+
+def _throughput(benchmark: str, size: int, times: list, n_texts: int) -> dict:
+    return {
+        "benchmark": benchmark,
+        "size": size,
+        "seconds": min(times),
+        "runs": times,
+        "texts_per_second": n_texts / min(times),
+    }
+
+
+def _latency(benchmark: str, size: int, times: np.ndarray) -> dict:
+    return {
+        "benchmark": benchmark,
+        "size": size,
+        "seconds": float(np.percentile(times, 50)),
+        "p50": float(np.percentile(times, 50)),
+        "p99": float(np.percentile(times, 99)),
+        "requests": len(times),
+    }
+
+
+def bench_loading(x, y, repeat: int) -> dict:
+    with in_memory_texts() as database:
+        database.create_texts([{"data": d, "categories": [int(c)]} for d, c in zip(x, y)])
+        _, times = _time(lambda: database.get_training_data(TRAINING_BATCH_SIZE), repeat)
+    return _throughput("load_training_data", len(x), times, len(x))
+
+
+def bench_preprocessing(x, y, repeat: int, values_per_category: int) -> list:
+    preprocessor = DataPreprocessor()
+    _, preprocess_times = _time(lambda: preprocessor.transform_many(x), repeat)
+    # passing the texts as tokens skips the preprocessing, it is measured above
+    (clean_x, clean_y), clean_times = _time(lambda: clean_data(x, y, tokens=x), repeat)
+    _, balance_times = _time(
+        lambda: balance_data(clean_x, clean_y, values_per_category), repeat
+    )
+    return [
+        _throughput("preprocess", len(x), preprocess_times, len(x)),
+        _throughput("clean_data", len(x), clean_times, len(x)),
+        _throughput("balance_data", len(x), balance_times, len(clean_x)),
+    ]
+
+
+def bench_training(x, y, clf: str, repeat: int, values_per_category: int):
+    (model, *_), times = _time(
+        lambda: train_model(
+            x, y, clf, CLASSIFIERS[clf], {}, values_per_category=values_per_category
+        ),
+        repeat,
+    )
+    return model, _throughput("train_" + clf, len(x), times, len(x))
+
+
+def bench_prediction(model, clf: str, size: int, descs, batch_size: int, repeat: int) -> list:
+    preprocessor = DataPreprocessor()
+
+    def predict(desc):
+        return get_prediction_list(preprocessor(desc), model, 3)
+
+    # warm up the stem cache and numpy
+    for desc in descs:
+        predict(desc)
+    times = np.empty(len(descs))
+    for i, desc in enumerate(descs):
+        start = time.perf_counter()
+        predict(desc)
+        times[i] = time.perf_counter() - start
+
+    batches = [descs[i : i + batch_size] for i in range(0, len(descs), batch_size)]
+    _, batch_times = _time(
+        lambda: [
+            get_batch_prediction_lists(preprocessor.transform_many(batch), model, 3)
+            for batch in batches
+        ],
+        repeat,
+    )
+    return [
+        _latency("predict_single_" + clf, size, times),
+        _throughput("predict_batch_" + clf, size, batch_times, len(descs)),
+    ]
+
+
+def run(
+    sizes,
+    clfs=tuple(CLASSIFIERS),
+    repeat: int = 3,
+    n_requests: int = 1000,
+    batch_size: int = 100,
+    values_per_category: int = 900,
+    log=print,
+) -> dict:
+    """Run all benchmarks
+
+    Arguments:
+        sizes {Iterable[int]} -- The numbers of texts of the corpora
+
+    Keyword Arguments:
+        clfs {Iterable[str]} -- The classifiers trained (default: {all})
+        repeat {int} -- Number of runs of every throughput benchmark (default: {3})
+        n_requests {int} -- Number of predicted texts (default: {1000})
+        batch_size {int} -- Number of texts of a batch prediction (default: {100})
+        values_per_category {int} -- The values_per_category of train_model (default: {900})
+        log {Callable} -- Called with every result (default: {print})
+
+    Returns:
+        dict -- {"meta": {...}, "results": [{"benchmark": ..., "size": ..., "seconds": ...}]}
+    """
+
+    results = []
+
+    def record(result):
+        results.append(result)
+        log(_format_result(result))
+
+    descs, _ = generate_corpus(n_requests, seed=1)
+    descs = list(descs)
+    for size in sizes:
+        x, y = generate_corpus(size)
+        record(bench_loading(x, y, repeat))
+        for result in bench_preprocessing(x, y, repeat, values_per_category):
+            record(result)
+        for clf in clfs:
+            model, result = bench_training(x, y, clf, repeat, values_per_category)
+            record(result)
+            for result in bench_prediction(model, clf, size, descs, batch_size, repeat):
+                record(result)
+    return {
+        "meta": _meta(
+            sizes=list(sizes),
+            clfs=list(clfs),
+            repeat=repeat,
+            requests=n_requests,
+            batch_size=batch_size,
+            values_per_category=values_per_category,
+        ),
+        "results": results,
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def _meta(**options) -> dict:
+    return dict(
+        options,
+        time=time.strftime("%Y-%m-%d %H:%M:%S"),
+        commit=_git_commit(),
+        python=platform.python_version(),
+        platform=platform.platform(),
+        numpy=np.__version__,
+        sklearn=sklearn.__version__,
+        compact_inference=COMPACT_INFERENCE,
+    )
+
+
+def _format_result(result: dict) -> str:
+    if "p50" in result:
+        detail = "p50 {:.1f}us, p99 {:.1f}us".format(result["p50"] * 1e6, result["p99"] * 1e6)
+    else:
+        detail = "{:.4f}s, {:.0f} texts/s".format(result["seconds"], result["texts_per_second"])
+    return "{:>22} {:>9} {}".format(result["benchmark"], result["size"], detail)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--clfs", nargs="+", default=list(CLASSIFIERS), choices=list(CLASSIFIERS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--values-per-category", type=int, default=900)
+    parser.add_argument("--output", default="benchmark_results.json")
+    args = parser.parse_args()
+
+    results = run(
+        args.sizes,
+        args.clfs,
+        args.repeat,
+        args.requests,
+        args.batch_size,
+        args.values_per_category,
+        log=lambda line: print(line, file=sys.stderr),
+    )
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print("Wrote {} results to {}".format(len(results["results"]), args.output), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
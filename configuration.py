@@ -44,6 +44,63 @@ if "CURRENT_MODEL_PATH" not in os.environ:
     logger.warning("CURRENT_MODEL_PATH is not set")
 CURRENT_MODEL_PATH: str = str(os.getenv("CURRENT_MODEL_PATH"))
 
+# Format new models are saved in: "npy" for a model directory with a manifest and memory mappable
+# arrays, "sav" for a dill pickle of the whole model
+MODEL_FORMAT = os.getenv("MODEL_FORMAT", "npy")
+# Convert .sav models into model directories in MODEL_DIR/.shared when they are loaded, so all
+# server processes map the same arrays instead of unpickling a copy each
+SHARED_MODEL_WEIGHTS = os.getenv("SHARED_MODEL_WEIGHTS", "true").lower() == "true"
+
+# Predict single texts of sgd models with the compact inference of
+# tatorte_classifier/machine_learning/linear_inference.py instead of the sklearn pipeline
+COMPACT_INFERENCE = os.getenv("COMPACT_INFERENCE", "true").lower() == "true"
+
+# Number of deserialized models kept in memory per worker and an optional budget in bytes
+# (measured by the size of the model files, 0 means no byte budget)
+MODEL_CACHE_SIZE = int(os.getenv("MODEL_CACHE_SIZE", "4"))
+MODEL_CACHE_MAX_BYTES = int(os.getenv("MODEL_CACHE_MAX_BYTES", "0"))
+
+# Number of predictions cached per worker (0 disables the cache), the seconds after which a cached
+# prediction expires (0 means never) and an optional redis url to share the cache between workers
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "10000"))
+PREDICTION_CACHE_TTL = float(os.getenv("PREDICTION_CACHE_TTL", "3600"))
+PREDICTION_CACHE_URL = os.getenv("PREDICTION_CACHE_URL", "")
+
+# Directory of the feature store, which keeps the fitted tf-idf vectorizers and matrices of the
+# last FEATURE_STORE_SIZE training runs (0 disables it)
+FEATURE_STORE_DIR = os.getenv("FEATURE_STORE_DIR", os.path.join(MODEL_DIR, ".features"))
+FEATURE_STORE_SIZE = int(os.getenv("FEATURE_STORE_SIZE", "8"))
+
+# Number of models trained in parallel (each one in its own process) and the maximum number of
+# queued training jobs per server process
+TRAINING_WORKERS = int(os.getenv("TRAINING_WORKERS", "1"))
+TRAINING_QUEUE_SIZE = int(os.getenv("TRAINING_QUEUE_SIZE", "10"))
+# Number of processes training the trials of a hyperparameter search or the folds of a
+# cross-validation (-1 means all cores)
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", "-1"))
+# Seconds between two updates of the current model, if it is incremental, with the texts changed
+# since it was trained (0 disables the schedule) and the number of passes over these texts
+INCREMENTAL_UPDATE_INTERVAL = float(os.getenv("INCREMENTAL_UPDATE_INTERVAL", "0"))
+INCREMENTAL_UPDATE_EPOCHS = int(os.getenv("INCREMENTAL_UPDATE_EPOCHS", "1"))
+# Number of texts fetched from the database at once when loading the training data
+TRAINING_BATCH_SIZE = int(os.getenv("TRAINING_BATCH_SIZE", "1000"))
+# Number of texts written to the database at once by the bulk ingestion endpoint
+BULK_INSERT_BATCH_SIZE = int(os.getenv("BULK_INSERT_BATCH_SIZE", "1000"))
+
+# "wsgi" serves the flask app, "asgi" the async app of tatorte_classifier.asgi (needs starlette,
+# motor and uvicorn). PREDICTION_WORKERS is the number of threads predicting in the async app
+SERVER_MODE = os.getenv("SERVER_MODE", "wsgi")
+PREDICTION_WORKERS = int(os.getenv("PREDICTION_WORKERS", "4"))
+
+# Serve latency histograms and counters in the Prometheus text format at /metrics. When false,
+# the instrumentation is a no-op and /metrics responds with 404
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() == "true"
+
+# Number of random text ids prefetched for the data-checker and the share of unlabeled texts
+# among them (0.0 samples uniformly, 1.0 prefers unlabeled texts as long as there are any)
+RANDOM_SAMPLE_BUFFER_SIZE = int(os.getenv("RANDOM_SAMPLE_BUFFER_SIZE", "1000"))
+RANDOM_SAMPLE_UNLABELED_SHARE = float(os.getenv("RANDOM_SAMPLE_UNLABELED_SHARE", "0.0"))
+
 if "MIN_DESC_LEN" not in os.environ:
     logger.warning("MIN_DESC_LEN is not set")
 MIN_DESC_LEN = int(os.getenv("MIN_DESC_LEN"))
@@ -76,6 +133,10 @@ if "FLASK_MODE" not in os.environ:
     logger.warning("FLASK_MODE is not set")
 FLASK_MODE: str = str(os.getenv("FLASK_MODE"))
 
+# Optional json file with the cleaning rules applied before training, see
+# tatorte_classifier/machine_learning/cleaning_rules.py. The default rules are used, if not set
+CLEANING_RULES_PATH: str = os.getenv("CLEANING_RULES_PATH", "")
+
 # Flask conf
 class Config:
     DEBUG = False
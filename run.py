@@ -1,9 +1,22 @@
-from tatorte_classifier import create_app
-from configuration import ProductionConfig, DevelopementConfig, FLASK_MODE, PORT, HOST
+from configuration import (
+    ProductionConfig,
+    DevelopementConfig,
+    FLASK_MODE,
+    PORT,
+    HOST,
+    SERVER_MODE,
+)
 
-app = create_app()
-if FLASK_MODE == "production":
-    app.config.from_object(ProductionConfig)
-elif FLASK_MODE == "developement":
-    app.config.from_object(DevelopementConfig)
-app.run(host=HOST, port=PORT)
+if SERVER_MODE == "asgi":
+    import uvicorn
+
+    uvicorn.run("tatorte_classifier.asgi:app", host=HOST, port=int(PORT))
+else:
+    from tatorte_classifier import create_app
+
+    app = create_app()
+    if FLASK_MODE == "production":
+        app.config.from_object(ProductionConfig)
+    elif FLASK_MODE == "developement":
+        app.config.from_object(DevelopementConfig)
+    app.run(host=HOST, port=PORT)
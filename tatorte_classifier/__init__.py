@@ -1,12 +1,21 @@
 from flask import Flask
-from configuration import STATIC_FOLDER
+from configuration import INCREMENTAL_UPDATE_INTERVAL, STATIC_FOLDER
+from tatorte_classifier.database import ensure_indexes
 
 
 def create_app():
     app = Flask("tatorte_api", static_folder=STATIC_FOLDER)
-    with app.app_context():  # To be able to use current_app
-        from tatorte_classifier import api
+    ensure_indexes()
+    from tatorte_classifier.api import api
     from tatorte_classifier import frontend
 
+    api.init_app(app)
+
     app.register_blueprint(frontend.bp)
+    from tatorte_classifier.training_jobs import training_jobs
+
+    # the jobs of a restarted server process are lost, they are failed after a while
+    training_jobs.watch_jobs()
+    if INCREMENTAL_UPDATE_INTERVAL > 0:
+        training_jobs.schedule_updates(INCREMENTAL_UPDATE_INTERVAL)
     return app
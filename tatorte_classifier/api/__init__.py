@@ -1,21 +1,43 @@
-from flask import current_app
 from flask_restful import Api
 
-from tatorte_classifier.api.texts import Text, TextList
+from tatorte_classifier.api.texts import Text, TextBulk, TextList
 from tatorte_classifier.api.models import (
     ClassifierModel,
     ClassifierModelList,
     ClassifierModelPredict,
+    ClassifierModelPredictBatch,
+    ClassifierModelSearch,
+    ClassifierModelSearchTrials,
+    ClassifierModelUpdate,
     ClassifierModelOptions,
+    CurrentClassifierModel,
+    CurrentClassifierModelRollback,
+    ModelRegistryStats,
+    PredictionCacheStats,
 )
 from tatorte_classifier.api.categories import Categories
+from tatorte_classifier.api.jobs import TrainingJob, TrainingJobList
+from tatorte_classifier.api.metrics import Metrics
 
-api = Api(current_app)
+# the resources are registered on the app by create_app with api.init_app(app)
+api = Api()
 
 api.add_resource(Text, "/api/texts/<text_id>/")
 api.add_resource(TextList, "/api/texts/")
+api.add_resource(TextBulk, "/api/texts/bulk/")
 api.add_resource(Categories, "/api/categories/")
 api.add_resource(ClassifierModel, "/api/models/<model_filename>/")
 api.add_resource(ClassifierModelList, "/api/models/")
+api.add_resource(ClassifierModelSearch, "/api/models/search/")
+api.add_resource(ClassifierModelSearchTrials, "/api/models/search/<job_id>/")
+api.add_resource(CurrentClassifierModel, "/api/models/current/")
+api.add_resource(CurrentClassifierModelRollback, "/api/models/current/rollback/")
+api.add_resource(ClassifierModelUpdate, "/api/models/<model_filename>/update/")
 api.add_resource(ClassifierModelPredict, "/api/models/<model_name>/predict/")
+api.add_resource(ClassifierModelPredictBatch, "/api/models/<model_name>/predict_batch/")
 api.add_resource(ClassifierModelOptions, "/api/model_options/<model_name>/")
+api.add_resource(ModelRegistryStats, "/api/model_registry/")
+api.add_resource(PredictionCacheStats, "/api/prediction_cache/")
+api.add_resource(TrainingJob, "/api/jobs/<job_id>/")
+api.add_resource(TrainingJobList, "/api/jobs/")
+api.add_resource(Metrics, "/metrics")
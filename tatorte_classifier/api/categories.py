@@ -1,6 +1,14 @@
 from flask_restful import Resource
 from flask import jsonify
 
+CATEGORIES = [
+    {"key": 0, "name": "Feuer"},
+    {"key": 1, "name": "Mord"},
+    {"key": 2, "name": "Überfall/Körperverletzung"},
+    {"key": 3, "name": "Unfall"},
+    {"key": 4, "name": "Drogen"},
+]
+
 
 class Categories(Resource):
     def get(self) -> str:
@@ -11,11 +19,4 @@ class Categories(Resource):
                     corresponding class_text
         """
 
-        keys = [
-            {"key": 0, "name": "Feuer"},
-            {"key": 1, "name": "Mord"},
-            {"key": 2, "name": "Überfall/Körperverletzung"},
-            {"key": 3, "name": "Unfall"},
-            {"key": 4, "name": "Drogen"},
-        ]
-        return jsonify(keys)
+        return jsonify(CATEGORIES)
@@ -0,0 +1,57 @@
+import logging
+
+from bson.json_util import dumps
+from flask import jsonify
+from flask_restful import Resource
+from werkzeug.exceptions import BadRequest
+
+from tatorte_classifier.database import get_active_jobs, get_job
+from tatorte_classifier.training_jobs import training_jobs
+
+logger = logging.getLogger(__name__)
+
+
+class TrainingJob(Resource):
+    def get(self, job_id):
+        """Get the state of a training job
+        Returns:
+            {
+                "_id": {
+                    "$oid": "5c6ec0288c55ec0013a2bd81"
+                },
+                "state": "running", # queued, running, done, failed or cancelled
+                "stage": "training",
+                "progress": 0.4,
+                "cancel_requested": false,
+                "time_created": 1550758424.1,
+                "time_started": 1550758424.3,
+                "model_url": "",
+                "performance_data": {},
+                "metadata": {...},
+                "error_message": ""
+            }
+            Finished jobs additionally have "time_finished" and "duration" in seconds
+        """
+        try:
+            return dumps(get_job(job_id))
+        except Exception as err:
+            logger.error(str(err))
+            return BadRequest(str(err))
+
+    def delete(self, job_id):
+        """Cancels a queued or running training job
+        """
+
+        try:
+            return jsonify({"success": training_jobs.cancel(job_id)})
+        except Exception as err:
+            logger.error(str(err))
+            return BadRequest(str(err))
+
+
+class TrainingJobList(Resource):
+    def get(self):
+        """Get all queued and running training jobs, the oldest first
+        """
+
+        return dumps(get_active_jobs())
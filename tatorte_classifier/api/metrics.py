@@ -0,0 +1,27 @@
+from flask import Response
+from flask_restful import Resource
+
+from tatorte_classifier.metrics import metrics
+
+# the version of the Prometheus text format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Metrics(Resource):
+    def get(self):
+        """Get the latency histograms and counters of this server process in the Prometheus text
+        format, 404 if METRICS_ENABLED is false
+
+        Returns:
+            # HELP tatorte_prediction_stage_seconds Seconds spent in a stage of a prediction ...
+            # TYPE tatorte_prediction_stage_seconds histogram
+            tatorte_prediction_stage_seconds_bucket{stage="preprocess",le="0.0001"} 0
+            ...
+            tatorte_prediction_stage_seconds_count{stage="preprocess"} 120
+            tatorte_prediction_stage_seconds_sum{stage="preprocess"} 0.084
+            ...
+        """
+
+        if not metrics.enabled:
+            return Response("Metrics are disabled, set METRICS_ENABLED=true\n", status=404)
+        return Response(metrics.render(), content_type=CONTENT_TYPE)
@@ -1,31 +1,70 @@
 import logging
-import uuid
-from threading import Thread
 
-import numpy as np
 from bson.json_util import dumps
 from flask import jsonify, request, send_file
 from flask_restful import Resource
 from werkzeug.exceptions import BadRequest
 
 from configuration import MODEL_DIR
-from tatorte_classifier.database import create_model, get_all_models, get_all_texts
-from tatorte_classifier.machine_learning.get_prediction import get_predictions, load_model
+from tatorte_classifier.database import get_all_models, get_search_trials
+from tatorte_classifier.machine_learning.current_model import current_model
+from tatorte_classifier.machine_learning.hyperparameter_search import expand_search_space
+from tatorte_classifier.machine_learning.model_format import is_model_dir, zip_model_dir
+from tatorte_classifier.machine_learning.model_registry import model_registry
+from tatorte_classifier.machine_learning.prediction_cache import prediction_cache
 from tatorte_classifier.machine_learning.preprocess_data import DataPreprocessor
-from tatorte_classifier.machine_learning.train_model import save_model, train_model
+from tatorte_classifier.metrics import PREDICTED_TEXTS, PREDICTION_SECONDS, PREDICTION_STAGE_SECONDS
+from tatorte_classifier.training_jobs import training_jobs
 
 logger = logging.getLogger(__name__)
 
+# a list means, that there should be a dropdown selector, a number means a number input
+CLASSIFIER_OPTIONS = {
+    "sgd": {
+        "loss": ["log", "modified_huber", "perceptron"],
+        "penalty": ["l2", "l1", "elastic_net"],
+        "alpha": 0.0001,
+        "max_iter": 100,
+    },
+    "svm": {
+        "C": 1.0,
+        "kernel": ["linear", "poly", "rbf", "sigmoid", "precomputed"],
+        "degree": 3,
+        "probability": False,
+        "tol": 0.001,
+        "max_iter": -1,
+    },
+    "nn": {
+        "hidden_layer_sizes": "50 50",
+        "activation": ["identity", "logistic", "tanh", "relu"],
+        "solver": ["adam", "lbfgs", "sgd"],
+        "alpha": 0.0001,
+        "learning_rate": ["constant", "invscaling", "adaptive"],
+        "max_iter": 200,
+    },
+}
+# the classifiers with feature weights, which compact_model can prune, and its options
+COMPACTABLE_CLASSIFIERS = ("sgd", "nn")
+COMPACTION_OPTIONS = ("min_weight", "min_df", "max_features", "float32")
+
 
 class ClassifierModel(Resource):
     def get(self, model_filename: str):
-        """returns model .sav file
+        """returns model .sav file or a zip of the model directory
 
         Returns:
             file: MODEL_DIR/model_filename
         """
 
         try:
+            path = "{}/{}".format(MODEL_DIR, model_filename)
+            if is_model_dir(path):
+                return send_file(
+                    zip_model_dir(path),
+                    mimetype="application/zip",
+                    as_attachment=True,
+                    attachment_filename=model_filename + ".zip",
+                )
             return send_file(
                 "{}/{}".format(MODEL_DIR, model_filename), attachment_filename=model_filename
             )
@@ -48,7 +87,24 @@ class ClassifierModelList(Resource):
                     "model_url": "model-8d5e4706.sav",
                     "performance_data": {
                         "train_acc": 1,
-                        "test_acc": 0.7123287671232876
+                        "test_acc": 0.7123287671232876,
+                        "fit_time": 1.2,
+                        "confusion_matrix": [[40, 2], [3, 28]], # rows: true, columns: predicted
+                        "labels": [1, 2],
+                        "cv": { # only with cv_folds
+                            "folds": [{"test_acc": 0.73, "fit_time": 0.9}, ...],
+                            "mean_test_acc": 0.72,
+                            "std_test_acc": 0.01,
+                            "mean_fit_time": 0.9,
+                            "confusion_matrix": [[130, 6], [9, 95]],
+                            "labels": [1, 2]
+                        },
+                        "compaction": { # only with compaction
+                            "params": {"min_weight": 0.001, "min_df": 2, "max_features": None,
+                                       "float32": True},
+                            "before": {"n_features": 21034, "bytes": 1843210, "test_acc": 0.71},
+                            "after": {"n_features": 6120, "bytes": 402877, "test_acc": 0.71}
+                        }
                     },
                     "metadata": {
                         "clf": "sgd",
@@ -89,41 +145,154 @@ class ClassifierModelList(Resource):
                     "ngram_range": [1, 4]
                 },
                 "test_size": 0.2,
-                "values_per_category": 900
+                "values_per_category": 900,
+                "incremental": false, # only sgd, see /api/models/<model_filename>/update/
+                "cv_folds": 5, # optional k-fold cross-validation of the training texts
+                "n_jobs": 4, # processes training the folds, default: SEARCH_WORKERS
+                "compaction": {"min_weight": 0.001, "min_df": 2} # optional, only sgd and nn
             }
         Returns:
-            Error message or "Now training model". To get access to the model just call /api/models
-            and look for your model or navigate on the gui to the "models" sections
-        """
-
-        request_json = request.get_json()
-
-        def train(x: np.ndarray, y: np.ndarray) -> None:
-            try:
-                model, train_acc, test_acc, _ = train_model(x, y, **request_json)  # train model
-                # save model
-                model_id = uuid.uuid4().hex[:8]
-                save_model(model, str(model_id))
-                # add model to database
-                create_model(
-                    "model-{}.sav".format(model_id),
-                    {"train_acc": train_acc, "test_acc": test_acc},
-                    request_json,
-                    "",
-                )
-                logger.info("Trained new model with id: %s", model_id)
-            except Exception as err:
-                logger.error(str(err))
-                # insert model with
-                create_model("", {}, request_json, str(err))
+            Error message or {"job_id": "5c6ec0288c55ec0013a2bd81", "state": "queued"}. The model
+            is trained in the background. Its progress can be polled on /api/jobs/<job_id>/ and the
+            finished model is listed on /api/models and in the "models" section of the gui
+        """
+
+        try:
+            job_id = create_training(request.get_json())
+            return jsonify({"job_id": job_id, "state": "queued"})
+        except Exception as err:
+            logger.error(str(err))
+            return BadRequest(str(err))
+
+
+def create_training(metadata: dict) -> str:
+    """Validate the compaction of a training job and queue it
+
+    Raises:
+        ValueError: If the model can't be compacted with the given options
+
+    Returns:
+        str -- The id of the job
+    """
+
+    compaction = metadata.get("compaction")
+    if compaction is not None:
+        if metadata.get("clf") not in COMPACTABLE_CLASSIFIERS:
+            raise ValueError("Only sgd and nn models can be compacted")
+        if metadata.get("incremental"):
+            raise ValueError("Incremental models can't be compacted")
+        if not isinstance(compaction, dict) or set(compaction) - set(COMPACTION_OPTIONS):
+            raise ValueError(
+                "compaction takes the options {}".format(", ".join(COMPACTION_OPTIONS))
+            )
+    return training_jobs.submit(metadata)
+
+
+def create_search(search: dict) -> dict:
+    """Expand the search space and queue the search job
+
+    Returns:
+        dict -- The job id, the state and the number of trials
+    """
+
+    trials = expand_search_space(search["space"], search.get("n_trials"), search.get("seed"))
+    for trial in trials:
+        if trial["clf"] not in CLASSIFIER_OPTIONS:
+            raise ValueError("please choose one of the classifiers: [svm, sgd, nn]")
+    job_id = training_jobs.submit({"search": search, "trials": trials})
+    return {"job_id": job_id, "state": "queued", "trials": len(trials)}
+
+
+class ClassifierModelSearch(Resource):
+    def post(self):
+        """Queue a hyperparameter search. Every trial is recorded in the models collection
+        Input:
+            {
+                "space": {
+                    "clf": "sgd", # or a list of classifiers
+                    "clf_params": {
+                        "loss": ["log", "modified_huber"], # a list is a choice
+                        "alpha": {"log_uniform": [1e-6, 1e-3]}, # only with n_trials
+                        "max_iter": 100
+                    },
+                    "vect_params": {
+                        "ngram_range": [[1, 1], [1, 2]]
+                    }
+                }, # or a list of spaces, e.g. one for every classifier
+                "n_trials": 20, # random search, leave out for a grid search
+                "seed": 42,
+                "test_size": 0.3,
+                "values_per_category": 900,
+                "n_jobs": 4, # default: SEARCH_WORKERS
+                "early_stopping": {"eta": 3, "rungs": 3} # or false
+            }
+        Returns:
+            Error message or {"job_id": "5c6ec0288c55ec0013a2bd81", "state": "queued",
+            "trials": 20}. The job ends up with the best model, the trials are listed on
+            /api/models/search/<job_id>/
+        """
 
         try:
-            data = list(get_all_texts({"data": 1, "categories": 1}))
-            data = np.asarray([[i["data"], i["categories"][0]] for i in data]).T
-            x, y = data[0], data[1].astype(int)
-            thread = Thread(target=lambda: train(x, y))
-            thread.start()
-            return "Now training Model"
+            return jsonify(create_search(request.get_json()))
+        except Exception as err:
+            logger.error(str(err))
+            return BadRequest(str(err))
+
+
+class ClassifierModelSearchTrials(Resource):
+    def get(self, job_id: str):
+        """Get the trials of a search, the best first (by the accuracy on validation texts held
+        out of the training texts). Only the best trial is evaluated on the test texts
+        Returns:
+            [
+                {
+                    "_id": {"$oid": "5c6ec0288c55ec0013a2bd82"},
+                    "search_id": "5c6ec0288c55ec0013a2bd81",
+                    "model_url": "model-8d5e4706", # "" for stopped and failed trials
+                    "performance_data": {
+                        "train_acc": 0.99,
+                        "val_acc": 0.94,
+                        "test_acc": 0.93, # only the best trial
+                        "train_size": 1389, # the number of texts the trial was trained on
+                        "fit_time": 0.06,
+                        "state": "done" # done, stopped (early) or failed
+                    },
+                    "metadata": {"clf": "sgd", "clf_params": {...}, "vect_params": {...},
+                                 "test_size": 0.3, "values_per_category": 900},
+                    "error_message": "",
+                    "time_created": 1550758424.1
+                }, ...
+            ]
+        """
+
+        try:
+            return dumps(get_search_trials(job_id))
+        except Exception as err:
+            logger.error(str(err))
+            return BadRequest(str(err))
+
+
+class ClassifierModelUpdate(Resource):
+    def post(self, model_filename: str):
+        """Queue an update of an incremental model with the texts added or modified since it was
+        trained. The updated model is saved as a new model
+        Input (optional):
+            {
+                "promote": false # make the updated model the current model
+            }
+        Returns:
+            Error message or {"job_id": "5c6ec0288c55ec0013a2bd81", "state": "queued"}. The job
+            ends up with the new model_url, performance_data {"progressive_acc": 0.91,
+            "updated_texts": 120} (the accuracy of the old model on the changed texts) and the
+            metadata of the updated model with its base_model
+        """
+
+        try:
+            request_json = request.get_json(silent=True) or {}
+            job_id = training_jobs.submit_update(
+                model_filename, promote=bool(request_json.get("promote", False))
+            )
+            return jsonify({"job_id": job_id, "state": "queued"})
         except Exception as err:
             logger.error(str(err))
             return BadRequest(str(err))
@@ -134,7 +303,7 @@ class ClassifierModelPredict(Resource):
         self.preprocessor = DataPreprocessor()
 
     def post(self, model_name):
-        """Get predictions and probabilitys
+        """Get predictions and probabilitys, model_name "current" predicts with the current model
         Input:
             {
                 "data": "This is a test"
@@ -160,15 +329,178 @@ class ClassifierModelPredict(Resource):
             request_json = request.get_json()
             max_categories = request_json["parameters"]["max_categories"]
             desc = request_json["data"]
-            desc = self.preprocessor(desc)
-            preds = np.asarray(get_predictions([desc], load_model(model_name), max_categories)).T
-            preds = [{"category": pred_idx, "probability": pred} for pred_idx, pred in preds]
+            with PREDICTION_SECONDS.time(endpoint="predict"):
+                with PREDICTION_STAGE_SECONDS.time(stage="preprocess"):
+                    desc = self.preprocessor(desc)
+                preds = prediction_cache.get_prediction_list(model_name, desc, max_categories)
+            PREDICTED_TEXTS.inc(endpoint="predict")
             return jsonify({"predictions": preds})
         except Exception as err:
             logger.error(str(err))
             return BadRequest(str(err))
 
 
+class ClassifierModelPredictBatch(Resource):
+    def __init__(self):
+        self.preprocessor = DataPreprocessor()
+
+    def post(self, model_name):
+        """Get predictions and probabilitys for many texts with one request
+        Input:
+            {
+                "data": ["This is a test", "This is another test"],
+                "parameters": {
+                    "max_categories": 3
+                }
+            }
+        Returns:
+            {"predictions":
+                [
+                    [{
+                        "category": 2,
+                        "probability": 0.57
+                    }, {
+                        "category": 0,
+                        "probability": 0.36
+                    }, {
+                        "category": 3,
+                        "probability": 0.12
+                    }],
+                    []
+                ]
+            }
+            The predictions are in the same order as the input texts. Texts which are too short
+            or can't be classified with enough probability get an empty list.
+        """
+        try:
+            request_json = request.get_json()
+            max_categories = request_json["parameters"]["max_categories"]
+            with PREDICTION_SECONDS.time(endpoint="predict_batch"):
+                with PREDICTION_STAGE_SECONDS.time(stage="preprocess"):
+                    descs = self.preprocessor.transform_many(request_json["data"])
+                preds = prediction_cache.get_batch_prediction_lists(
+                    model_name, descs, max_categories
+                )
+            PREDICTED_TEXTS.inc(len(descs), endpoint="predict_batch")
+            return jsonify({"predictions": preds})
+        except Exception as err:
+            logger.error(str(err))
+            return BadRequest(str(err))
+
+
+class CurrentClassifierModel(Resource):
+    def get(self):
+        """Get the current model
+        Returns:
+            {
+                "model": "model-8d5e4706",
+                "previous": "model-1a2b3c4d",
+                "time_promoted": 1550758424.1,
+                "loaded": "model-8d5e4706", # the current model loaded by this server process
+                "loaded_previous": "model-1a2b3c4d",
+                "warming": null, # the model which is loaded and warmed up in the background
+                "error": ""
+            }
+        """
+
+        try:
+            return jsonify(current_model.stats())
+        except Exception as err:
+            logger.error(str(err))
+            return BadRequest(str(err))
+
+    def post(self):
+        """Promote a model to the current model. It is loaded and warmed up in the background
+        and swapped in when it is ready
+        Input:
+            {
+                "model_url": "model-8d5e4706"
+            }
+        """
+
+        try:
+            model_url = request.get_json()["model_url"]
+            current_model.promote(model_url)
+            return jsonify({"success": True, "warming": model_url})
+        except Exception as err:
+            logger.error(str(err))
+            return BadRequest(str(err))
+
+
+class CurrentClassifierModelRollback(Resource):
+    def post(self):
+        """Make the previous model the current model again
+        Returns:
+            {"success": true, "model": "model-1a2b3c4d"}
+        """
+
+        try:
+            return jsonify({"success": True, "model": current_model.rollback()})
+        except Exception as err:
+            logger.error(str(err))
+            return BadRequest(str(err))
+
+
+class ModelRegistryStats(Resource):
+    def get(self):
+        """Get statistics of the in-memory model cache used for predictions
+
+        Returns:
+            {
+                "hits": 120,
+                "misses": 2,
+                "hit_rate": 0.98,
+                "reloads": 0,
+                "evictions": 0,
+                "load_time_total": 0.61,
+                "load_time_last": 0.29,
+                "cached_models": ["model-8d5e4706.sav", "model-1a2b3c4d"],
+                "shared_models": ["model-8d5e4706.sav", "model-1a2b3c4d"],
+                "stem_caches": {
+                    "model-8d5e4706.sav": {"tokens": 5321, "cache_size": 702, "hit_rate": 0.87}
+                },
+                "cached_bytes": 23450012,
+                "max_models": 4,
+                "max_bytes": 0
+            }
+        """
+
+        return jsonify(model_registry.stats())
+
+
+class PredictionCacheStats(Resource):
+    def get(self):
+        """Get statistics of the prediction cache of this server process
+
+        Returns:
+            {
+                "enabled": true,
+                "hits": 950,
+                "misses": 50,
+                "hit_rate": 0.95, # counted per text, a batch of 10 texts counts 10 times
+                "invalidations": 1,
+                "backend": "memory",
+                "size": 50,
+                "max_size": 10000,
+                "evictions": 0,
+                "expirations": 0
+            }
+        """
+
+        return jsonify(prediction_cache.stats())
+
+    def delete(self):
+        """Drop all cached predictions
+        """
+
+        try:
+            prediction_cache.clear()
+            return jsonify({"success": True})
+        except Exception as err:
+            logger.error(str(err))
+            return BadRequest(str(err))
+
+
 class ClassifierModelOptions(Resource):
     def get(self, model_name: str):
         """Get list of params, which can be passed to different classifiers
@@ -185,37 +517,8 @@ class ClassifierModelOptions(Resource):
             }
         """
 
-        if model_name == "sgd":
-            return jsonify(
-                {
-                    "loss": ["log", "modified_huber", "perceptron"],
-                    "penalty": ["l2", "l1", "elastic_net"],
-                    "alpha": 0.0001,
-                    "max_iter": 100,
-                }
-            )
-        elif model_name == "svm":
-            return jsonify(
-                {
-                    "C": 1.0,
-                    "kernel": ["linear", "poly", "rbf", "sigmoid", "precomputed"],
-                    "degree": 3,
-                    "probability": False,
-                    "tol": 0.001,
-                    "max_iter": -1,
-                }
-            )
-        elif model_name == "nn":
-            return jsonify(
-                {
-                    "hidden_layer_sizes": "50 50",
-                    "activation": ["identity", "logistic", "tanh", "relu"],
-                    "solver": ["adam", "lbfgs", "sgd"],
-                    "alpha": 0.0001,
-                    "learning_rate": ["constant", "invscaling", "adaptive"],
-                    "max_iter": 200,
-                }
-            )
+        if model_name in CLASSIFIER_OPTIONS:
+            return jsonify(CLASSIFIER_OPTIONS[model_name])
         else:
             logger.info("/api/get_model_options got unexpected Input")
             return BadRequest("please choose one of the classifiers: [svm, sgd, nn]")
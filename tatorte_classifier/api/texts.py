@@ -1,3 +1,4 @@
+import json
 import logging
 
 from flask import jsonify, request
@@ -6,17 +7,42 @@ from bson.json_util import dumps
 
 from werkzeug.exceptions import BadRequest
 
+from configuration import BULK_INSERT_BATCH_SIZE
 from tatorte_classifier.database import (
+    encode_text_cursor,
     get_all_texts,
+    get_texts_page,
     get_text,
     modify_text,
     create_text,
-    get_random_text,
+    create_texts,
     delete_text,
 )
+from tatorte_classifier.text_sampler import text_sampler
 
 logger = logging.getLogger(__name__)
 
+MAX_PAGE_SIZE = 1000
+
+# one json object per line, not application/json-seq, which prefixes every object with \x1e
+NDJSON_MIMETYPES = ("application/x-ndjson", "application/jsonl")
+
+
+def validate_text(document):
+    """Returns an error message if the document is not a valid new text, else None
+    """
+
+    if not isinstance(document, dict):
+        return "Expected an object with data and categories"
+    if not isinstance(document.get("data"), str):
+        return "data must be a string"
+    categories = document.get("categories")
+    if not isinstance(categories, list) or not all(
+        isinstance(category, int) and not isinstance(category, bool) for category in categories
+    ):
+        return "categories must be a list of integers"
+    return None
+
 
 class Text(Resource):
     def get(self, text_id):
@@ -36,7 +62,7 @@ class Text(Resource):
         """
         try:
             if text_id == "random":
-                return dumps(get_random_text())
+                return dumps([text_sampler.get()])
             return dumps(get_text(text_id))
         except Exception as err:
             logger.error(str(err))
@@ -78,6 +104,12 @@ class TextList(Resource):
         Query String Params:
             start {int} - starting index
             end {int} - ending index 
+            after {str} - cursor of the last text of the previous page (from X-Next-Cursor)
+            before {str} - cursor of the first text of the next page (from X-Previous-Cursor)
+            limit {int} - number of texts of the page, max. 1000 (default: 100)
+        Headers:
+            X-Next-Cursor - cursor for the next page, missing on the last page
+            X-Previous-Cursor - cursor for the previous page
         Returns:
             [
                 {
@@ -92,6 +124,8 @@ class TextList(Resource):
             ]
         """
         try:
+            if {"after", "before", "limit"} & set(request.args):
+                return self._get_page()
             return dumps(
                 get_all_texts()[
                     request.args.get("start", type=int) : request.args.get("end", type=int)
@@ -101,6 +135,21 @@ class TextList(Resource):
             logger.error(str(err))
             return BadRequest(str(err))
 
+    def _get_page(self):
+        """Keyset pagination: the page starts at the cursor instead of skipping all previous texts
+        """
+
+        limit = min(request.args.get("limit", 100, type=int), MAX_PAGE_SIZE)
+        after = request.args.get("after")
+        before = request.args.get("before")
+        texts = get_texts_page(after=after, before=before, limit=limit)
+        headers = {}
+        if texts and (before or len(texts) == limit):
+            headers["X-Next-Cursor"] = encode_text_cursor(texts[-1])
+        if texts and (after or (before and len(texts) == limit)):
+            headers["X-Previous-Cursor"] = encode_text_cursor(texts[0])
+        return dumps(texts), 200, headers
+
     def post(self):
         """
         Input:
@@ -119,3 +168,78 @@ class TextList(Resource):
         except Exception as err:
             logger.error(str(err))
             return BadRequest(str(err))
+
+
+class TextBulk(Resource):
+    def post(self):
+        """Create many texts with one request. The body is either a json array or NDJSON (one
+        json object per line, Content-Type: application/x-ndjson), which is streamed and written
+        to the database in batches of BULK_INSERT_BATCH_SIZE texts
+
+        Input:
+            [
+                {
+                    "data": "This is a test",
+                    "categories": [3, 2]
+                }, ...
+            ]
+
+        Returns:
+            {
+                "inserted": 2,
+                "errors": [{"index": 1, "error": "..."}, ...]
+            }
+        """
+        try:
+            inserted = 0
+            errors = []
+            batch = []
+            batch_indices = []
+            for index, document, error in self._read_documents():
+                if error is None:
+                    error = validate_text(document)
+                if error is not None:
+                    errors.append({"index": index, "error": error})
+                    continue
+                batch.append(document)
+                batch_indices.append(index)
+                if len(batch) == BULK_INSERT_BATCH_SIZE:
+                    inserted += self._insert(batch, batch_indices, errors)
+                    batch = []
+                    batch_indices = []
+            inserted += self._insert(batch, batch_indices, errors)
+            return jsonify({"inserted": inserted, "errors": errors})
+        except Exception as err:
+            logger.error(str(err))
+            return BadRequest(str(err))
+
+    def _read_documents(self):
+        """Yields (index, document, error) for every text of the request body
+        """
+
+        if request.mimetype in NDJSON_MIMETYPES:
+            index = 0
+            for line in request.stream:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield index, json.loads(line), None
+                except ValueError as err:
+                    yield index, None, "Invalid json: {}".format(err)
+                index += 1
+        else:
+            documents = request.get_json(force=True)
+            if not isinstance(documents, list):
+                raise ValueError("Expected a json array or NDJSON")
+            for index, document in enumerate(documents):
+                yield index, document, None
+
+    @staticmethod
+    def _insert(batch, batch_indices, errors):
+        inserted, write_errors = create_texts(batch)
+        for error in write_errors:
+            errors.append({"index": batch_indices[error["index"]], "error": error["error"]})
+        if write_errors:
+            logger.error("Bulk insert: %d texts failed", len(write_errors))
+        return inserted
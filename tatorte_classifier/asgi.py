@@ -0,0 +1,407 @@
+"""
+Usage:
+    uvicorn tatorte_classifier.asgi:app --host 0.0.0.0 --port 5000
+    # or SERVER_MODE=asgi python run.py
+
+Optional asyncio serving mode. The /api/ routes of the flask app are served by async endpoints,
+which access the texts and models with the async Mongo driver motor, so slow database calls
+don't block a worker. Preprocessing and predict_proba are CPU bound and run in a thread pool
+with PREDICTION_WORKERS threads. The training jobs and the random text sampler use their own
+threads with the blocking client and are called from the default thread pool.
+
+Everything else, the frontend and every route which has no async endpoint, is served by the
+flask app, which is mounted behind the async routes.
+"""
+import os
+import json
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from bson.json_util import dumps
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.endpoints import HTTPEndpoint
+from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.responses import FileResponse, JSONResponse, Response
+from starlette.routing import Mount, Route
+
+from configuration import BULK_INSERT_BATCH_SIZE, MODEL_DIR, PREDICTION_WORKERS
+from tatorte_classifier import async_database, create_app
+from tatorte_classifier.api.categories import CATEGORIES
+from tatorte_classifier.api.models import CLASSIFIER_OPTIONS, create_search, create_training
+from tatorte_classifier.api.texts import MAX_PAGE_SIZE, NDJSON_MIMETYPES, validate_text
+from tatorte_classifier.database import encode_text_cursor
+from tatorte_classifier.machine_learning.current_model import current_model
+from tatorte_classifier.machine_learning.model_format import is_model_dir, zip_model_dir
+from tatorte_classifier.machine_learning.model_registry import model_registry
+from tatorte_classifier.machine_learning.prediction_cache import prediction_cache
+from tatorte_classifier.machine_learning.preprocess_data import DataPreprocessor
+from tatorte_classifier.metrics import PREDICTED_TEXTS, PREDICTION_SECONDS, PREDICTION_STAGE_SECONDS
+from tatorte_classifier.text_sampler import text_sampler
+from tatorte_classifier.training_jobs import training_jobs
+
+logger = logging.getLogger(__name__)
+
+prediction_executor = ThreadPoolExecutor(PREDICTION_WORKERS)
+preprocessor = DataPreprocessor()
+
+
+def bson_response(obj, headers=None):
+    # the flask_restful resources return the bson json as json string, so do we
+    return JSONResponse(dumps(obj), headers=headers)
+
+
+def bad_request(err):
+    logger.error(str(err))
+    return JSONResponse({"message": str(err)}, status_code=400)
+
+
+def _predict(model_name, data, max_categories):
+    with PREDICTION_SECONDS.time(endpoint="predict"):
+        with PREDICTION_STAGE_SECONDS.time(stage="preprocess"):
+            desc = preprocessor(data)
+        preds = prediction_cache.get_prediction_list(model_name, desc, max_categories)
+    PREDICTED_TEXTS.inc(endpoint="predict")
+    return preds
+
+
+def _predict_batch(model_name, data, max_categories):
+    with PREDICTION_SECONDS.time(endpoint="predict_batch"):
+        with PREDICTION_STAGE_SECONDS.time(stage="preprocess"):
+            descs = preprocessor.transform_many(data)
+        preds = prediction_cache.get_batch_prediction_lists(model_name, descs, max_categories)
+    PREDICTED_TEXTS.inc(len(descs), endpoint="predict_batch")
+    return preds
+
+
+async def run_in_prediction_executor(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(prediction_executor, func, *args)
+
+
+class Text(HTTPEndpoint):
+    async def get(self, request):
+        try:
+            text_id = request.path_params["text_id"]
+            if text_id == "random":
+                return bson_response([await run_in_threadpool(text_sampler.get)])
+            return bson_response(await async_database.get_text(text_id))
+        except Exception as err:
+            return bad_request(err)
+
+    async def delete(self, request):
+        try:
+            await async_database.delete_text(request.path_params["text_id"])
+            return JSONResponse({"success": True})
+        except Exception as err:
+            return bad_request(err)
+
+    async def patch(self, request):
+        try:
+            request_json = await request.json()
+            await async_database.modify_text(
+                request.path_params["text_id"], request_json["categories"]
+            )
+            return JSONResponse({"success": True})
+        except Exception as err:
+            return bad_request(err)
+
+
+class TextList(HTTPEndpoint):
+    async def get(self, request):
+        try:
+            args = request.query_params
+            if {"after", "before", "limit"} & set(args.keys()):
+                return await self._get_page(args)
+            start = int(args["start"]) if "start" in args else None
+            end = int(args["end"]) if "end" in args else None
+            return bson_response(await async_database.get_texts(start, end))
+        except Exception as err:
+            return bad_request(err)
+
+    async def _get_page(self, args):
+        limit = min(int(args.get("limit", 100)), MAX_PAGE_SIZE)
+        after = args.get("after")
+        before = args.get("before")
+        texts = await async_database.get_texts_page(after=after, before=before, limit=limit)
+        headers = {}
+        if texts and (before or len(texts) == limit):
+            headers["X-Next-Cursor"] = encode_text_cursor(texts[-1])
+        if texts and (after or (before and len(texts) == limit)):
+            headers["X-Previous-Cursor"] = encode_text_cursor(texts[0])
+        return bson_response(texts, headers)
+
+    async def post(self, request):
+        try:
+            request_json = await request.json()
+            await async_database.create_text(request_json["data"], request_json["categories"])
+            return JSONResponse({"success": True})
+        except Exception as err:
+            return bad_request(err)
+
+
+class TextBulk(HTTPEndpoint):
+    async def post(self, request):
+        try:
+            inserted = 0
+            errors = []
+            batch = []
+            batch_indices = []
+            async for index, document, error in self._read_documents(request):
+                if error is None:
+                    error = validate_text(document)
+                if error is not None:
+                    errors.append({"index": index, "error": error})
+                    continue
+                batch.append(document)
+                batch_indices.append(index)
+                if len(batch) == BULK_INSERT_BATCH_SIZE:
+                    inserted += await self._insert(batch, batch_indices, errors)
+                    batch = []
+                    batch_indices = []
+            inserted += await self._insert(batch, batch_indices, errors)
+            return JSONResponse({"inserted": inserted, "errors": errors})
+        except Exception as err:
+            return bad_request(err)
+
+    async def _read_documents(self, request):
+        """Yields (index, document, error) for every text of the request body
+        """
+
+        mimetype = request.headers.get("content-type", "").split(";")[0].strip()
+        if mimetype in NDJSON_MIMETYPES:
+            index = 0
+            async for line in self._read_lines(request):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield index, json.loads(line.decode("utf-8")), None
+                except ValueError as err:
+                    yield index, None, "Invalid json: {}".format(err)
+                index += 1
+        else:
+            documents = json.loads(await request.body())
+            if not isinstance(documents, list):
+                raise ValueError("Expected a json array or NDJSON")
+            for index, document in enumerate(documents):
+                yield index, document, None
+
+    @staticmethod
+    async def _read_lines(request):
+        rest = b""
+        async for chunk in request.stream():
+            lines = (rest + chunk).split(b"\n")
+            rest = lines.pop()
+            for line in lines:
+                yield line
+        if rest:
+            yield rest
+
+    @staticmethod
+    async def _insert(batch, batch_indices, errors):
+        inserted, write_errors = await async_database.create_texts(batch)
+        for error in write_errors:
+            errors.append({"index": batch_indices[error["index"]], "error": error["error"]})
+        if write_errors:
+            logger.error("Bulk insert: %d texts failed", len(write_errors))
+        return inserted
+
+
+class Categories(HTTPEndpoint):
+    async def get(self, request):
+        return JSONResponse(CATEGORIES)
+
+
+class ClassifierModel(HTTPEndpoint):
+    async def get(self, request):
+        model_filename = request.path_params["model_filename"]
+        path = "{}/{}".format(MODEL_DIR, model_filename)
+        if is_model_dir(path):
+            buffer = await run_in_threadpool(zip_model_dir, path)
+            return Response(
+                buffer.getvalue(),
+                media_type="application/zip",
+                headers={
+                    "Content-Disposition": 'attachment; filename="{}.zip"'.format(model_filename)
+                },
+            )
+        if not os.path.isfile(path):
+            return JSONResponse(
+                {"message": "The model {} doesn't exist".format(model_filename)}, status_code=404
+            )
+        return FileResponse(path, filename=model_filename)
+
+
+class ClassifierModelList(HTTPEndpoint):
+    async def get(self, request):
+        return bson_response(await async_database.get_all_models())
+
+    async def post(self, request):
+        try:
+            job_id = await run_in_threadpool(create_training, await request.json())
+            return JSONResponse({"job_id": job_id, "state": "queued"})
+        except Exception as err:
+            return bad_request(err)
+
+
+class ClassifierModelSearch(HTTPEndpoint):
+    async def post(self, request):
+        try:
+            return JSONResponse(await run_in_threadpool(create_search, await request.json()))
+        except Exception as err:
+            return bad_request(err)
+
+
+class ClassifierModelSearchTrials(HTTPEndpoint):
+    async def get(self, request):
+        try:
+            return bson_response(
+                await async_database.get_search_trials(request.path_params["job_id"])
+            )
+        except Exception as err:
+            return bad_request(err)
+
+
+class ClassifierModelUpdate(HTTPEndpoint):
+    async def post(self, request):
+        try:
+            body = await request.body()
+            request_json = json.loads(body) if body else {}
+            job_id = await run_in_threadpool(
+                training_jobs.submit_update,
+                request.path_params["model_filename"],
+                bool(request_json.get("promote", False)),
+            )
+            return JSONResponse({"job_id": job_id, "state": "queued"})
+        except Exception as err:
+            return bad_request(err)
+
+
+class ClassifierModelPredict(HTTPEndpoint):
+    async def post(self, request):
+        try:
+            request_json = await request.json()
+            preds = await run_in_prediction_executor(
+                _predict,
+                request.path_params["model_name"],
+                request_json["data"],
+                request_json["parameters"]["max_categories"],
+            )
+            return JSONResponse({"predictions": preds})
+        except Exception as err:
+            return bad_request(err)
+
+
+class ClassifierModelPredictBatch(HTTPEndpoint):
+    async def post(self, request):
+        try:
+            request_json = await request.json()
+            preds = await run_in_prediction_executor(
+                _predict_batch,
+                request.path_params["model_name"],
+                request_json["data"],
+                request_json["parameters"]["max_categories"],
+            )
+            return JSONResponse({"predictions": preds})
+        except Exception as err:
+            return bad_request(err)
+
+
+class ClassifierModelOptions(HTTPEndpoint):
+    async def get(self, request):
+        model_name = request.path_params["model_name"]
+        if model_name in CLASSIFIER_OPTIONS:
+            return JSONResponse(CLASSIFIER_OPTIONS[model_name])
+        return bad_request("please choose one of the classifiers: [svm, sgd, nn]")
+
+
+class CurrentClassifierModel(HTTPEndpoint):
+    async def get(self, request):
+        try:
+            return JSONResponse(await run_in_threadpool(current_model.stats))
+        except Exception as err:
+            return bad_request(err)
+
+    async def post(self, request):
+        try:
+            model_url = (await request.json())["model_url"]
+            await run_in_threadpool(current_model.promote, model_url)
+            return JSONResponse({"success": True, "warming": model_url})
+        except Exception as err:
+            return bad_request(err)
+
+
+class CurrentClassifierModelRollback(HTTPEndpoint):
+    async def post(self, request):
+        try:
+            return JSONResponse(
+                {"success": True, "model": await run_in_threadpool(current_model.rollback)}
+            )
+        except Exception as err:
+            return bad_request(err)
+
+
+class ModelRegistryStats(HTTPEndpoint):
+    async def get(self, request):
+        return JSONResponse(model_registry.stats())
+
+
+class PredictionCacheStats(HTTPEndpoint):
+    async def get(self, request):
+        return JSONResponse(prediction_cache.stats())
+
+    async def delete(self, request):
+        try:
+            await run_in_threadpool(prediction_cache.clear)
+            return JSONResponse({"success": True})
+        except Exception as err:
+            return bad_request(err)
+
+
+class TrainingJob(HTTPEndpoint):
+    async def get(self, request):
+        try:
+            return bson_response(await async_database.get_job(request.path_params["job_id"]))
+        except Exception as err:
+            return bad_request(err)
+
+    async def delete(self, request):
+        try:
+            cancelled = await run_in_threadpool(training_jobs.cancel, request.path_params["job_id"])
+            return JSONResponse({"success": cancelled})
+        except Exception as err:
+            return bad_request(err)
+
+
+class TrainingJobList(HTTPEndpoint):
+    async def get(self, request):
+        return bson_response(await async_database.get_active_jobs())
+
+
+def create_asgi_app():
+    routes = [
+        Route("/api/texts/bulk/", TextBulk),
+        Route("/api/texts/{text_id}/", Text),
+        Route("/api/texts/", TextList),
+        Route("/api/categories/", Categories),
+        Route("/api/models/search/", ClassifierModelSearch),
+        Route("/api/models/search/{job_id}/", ClassifierModelSearchTrials),
+        Route("/api/models/current/", CurrentClassifierModel),
+        Route("/api/models/current/rollback/", CurrentClassifierModelRollback),
+        Route("/api/models/{model_filename}/", ClassifierModel),
+        Route("/api/models/", ClassifierModelList),
+        Route("/api/models/{model_filename}/update/", ClassifierModelUpdate),
+        Route("/api/models/{model_name}/predict/", ClassifierModelPredict),
+        Route("/api/models/{model_name}/predict_batch/", ClassifierModelPredictBatch),
+        Route("/api/model_options/{model_name}/", ClassifierModelOptions),
+        Route("/api/model_registry/", ModelRegistryStats),
+        Route("/api/prediction_cache/", PredictionCacheStats),
+        Route("/api/jobs/{job_id}/", TrainingJob),
+        Route("/api/jobs/", TrainingJobList),
+        Mount("/", app=WSGIMiddleware(create_app())),
+    ]
+    return Starlette(routes=routes)
+
+
+app = create_asgi_app()
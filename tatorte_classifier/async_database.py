@@ -0,0 +1,108 @@
+"""
+The queries of database.py for the asgi app with the async Mongo driver motor. The filters, the
+documents, the order of the texts, the cursors and the indexes are the ones of database.py.
+"""
+import time
+
+import pymongo
+from bson.objectid import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import BulkWriteError
+
+from configuration import MONGODB_URI
+from tatorte_classifier.database import (
+    ACTIVE_JOBS_QUERY,
+    MODELS_QUERY,
+    TEXT_ORDER,
+    bulk_write_errors,
+    categories_update,
+    new_text,
+    text_page_query,
+)
+from tatorte_classifier.metrics import mongo_event_listeners
+
+client = AsyncIOMotorClient(MONGODB_URI, event_listeners=mongo_event_listeners())
+db = client.get_database()
+texts = db["texts"]
+models = db["models"]
+text_features = db["text_features"]
+
+
+async def get_all_models():
+    return await models.find(MODELS_QUERY).sort("time_created", pymongo.DESCENDING).to_list(None)
+
+
+async def get_job(job_id):
+    return await models.find_one({"_id": ObjectId(job_id)})
+
+
+async def get_active_jobs():
+    return (
+        await models.find(ACTIVE_JOBS_QUERY)
+        .sort("time_created", pymongo.ASCENDING)
+        .to_list(None)
+    )
+
+
+async def get_search_trials(search_id):
+    return (
+        await models.find({"search_id": search_id})
+        .sort("performance_data.val_acc", pymongo.DESCENDING)
+        .to_list(None)
+    )
+
+
+async def get_texts(start=None, end=None):
+    """The texts in TEXT_ORDER from start to end, like the slice get_all_texts()[start:end]
+    """
+
+    cursor = texts.find().sort(TEXT_ORDER)
+    if start:
+        cursor = cursor.skip(start)
+    if end is not None:
+        limit = end - (start or 0)
+        if limit <= 0:
+            return []
+        cursor = cursor.limit(limit)
+    return await cursor.to_list(None)
+
+
+async def get_texts_page(after=None, before=None, limit=100):
+    """See database.get_texts_page
+    """
+
+    query, order = text_page_query(after, before)
+    page = await texts.find(query).sort(order).limit(limit).to_list(None)
+    return page[::-1] if before and not after else page
+
+
+async def get_text(text_id):
+    return await texts.find_one({"_id": ObjectId(text_id)})
+
+
+async def create_text(data, categories):
+    await texts.insert_one(new_text(data, categories))
+
+
+async def create_texts(documents):
+    """See database.create_texts
+    """
+
+    now = time.time()
+    new_texts = [new_text(document["data"], document["categories"], now) for document in documents]
+    if not new_texts:
+        return 0, []
+    try:
+        result = await texts.insert_many(new_texts, ordered=False)
+        return len(result.inserted_ids), []
+    except BulkWriteError as err:
+        return err.details["nInserted"], bulk_write_errors(err)
+
+
+async def modify_text(text_id, categories):
+    await texts.update_one({"_id": ObjectId(text_id)}, categories_update(categories), upsert=False)
+
+
+async def delete_text(text_id):
+    await texts.delete_one({"_id": ObjectId(text_id)})
+    await text_features.delete_one({"_id": ObjectId(text_id)})
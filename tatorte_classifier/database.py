@@ -1,68 +1,498 @@
 import time
 
+import numpy as np
 import pymongo
 from bson.objectid import ObjectId
+from pymongo import ReplaceOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 
 from configuration import MONGODB_URI
+from tatorte_classifier.metrics import mongo_event_listeners
 
-client = pymongo.MongoClient(MONGODB_URI)
+client = pymongo.MongoClient(MONGODB_URI, event_listeners=mongo_event_listeners())
 db = client.get_database()
 texts = db["texts"]
 models = db["models"]
+text_features = db["text_features"]
+schedules = db["schedules"]
+
+# the training jobs, which are queued or running, and the records of the models collection,
+# which are models: finished and failed trainings, but not unfinished or cancelled jobs
+ACTIVE_JOBS_QUERY = {"state": {"$in": ["queued", "running"]}}
+MODELS_QUERY = {"state": {"$nin": ["queued", "running", "cancelled"]}}
+
+# newest texts first, the id breaks ties, so the order is stable for keyset pagination
+TEXT_ORDER = [("time_modified", pymongo.DESCENDING), ("_id", pymongo.DESCENDING)]
+
+
+def reconnect():
+    """Replace the client by a new one, which connects when it is used. A forked process must
+    not use the client of its parent: it shares its sockets, and locks held by other threads of
+    the parent at the time of the fork are never released. The old client isn't closed, that
+    would close the sockets of the parent
+    """
+
+    global client, db, texts, models, text_features, schedules
+    client = pymongo.MongoClient(
+        MONGODB_URI, event_listeners=mongo_event_listeners(), connect=False
+    )
+    db = client.get_database()
+    texts = db["texts"]
+    models = db["models"]
+    text_features = db["text_features"]
+    schedules = db["schedules"]
+
+
+def ensure_indexes():
+    """Create the indexes of the collections, if they don't exist yet
+    """
+
+    texts.create_index(TEXT_ORDER)
+    models.create_index([("time_created", pymongo.DESCENDING)])
+    models.create_index("search_id", sparse=True)
+    text_features.create_index("version")
 
 
 def get_all_models():
-    return models.find().sort("time_created", pymongo.DESCENDING)
+    return models.find(MODELS_QUERY).sort("time_created", pymongo.DESCENDING)
 
 
 def get_model(text_id):
     return texts.find_one({"_id": ObjectId(text_id)})
 
 
-def create_model(model_url, performance_data, metadata, error_message):
-    models.insert_one(
+def create_model(model_url, performance_data, metadata, error_message, search_id=None):
+    model = {
+        "model_url": model_url,
+        "performance_data": performance_data,
+        "metadata": metadata,
+        "error_message": error_message,
+        "time_created": time.time(),
+    }
+    if search_id is not None:
+        # a trial of the hyperparameter search with this job id
+        model["search_id"] = search_id
+    models.insert_one(model)
+
+
+def get_model_by_url(model_url):
+    return models.find_one({"model_url": model_url})
+
+
+def get_search_trials(search_id):
+    """Get the trials of a hyperparameter search, the best first (by validation accuracy)
+    """
+
+    return models.find({"search_id": search_id}).sort(
+        "performance_data.val_acc", pymongo.DESCENDING
+    )
+
+
+def create_job(metadata, owner=""):
+    """Insert a training job, which becomes a model record when the job is done
+
+    Arguments:
+        metadata {dict} -- The metadata of the model
+
+    Keyword Arguments:
+        owner {str} -- The id of the job queue of the server process, which runs the job
+                       (default: {""})
+
+    Returns:
+        ObjectId -- The id of the job
+    """
+
+    now = time.time()
+    return models.insert_one(
         {
-            "model_url": model_url,
-            "performance_data": performance_data,
+            "model_url": "",
+            "performance_data": {},
             "metadata": metadata,
-            "error_message": error_message,
-            "time_created": time.time(),
+            "error_message": "",
+            "state": "queued",
+            "stage": "",
+            "progress": 0.0,
+            "cancel_requested": False,
+            "time_created": now,
+            "owner": owner,
+            "heartbeat": now,
         }
+    ).inserted_id
+
+
+def get_job(job_id):
+    return models.find_one({"_id": ObjectId(job_id)})
+
+
+def get_active_jobs():
+    return models.find(ACTIVE_JOBS_QUERY).sort("time_created", pymongo.ASCENDING)
+
+
+def touch_jobs(owner):
+    """Renew the heartbeat of the queued and running jobs of a job queue
+    """
+
+    models.update_many(dict(ACTIVE_JOBS_QUERY, owner=owner), {"$set": {"heartbeat": time.time()}})
+
+
+def fail_stale_jobs(before):
+    """Mark the queued and running jobs failed, whose server process stopped renewing their
+    heartbeat, e.g. because it was restarted and lost its in-memory queue
+
+    Arguments:
+        before {float} -- Jobs with an older heartbeat (or none) are failed
+
+    Returns:
+        int -- The number of failed jobs
+    """
+
+    now = time.time()
+    return models.update_many(
+        dict(
+            ACTIVE_JOBS_QUERY,
+            **{"$or": [{"heartbeat": {"$lt": before}}, {"heartbeat": {"$exists": False}}]}
+        ),
+        {
+            "$set": {
+                "state": "failed",
+                "error_message": "The server process of the job stopped",
+                "time_finished": now,
+            }
+        },
+    ).modified_count
+
+
+def update_job(job_id, fields, state=None):
+    """Update the fields of a job
+
+    Arguments:
+        job_id {str} -- The id of the job
+        fields {dict} -- The fields to set
+
+    Keyword Arguments:
+        state {str} -- If given, the job is only updated if it is in this state (default: {None})
+
+    Returns:
+        bool -- Whether the job was updated
+    """
+
+    query = {"_id": ObjectId(job_id)}
+    if state is not None:
+        query["state"] = state
+    return models.update_one(query, {"$set": fields}).matched_count == 1
+
+
+def get_last_update_job(model_url):
+    """Get the newest unfinished or failed update job of an incremental model. A finished update
+    job becomes the record of the updated model
+    """
+
+    return models.find_one(
+        {"metadata.update.model_url": model_url}, sort=[("time_created", pymongo.DESCENDING)]
     )
 
 
 def get_all_texts(projection=None):
     if projection:
-        return texts.find({}, projection).sort("time_modified", pymongo.DESCENDING)
-    return texts.find().sort("time_modified", pymongo.DESCENDING)
+        return texts.find({}, projection).sort(TEXT_ORDER)
+    return texts.find().sort(TEXT_ORDER)
+
+
+def encode_text_cursor(text):
+    """The position of a text in TEXT_ORDER as string, e.g. "1550589309.123_5c6c1b2573cd...",
+    "null_5c6c1b2573cd..." for texts without time_modified
+    """
+
+    time_modified = text.get("time_modified")
+    if time_modified is None:
+        return "null_{}".format(text["_id"])
+    return "{!r}_{}".format(float(time_modified), text["_id"])
+
+
+def decode_text_cursor(cursor):
+    time_modified, text_id = cursor.split("_", 1)
+    return None if time_modified == "null" else float(time_modified), ObjectId(text_id)
+
+
+def text_page_query(after=None, before=None):
+    """The query and sort of the page of texts directly after or before a cursor
+
+    Texts without time_modified come last in TEXT_ORDER (a missing field sorts like null,
+    below every number) and don't match a comparison with a number, so they have their own
+    branch of the query.
+
+    Keyword Arguments:
+        after {str} -- Cursor of the last text of the previous page (default: {None})
+        before {str} -- Cursor of the first text of the next page (default: {None})
+
+    Returns:
+        tuple -- (query, sort), a page before the cursor is sorted in reverse TEXT_ORDER
+    """
+
+    cursor = after or before
+    if not cursor:
+        return {}, TEXT_ORDER
+
+    time_modified, text_id = decode_text_cursor(cursor)
+    operator = "$lt" if after else "$gt"
+    same_time = {"time_modified": time_modified, "_id": {operator: text_id}}
+    if after:
+        if time_modified is None:
+            return same_time, TEXT_ORDER
+        branches = [{"time_modified": {"$lt": time_modified}}, same_time]
+        return {"$or": branches + [{"time_modified": None}]}, TEXT_ORDER
+
+    reverse_order = [(key, -direction) for key, direction in TEXT_ORDER]
+    if time_modified is None:
+        branches = [{"time_modified": {"$ne": None}}, same_time]
+    else:
+        branches = [{"time_modified": {"$gt": time_modified}}, same_time]
+    return {"$or": branches}, reverse_order
+
+
+def get_texts_page(after=None, before=None, limit=100, projection=None):
+    """Get a page of the texts in TEXT_ORDER. The page starts directly at the cursor with the
+    index on (time_modified, _id), so every page is fetched as fast as the first one
+
+    Keyword Arguments:
+        after {str} -- Cursor of the last text of the previous page (default: {None})
+        before {str} -- Cursor of the first text of the next page, for paging back
+                        (default: {None})
+        limit {int} -- Maximum number of texts (default: {100})
+        projection {dict} -- The fields returned for every text (default: {None})
+
+    Returns:
+        list -- The texts in TEXT_ORDER
+    """
+
+    query, order = text_page_query(after, before)
+    page = list(texts.find(query, projection).sort(order).limit(limit))
+    # a page before the cursor walks the index backwards, restore the order
+    return page[::-1] if before and not after else page
+
+
+def iter_text_batches(query=None, projection=None, batch_size=1000):
+    """Page through the texts without sorting them
+
+    Keyword Arguments:
+        query {dict} -- Filter for the texts (default: {None})
+        projection {dict} -- The fields returned for every text (default: {None})
+        batch_size {int} -- Number of texts fetched from the database at once (default: {1000})
+
+    Yields:
+        list -- Batches of at most batch_size texts
+    """
+
+    cursor = texts.find(query or {}, projection, batch_size=batch_size)
+    batch = []
+    for text in cursor:
+        batch.append(text)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _changed_texts_query(since=None):
+    query = {"categories.0": {"$exists": True}}
+    if since is not None:
+        query["time_modified"] = {"$gt": since}
+    return query
+
+
+def count_changed_texts(since):
+    """Count the labeled texts added or modified after since (a unix timestamp)
+    """
+
+    return texts.count_documents(_changed_texts_query(since))
+
+
+def get_training_data(batch_size=1000, since=None):
+    """Load all labeled texts for training. The texts are streamed in batches into typed arrays,
+    so only the texts themselves and one pointer per text are kept in memory
+
+    Keyword Arguments:
+        batch_size {int} -- Number of texts fetched from the database at once (default: {1000})
+        since {float} -- Only load the texts added or modified after this unix timestamp, e.g.
+                         for updating an incremental model (default: {None})
+
+    Returns:
+        Tuple[list, np.ndarray, np.ndarray, np.ndarray] -- The ids, modification times, texts
+                                                          (object array) and first categories
+    """
+
+    text_ids = []
+    times_modified = []
+    data = []
+    categories = []
+    for batch in iter_text_batches(
+        _changed_texts_query(since),
+        {"data": 1, "categories": {"$slice": 1}, "time_modified": 1},
+        batch_size,
+    ):
+        for text in batch:
+            text_ids.append(text["_id"])
+            times_modified.append(text.get("time_modified", 0.0))
+            data.append(text["data"])
+            categories.append(text["categories"][0])
+
+    x = np.empty(len(data), dtype=object)
+    x[:] = data
+    return (
+        text_ids,
+        np.asarray(times_modified, dtype=float),
+        x,
+        np.asarray(categories, dtype=int),
+    )
 
 
 def get_text(text_id):
     return texts.find_one({"_id": ObjectId(text_id)})
 
 
+def new_text(data, categories, now=None):
+    """The document of a new text, also used by async_database.py
+    """
+
+    now = time.time() if now is None else now
+    return {"data": data, "categories": categories, "time_created": now, "time_modified": now}
+
+
+def categories_update(categories):
+    """The update of the categories of a text, also used by async_database.py
+    """
+
+    return {"$set": {"categories": categories, "time_modified": time.time()}}
+
+
+def bulk_write_errors(err):
+    """The write errors of an unordered insert_many as dicts with the index of the failed text
+    and the error message
+    """
+
+    return [
+        {"index": error["index"], "error": error["errmsg"]} for error in err.details["writeErrors"]
+    ]
+
+
 def create_text(data, categories):
-    texts.insert_one(
-        {
-            "data": data,
-            "categories": categories,
-            "time_created": time.time(),
-            "time_modified": time.time(),
-        }
-    )
+    texts.insert_one(new_text(data, categories))
+
+
+def create_texts(documents):
+    """Insert many texts with one request. The texts are inserted unordered, so one failing text
+    doesn't stop the insertion of the others
+
+    Arguments:
+        documents {list} -- List of dicts with the keys data and categories
+
+    Returns:
+        Tuple[int, list] -- The number of inserted texts and the write errors as dicts with the
+                            index of the failed text in documents and the error message
+    """
+
+    now = time.time()
+    new_texts = [new_text(document["data"], document["categories"], now) for document in documents]
+    if not new_texts:
+        return 0, []
+    try:
+        return len(texts.insert_many(new_texts, ordered=False).inserted_ids), []
+    except BulkWriteError as err:
+        return err.details["nInserted"], bulk_write_errors(err)
 
 
 def modify_text(text_id, categories):
-    texts.update_one(
-        {"_id": ObjectId(text_id)},
-        {"$set": {"categories": categories, "time_modified": time.time()}},
-        upsert=False,
-    )
+    texts.update_one({"_id": ObjectId(text_id)}, categories_update(categories), upsert=False)
 
 
 def delete_text(text_id):
     texts.delete_one({"_id": ObjectId(text_id)})
+    text_features.delete_one({"_id": ObjectId(text_id)})
 
 
 def get_random_text():
     return texts.aggregate([{"$sample": {"size": 1}}])
+
+
+UNLABELED_QUERY = {"categories.0": {"$exists": False}}
+
+
+def sample_text_ids(size, query=None):
+    """Get the ids of random texts
+
+    Arguments:
+        size {int} -- Number of ids
+
+    Keyword Arguments:
+        query {dict} -- Only sample texts matching the query (default: {None})
+
+    Returns:
+        list -- At most size ids
+    """
+
+    pipeline = [{"$match": query}] if query else []
+    pipeline += [{"$sample": {"size": size}}, {"$project": {"_id": 1}}]
+    return [text["_id"] for text in texts.aggregate(pipeline)]
+
+
+def get_text_features(version, text_ids):
+    """Get the cached features of texts
+
+    Arguments:
+        version {str} -- The version of the preprocessing the features were created with
+        text_ids {list} -- The ids of the texts
+
+    Returns:
+        Cursor -- The features of the texts which are cached for the version
+    """
+
+    return text_features.find({"_id": {"$in": list(text_ids)}, "version": version})
+
+
+def save_text_features(version, features):
+    """Insert or replace the cached features of texts
+
+    Arguments:
+        version {str} -- The version of the preprocessing the features were created with
+        features {list} -- List of dicts with the keys _id, time_modified and tokens
+    """
+
+    requests = [
+        ReplaceOne(
+            {"_id": feature["_id"]},
+            {
+                "version": version,
+                "time_modified": feature["time_modified"],
+                "tokens": feature["tokens"],
+            },
+            upsert=True,
+        )
+        for feature in features
+    ]
+    if requests:
+        text_features.bulk_write(requests, ordered=False)
+
+
+def claim_schedule(name, interval):
+    """Claim the next run of a schedule, so only one of the server processes runs it
+
+    Arguments:
+        name {str} -- The name of the schedule
+        interval {float} -- Seconds until the schedule is due again
+
+    Returns:
+        bool -- Whether this process claimed the run
+    """
+
+    now = time.time()
+    try:
+        # matches only a due schedule, otherwise the upsert collides with the existing one
+        schedules.update_one(
+            {"_id": name, "next_run": {"$lte": now}},
+            {"$set": {"next_run": now + interval}},
+            upsert=True,
+        )
+        return True
+    except DuplicateKeyError:
+        return False
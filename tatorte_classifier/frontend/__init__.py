@@ -1,10 +1,17 @@
 import json
 
-from flask import Blueprint, render_template
+from flask import Blueprint, render_template, request
 
 from configuration import TEMPLATE_FOLDER, STATIC_FOLDER
 
-from tatorte_classifier.database import get_all_texts, get_all_models, get_random_text, get_text
+from tatorte_classifier.database import (
+    encode_text_cursor,
+    get_all_texts,
+    get_all_models,
+    get_text,
+    get_texts_page,
+)
+from tatorte_classifier.text_sampler import text_sampler
 
 bp = Blueprint(
     "frontend",
@@ -27,16 +34,27 @@ def index() -> str:
 def texts_frontend(page_number: int) -> str:
     """Get texts sorted by modification with pagenumber being results (<page_number> - 1) * 100 to <page_number>*100
 
+    The next and previous links of the page carry a cursor (?after=, ?before=), so paging
+    doesn't need to skip all texts of the previous pages. Without a cursor the page is skipped to.
+
     Arguments:
         page_number {int} -- The pagenumber
 
     Returns:
         html
     """
+    after = request.args.get("after")
+    before = request.args.get("before")
+    if after or before or page_number == 1:
+        texts = get_texts_page(after=after, before=before, limit=100)
+    else:
+        texts = list(get_all_texts()[(page_number - 1) * 100 : page_number * 100])
     return render_template(
         "texts.html",
-        texts=list(get_all_texts()[(page_number - 1) * 100 : page_number * 100]),
+        texts=texts,
         current_page=int(page_number),
+        next_cursor=encode_text_cursor(texts[-1]) if len(texts) == 100 else None,
+        previous_cursor=encode_text_cursor(texts[0]) if texts else None,
     )
 
 
@@ -48,9 +66,12 @@ def data_checker() -> str:
         html
     """
 
-    text = list(get_random_text())[0]
+    text = text_sampler.get()
     return render_template(
-        "data-checker.html", text_id=text["_id"], data=text["data"], categories=text["categories"]
+        "data-checker.html",
+        text_id=text["_id"],
+        data=text["data"],
+        categories=text.get("categories", []),
     )
 
 
@@ -0,0 +1,145 @@
+"""
+Usage:
+    from tatorte_classifier.machine_learning.cleaning_rules import CleaningRules
+
+    rules = CleaningRules([{"keyword": "alkohol", "action": "drop"}])
+    y, keep = rules.apply(x, y)
+
+The cleaning rules relabel or drop texts containing a keyword. They are applied in the order of
+the rule table, but all keywords are found with a single pass over every text with an
+Aho-Corasick automaton, so adding rules hardly increases the time needed for cleaning.
+
+Rules:
+    {"keyword": "verkehrskontroll", "action": "relabel", "from": 5, "to": 4}
+        -- texts of category 5 containing the keyword get category 4. Without "from" the texts
+           of every category are relabeled
+    {"keyword": "dienstagmorg", "action": "drop", "category": 3}
+        -- texts of category 3 containing the keyword are dropped. Without "category" the texts
+           of every category are dropped
+
+Keywords are matched case insensitive as substrings of the texts.
+"""
+import json
+import hashlib
+from typing import Iterable, List, Tuple
+
+import ahocorasick
+import numpy as np
+
+from configuration import CLEANING_RULES_PATH
+
+# Key:
+#   1 - Feuer
+#   2 - Mord
+#   3 - Überfall/Körperverletzung
+#   4 - Unfall
+#   5 - Drogen
+DEFAULT_CLEANING_RULES = [
+    {"keyword": "verkehrskontroll", "action": "relabel", "from": 5, "to": 4},
+    {"keyword": "eingebroch", "action": "relabel", "from": 4, "to": 3},
+    {"keyword": "alkohol", "action": "drop"},
+    {"keyword": "dienstagmorg", "action": "drop", "category": 3},
+    {"keyword": "fahrrad", "action": "drop", "category": 3},
+]
+
+ACTIONS = ("relabel", "drop")
+
+
+class CleaningRules:
+    def __init__(self, rules: List[dict]):
+        """Compiles a rule table into an Aho-Corasick automaton
+
+        Arguments:
+            rules {List[dict]} -- The rules, see the module docstring
+
+        Raises:
+            ValueError: If a rule is invalid
+        """
+
+        for rule in rules:
+            if not rule.get("keyword") or rule.get("action") not in ACTIONS:
+                raise ValueError("Invalid cleaning rule {}".format(rule))
+            if rule["action"] == "relabel" and "to" not in rule:
+                raise ValueError("Relabel rule {} has no new category 'to'".format(rule))
+        self.rules = [dict(rule, keyword=rule["keyword"].lower()) for rule in rules]
+        self.keywords = sorted({rule["keyword"] for rule in self.rules})
+        self._keyword_columns = {keyword: i for i, keyword in enumerate(self.keywords)}
+        # the automaton finds all keywords of a text, also overlapping ones, in one pass
+        self._automaton = ahocorasick.Automaton()
+        for keyword, column in self._keyword_columns.items():
+            self._automaton.add_word(keyword, column)
+        self._automaton.make_automaton()
+        self.version = hashlib.sha1(
+            json.dumps(self.rules, sort_keys=True).encode("utf-8")
+        ).hexdigest()[:16]
+
+    def match(self, texts: Iterable[str]) -> np.ndarray:
+        """Find the keywords in the texts
+
+        Arguments:
+            texts {Iterable[str]} -- The texts
+
+        Returns:
+            np.ndarray -- Boolean array with shape (len(texts), len(self.keywords)), True if the
+                          keyword is in the text
+        """
+
+        rows = []
+        columns = []
+        n_texts = 0
+        for row, text in enumerate(texts):
+            n_texts += 1
+            if not self.keywords:
+                continue
+            for _, column in self._automaton.iter(text.lower()):
+                rows.append(row)
+                columns.append(column)
+        matches = np.zeros((n_texts, len(self.keywords)), dtype=bool)
+        matches[rows, columns] = True
+        return matches
+
+    def apply(self, texts: Iterable[str], y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Apply the rules to the texts in the order of the rule table
+
+        Arguments:
+            texts {Iterable[str]} -- The texts
+            y {np.ndarray} -- The categories
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray] -- The new categories and a mask of the texts to keep
+        """
+
+        matches = self.match(texts)
+        y = np.array(y)
+        drop = np.zeros(len(y), dtype=bool)
+        for rule in self.rules:
+            mask = matches[:, self._keyword_columns[rule["keyword"]]]
+            if rule["action"] == "relabel":
+                if rule.get("from") is not None:
+                    mask = mask & (y == rule["from"])
+                y[mask] = rule["to"]
+            else:
+                if rule.get("category") is not None:
+                    mask = mask & (y == rule["category"])
+                drop |= mask
+        return y, ~drop
+
+
+def load_cleaning_rules(path: str = None) -> CleaningRules:
+    """Load the rule table from a json file
+
+    Keyword Arguments:
+        path {str} -- Path to a json file with a list of rules. If not given, the default rules
+                      are used (default: {None})
+
+    Returns:
+        CleaningRules
+    """
+
+    if not path:
+        return CleaningRules(DEFAULT_CLEANING_RULES)
+    with open(path) as f:
+        return CleaningRules(json.load(f))
+
+
+cleaning_rules = load_cleaning_rules(CLEANING_RULES_PATH)
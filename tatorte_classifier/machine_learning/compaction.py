@@ -0,0 +1,175 @@
+"""
+Usage:
+    from tatorte_classifier.machine_learning.compaction import compact_model
+
+    features, report = compact_model(model, features, min_weight=1e-3, min_df=2)
+
+Compaction makes a trained sgd or nn model smaller before it is saved. Features are pruned,
+whose largest absolute weight in the classifier is below min_weight, which occur in fewer than
+min_df training texts, or which are not among the max_features features with the largest
+weights. The weights (and the idf of a model directory) are cast to float32 and the
+stop_words_ of the vectorizer are dropped, it is the set of all terms which were cut from the
+vocabulary and only needed for introspection.
+
+The report records the number of features, the pickled size in bytes and the test accuracy
+before and after the compaction, so a smaller model can be chosen on purpose. The tf-idf
+matrices are pruned and renormalized like the vectorizer would transform the texts with the
+pruned vocabulary, so the accuracy after the compaction is the one of the saved model.
+"""
+import logging
+import warnings
+from typing import Tuple
+
+import dill
+import numpy as np
+from sklearn.metrics import accuracy_score
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import normalize
+
+from tatorte_classifier.machine_learning.feature_store import Features
+from tatorte_classifier.machine_learning.model import Model
+
+logger = logging.getLogger(__name__)
+
+
+def _first_layer(clf) -> np.ndarray:
+    """The weights of the features with shape (n_features, n_outputs)
+    """
+
+    if hasattr(clf, "coef_"):
+        return clf.coef_.T
+    return clf.coefs_[0]
+
+
+def _footprint(model: Model, features: Features) -> dict:
+    classifier = Pipeline(model.pipeline.steps[1:])
+    return {
+        "n_features": len(model.pipeline.named_steps["vect"].vocabulary_),
+        "bytes": len(dill.dumps(model)),
+        "test_acc": accuracy_score(features.y_test, classifier.predict(features.x_test)),
+    }
+
+
+def _prune_matrix(X, keep: np.ndarray, norm: str):
+    X = X.tocsr()[:, np.flatnonzero(keep)]
+    if norm is not None:
+        # scaling a row doesn't change its normalized values, so renormalizing the remaining
+        # columns gives the tf-idf of the pruned vocabulary
+        X = normalize(X, norm=norm, copy=False)
+    return X
+
+
+def _prune_vectorizer(vect, keep: np.ndarray):
+    """A vectorizer with the same params and the pruned vocabulary and idf. It has no
+    stop_words_, the set of all terms which were cut from the vocabulary
+    """
+
+    columns = np.cumsum(keep) - 1
+    vocabulary = {
+        term: int(columns[column]) for term, column in vect.vocabulary_.items() if keep[column]
+    }
+    pruned = type(vect)(**dict(vect.get_params(), vocabulary=vocabulary))
+    # fitting with a fixed vocabulary only builds the transformer, the idf is replaced below.
+    # The warnings about the params were already given when the model was trained
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        pruned.fit([""])
+    # the vocabulary_ is kept, the vocabulary param would be pickled a second time
+    pruned.set_params(vocabulary=None)
+    if vect.use_idf:
+        pruned.idf_ = vect.idf_[keep]
+    return pruned
+
+
+def _prune_classifier(clf, keep: np.ndarray, dtype) -> None:
+    if hasattr(clf, "coef_"):
+        clf.coef_ = np.ascontiguousarray(clf.coef_[:, keep], dtype=dtype)
+        clf.intercept_ = np.asarray(clf.intercept_, dtype=dtype)
+    else:
+        clf.coefs_ = [np.ascontiguousarray(clf.coefs_[0][keep], dtype=dtype)] + [
+            np.asarray(coef, dtype=dtype) for coef in clf.coefs_[1:]
+        ]
+        clf.intercepts_ = [np.asarray(intercept, dtype=dtype) for intercept in clf.intercepts_]
+    clf.n_features_in_ = int(keep.sum())
+
+
+def compact_model(
+    model: Model,
+    features: Features,
+    min_weight: float = 0.0,
+    min_df: int = 1,
+    max_features: int = None,
+    float32: bool = True,
+) -> Tuple[Features, dict]:
+    """Prune the features of a trained model and cast its weights to float32. The model is
+    changed in place
+
+    Arguments:
+        model {Model} -- A sgd or nn model with a fitted TfidfVectorizer
+        features {Features} -- The tf-idf matrices the model was trained and evaluated on
+
+    Keyword Arguments:
+        min_weight {float} -- Minimum of the largest absolute weight of a feature (default: {0.0})
+        min_df {int} -- Minimum number of training texts containing a feature (default: {1})
+        max_features {int} -- Maximum number of features, the ones with the largest weights are
+                              kept (default: {None})
+        float32 {bool} -- Whether the weights are cast to float32 (default: {True})
+
+    Raises:
+        ValueError: If the model can't be compacted or no feature would be left
+
+    Returns:
+        Tuple[Features, dict] -- The pruned matrices and the report with the params and the
+                                 footprint before and after the compaction
+    """
+
+    steps = dict(model.pipeline.steps)
+    vect = steps.get("vect")
+    clf = steps.get("clf")
+    if (
+        set(steps) != {"vect", "clf"}
+        or not hasattr(vect, "vocabulary_")
+        or not (hasattr(clf, "coef_") or hasattr(clf, "coefs_"))
+    ):
+        raise ValueError("Only sgd and nn models with a TfidfVectorizer can be compacted")
+    before = _footprint(model, features)
+
+    weights = np.abs(_first_layer(clf)).max(axis=1)
+    keep = weights >= min_weight
+    if min_df > 1:
+        df = np.bincount(features.x_train.tocsr().indices, minlength=len(weights))
+        keep &= df >= min_df
+    if max_features is not None and keep.sum() > max_features:
+        strongest = np.argsort(-np.where(keep, weights, -1), kind="stable")[:max_features]
+        keep = np.zeros(len(weights), dtype=bool)
+        keep[strongest] = True
+    if not keep.any():
+        raise ValueError("The compaction would prune all features")
+
+    vect = _prune_vectorizer(vect, keep)
+    model.pipeline.steps[0] = ("vect", vect)
+    _prune_classifier(clf, keep, np.float32 if float32 else _first_layer(clf).dtype)
+    features = Features(
+        vect,
+        _prune_matrix(features.x_train, keep, vect.norm),
+        _prune_matrix(features.x_test, keep, vect.norm),
+        features.y_train,
+        features.y_test,
+    )
+    after = _footprint(model, features)
+    logger.info(
+        "Compacted model from %d to %d features, %d to %d bytes, test accuracy %.4f to %.4f",
+        before["n_features"],
+        after["n_features"],
+        before["bytes"],
+        after["bytes"],
+        before["test_acc"],
+        after["test_acc"],
+    )
+    params = {
+        "min_weight": min_weight,
+        "min_df": min_df,
+        "max_features": max_features,
+        "float32": float32,
+    }
+    return features, {"params": params, "before": before, "after": after}
@@ -0,0 +1,293 @@
+"""
+Usage:
+    from tatorte_classifier.machine_learning.current_model import current_model, get_model
+
+    current_model.promote("model-8d5e4706")
+    model = get_model("current")  # or the filename of any other model
+    current_model.rollback()
+
+The "current" model is the model in production. CURRENT_MODEL_PATH is a json file pointing to
+it, e.g. {"model": "model-8d5e4706", "previous": "model-1a2b3c4d", "time_promoted": 1550758424.1}
+and is replaced atomically on every promotion. Every server process watches the modification
+time of the pointer. When it changes, the new model is loaded and warmed up with a few
+predictions in a background thread, while the requests are still answered by the old model.
+Then the models are swapped. The previous model stays loaded, so a rollback is instant.
+"""
+import os
+import json
+import time
+import logging
+from threading import Lock, Thread
+from typing import Callable, Optional, Tuple
+
+from configuration import CURRENT_MODEL_PATH, MODEL_DIR
+from tatorte_classifier.machine_learning.model import Model
+from tatorte_classifier.machine_learning.model_registry import model_registry
+
+logger = logging.getLogger(__name__)
+
+CURRENT_MODEL_ALIAS = "current"
+
+# predicted once by a new model before it is swapped in
+WARMUP_TEXTS = [
+    "In der Nacht brannte der Dachstuhl eines Einfamilienhauses vollständig aus.",
+    "Die Mordkommission hat die Ermittlungen übernommen.",
+    "Zwei Unbekannte schlugen den Geschädigten und raubten seine Geldbörse.",
+    "Bei einem Verkehrsunfall auf der Kreuzung wurden zwei Personen verletzt.",
+    "Bei der Durchsuchung fanden die Beamten Kokain und Cannabis.",
+]
+
+
+class CurrentModel:
+    def __init__(
+        self,
+        load_model: Callable[[str], Model],
+        pointer_path: str,
+        model_dir: str = MODEL_DIR,
+        warmup_texts: list = WARMUP_TEXTS,
+    ):
+        """The model aliased as "current"
+
+        Arguments:
+            load_model {Callable} -- Loads a model given its filename in model_dir
+            pointer_path {str} -- The json file pointing to the current model
+
+        Keyword Arguments:
+            model_dir {str} -- The directory the model files are stored in (default: {MODEL_DIR})
+            warmup_texts {list} -- The texts predicted by a new model before it is swapped in
+                                   (default: {WARMUP_TEXTS})
+        """
+
+        self.load_model = load_model
+        self.pointer_path = pointer_path
+        self.model_dir = model_dir
+        self.warmup_texts = warmup_texts
+        self._lock = Lock()
+        self._pointer = {}
+        self._pointer_mtime = None
+        # (model_id, model) of the model answering the requests and of the one before it
+        self._active = None
+        self._previous = None
+        self._warming = None
+        self._thread = None
+        self._error = ""
+
+    def get(self) -> Model:
+        """Get the current model. The first request of a process loads it, after that a new
+        current model is swapped in as soon as it is warmed up
+
+        Raises:
+            ValueError: If no model was promoted yet
+
+        Returns:
+            Model -- The current model
+        """
+
+        return self.get_active()[1]
+
+    def get_active(self) -> Tuple[str, Model]:
+        """Like get, but also returns the filename of the model answering the requests
+
+        Returns:
+            Tuple[str, Model] -- The filename and the current model
+        """
+
+        self._sync()
+        active = self._active
+        if active is None:
+            model_id = self._pointer.get("model")
+            if not model_id:
+                raise ValueError("No model has been promoted to current yet")
+            self._activate(model_id, self._warm_up(model_id))
+            active = self._active
+        return active
+
+    def promote(self, model_id: str) -> None:
+        """Load and warm up a model in the background and make it the current model
+
+        Arguments:
+            model_id {str} -- The filename of the model
+
+        Raises:
+            ValueError: If the model doesn't exist or another model is being promoted
+        """
+
+        if self.pointer_path in ("", "None"):
+            raise ValueError("CURRENT_MODEL_PATH is not set")
+        if not os.path.exists(os.path.join(self.model_dir, model_id)):
+            raise ValueError("Model {} does not exist".format(model_id))
+        if not self._start(self._promote, model_id):
+            raise ValueError("Model {} is being loaded, try again later".format(self._warming))
+
+    def rollback(self) -> str:
+        """Make the previous model the current model again
+
+        Raises:
+            ValueError: If there is no previous model
+
+        Returns:
+            str -- The filename of the model, which is current now
+        """
+
+        self._sync()
+        pointer = self._pointer
+        if not pointer.get("previous"):
+            raise ValueError("There is no previous model to roll back to")
+        self._write_pointer(pointer["previous"], pointer["model"])
+        self._sync()
+        return pointer["previous"]
+
+    def wait(self, timeout: float = None) -> None:
+        """Wait until a model which is loaded in the background is swapped in
+        """
+
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def stats(self) -> dict:
+        """Returns:
+            dict -- The pointer, the models loaded in this process and the model being warmed up
+        """
+
+        self._sync()
+        return {
+            "model": self._pointer.get("model"),
+            "previous": self._pointer.get("previous"),
+            "time_promoted": self._pointer.get("time_promoted"),
+            "loaded": self._active[0] if self._active else None,
+            "loaded_previous": self._previous[0] if self._previous else None,
+            "warming": self._warming,
+            "error": self._error,
+        }
+
+    def _sync(self) -> None:
+        """Read the pointer, if it changed, and swap in the model it points to
+        """
+
+        try:
+            mtime = os.stat(self.pointer_path).st_mtime
+        except OSError:
+            return
+        if mtime != self._pointer_mtime:
+            try:
+                pointer = self._read_pointer()
+            except (OSError, ValueError) as err:
+                logger.error("Could not read the current model pointer: %s", str(err))
+                return
+            with self._lock:
+                self._pointer = pointer
+                self._pointer_mtime = mtime
+
+        model_id = self._pointer.get("model")
+        if self._active is None or self._active[0] == model_id:
+            return
+        with self._lock:
+            if self._previous is not None and self._previous[0] == model_id:
+                # rollback, the previous model is still loaded
+                self._active, self._previous = self._previous, self._active
+                logger.info("Swapped in previous model %s", model_id)
+                return
+        if not self._start(self._swap_in, model_id):
+            # keep serving the active model, the pointer is followed after the load
+            logger.debug("Model %s is being loaded, swapping in %s later", self._warming, model_id)
+
+    def _start(self, target, model_id) -> bool:
+        """Load a model in the background
+
+        Returns:
+            bool -- False if another model is being loaded
+        """
+
+        with self._lock:
+            if self._warming is not None:
+                return self._warming == model_id
+            self._warming = model_id
+            self._thread = Thread(target=target, args=(model_id,), daemon=True)
+            self._thread.start()
+            return True
+
+    def _promote(self, model_id) -> None:
+        try:
+            model = self._warm_up(model_id)
+            # another process could have promoted a model while this one was warmed up
+            try:
+                pointer = self._read_pointer()
+            except (OSError, ValueError):
+                pointer = {}
+            previous = pointer.get("model")
+            if previous == model_id:
+                previous = pointer.get("previous")
+            self._write_pointer(model_id, previous)
+            self._activate(model_id, model)
+            self._error = ""
+            logger.info("Promoted model %s to current", model_id)
+        except Exception as err:
+            self._error = "Promoting {} failed: {}".format(model_id, err)
+            logger.error(self._error)
+        finally:
+            self._warming = None
+
+    def _swap_in(self, model_id) -> None:
+        try:
+            self._activate(model_id, self._warm_up(model_id))
+            self._error = ""
+            logger.info("Swapped in current model %s", model_id)
+        except Exception as err:
+            self._error = "Loading {} failed: {}".format(model_id, err)
+            logger.error(self._error)
+        finally:
+            self._warming = None
+
+    def _warm_up(self, model_id) -> Model:
+        model = self.load_model(model_id)
+        if self.warmup_texts:
+            model.pipeline.predict_proba(self.warmup_texts)
+        return model
+
+    def _activate(self, model_id, model) -> None:
+        with self._lock:
+            if self._active is not None and self._active[0] != model_id:
+                self._previous = self._active
+            self._active = (model_id, model)
+
+    def _read_pointer(self) -> dict:
+        with open(self.pointer_path) as f:
+            return json.load(f)
+
+    def _write_pointer(self, model_id, previous) -> None:
+        tmp_path = self.pointer_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"model": model_id, "previous": previous, "time_promoted": time.time()}, f)
+        # atomic, every process reads either the old or the new pointer
+        os.replace(tmp_path, self.pointer_path)
+
+
+current_model = CurrentModel(model_registry.get, CURRENT_MODEL_PATH)
+
+
+def get_model(model_name: str) -> Model:
+    """Get a model by its filename or the current model by "current"
+    """
+
+    if model_name == CURRENT_MODEL_ALIAS:
+        return current_model.get()
+    return model_registry.get(model_name)
+
+
+def get_versioned_model(model_name: str) -> Tuple[str, Optional[float], Model]:
+    """Get a model like get_model together with the filename and the version of the model
+
+    Arguments:
+        model_name {str} -- The filename of the model or "current"
+
+    Returns:
+        Tuple[str, Optional[float], Model] -- The filename, the modification time of the model
+                                              file (None if it doesn't exist) and the model
+    """
+
+    if model_name == CURRENT_MODEL_ALIAS:
+        model_id, model = current_model.get_active()
+    else:
+        model_id, model = model_name, model_registry.get(model_name)
+    return model_id, model_registry.version(model_id), model
@@ -0,0 +1,179 @@
+"""
+Usage:
+    from tatorte_classifier.database import get_text_features, save_text_features
+
+    feature_cache = FeatureCache(get_text_features, save_text_features)
+    tokens = feature_cache.get_tokens(text_ids, times_modified, texts)
+
+The feature cache stores the preprocessed and stemmed tokens of every text. The cached tokens
+of a text are reused as long as the text was not modified and the preprocessing did not
+change, so a training run only has to preprocess new or changed texts.
+"""
+import hashlib
+import json
+import logging
+from typing import Callable, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+from tatorte_classifier.machine_learning.model import TOKEN_PATTERN, StemmingAnalyzer
+from tatorte_classifier.machine_learning.preprocess_data import (
+    EMAIL_PATTERN,
+    LINK_PATTERN,
+    TELEPHONE_PATTERN,
+    DataPreprocessor,
+)
+
+logger = logging.getLogger(__name__)
+
+# increase, when the preprocessing changes in a way that is not covered by preprocessing_version
+FEATURE_CACHE_FORMAT = 1
+# number of texts whose cached features are queried at once
+FEATURE_CACHE_BATCH_SIZE = 1000
+
+
+def preprocessing_version(preprocessor: DataPreprocessor, analyzer: StemmingAnalyzer) -> str:
+    """A hash of everything that changes the tokens of a text
+
+    Arguments:
+        preprocessor {DataPreprocessor}
+        analyzer {StemmingAnalyzer}
+
+    Returns:
+        str -- The version hash
+    """
+
+    config = [
+        FEATURE_CACHE_FORMAT,
+        EMAIL_PATTERN.pattern,
+        TELEPHONE_PATTERN.pattern,
+        LINK_PATTERN.pattern,
+        preprocessor._keywords_and_punctuation_pattern.pattern,
+        TOKEN_PATTERN.pattern,
+        analyzer.language,
+        analyzer.ignore_stopwords,
+    ]
+    return hashlib.sha1(json.dumps(config).encode("utf-8")).hexdigest()[:16]
+
+
+class FeatureCache:
+    def __init__(
+        self,
+        load_features: Callable[[str, list], Iterable[dict]],
+        save_features: Callable[[str, list], None],
+        preprocessor: DataPreprocessor = None,
+        analyzer: StemmingAnalyzer = None,
+    ):
+        """Cache for the preprocessed and stemmed tokens of the texts
+
+        Arguments:
+            load_features {Callable} -- Returns the cached features of a version and a list of
+                                        text ids as dicts with the keys _id, time_modified
+                                        and tokens
+            save_features {Callable} -- Saves a list of these dicts for a version
+
+        Keyword Arguments:
+            preprocessor {DataPreprocessor} -- (default: {DataPreprocessor()})
+            analyzer {StemmingAnalyzer} -- Must stem like the analyzer of the trained models
+                                           (default: {StemmingAnalyzer()})
+        """
+
+        self.load_features = load_features
+        self.save_features = save_features
+        self.preprocessor = preprocessor or DataPreprocessor()
+        self.analyzer = analyzer or StemmingAnalyzer()
+        self.version = preprocessing_version(self.preprocessor, self.analyzer)
+
+    def get_tokens(
+        self,
+        text_ids: Sequence,
+        times_modified: Sequence[float],
+        texts: Sequence[str],
+        n_jobs: int = 1,
+    ) -> np.ndarray:
+        """Get the tokens of the texts from the cache and preprocess all texts which are not
+        cached or were modified since they have been cached
+
+        Arguments:
+            text_ids {Sequence} -- The ids of the texts
+            times_modified {Sequence[float]} -- The modification times of the texts
+            texts {Sequence[str]} -- The raw texts
+
+        Keyword Arguments:
+            n_jobs {int} -- Number of processes used for preprocessing (default: {1})
+
+        Returns:
+            np.ndarray -- Object array with a list of tokens for every text
+        """
+
+        tokens, missing = self.get_cached_tokens(text_ids, times_modified)
+        if missing:
+            missing_tokens = self.tokenize([texts[i] for i in missing], n_jobs=n_jobs)
+            for i, text_tokens in zip(missing, missing_tokens):
+                tokens[i] = text_tokens
+            self.save_tokens(
+                [text_ids[i] for i in missing],
+                [times_modified[i] for i in missing],
+                missing_tokens,
+            )
+        return tokens
+
+    def get_cached_tokens(
+        self, text_ids: Sequence, times_modified: Sequence[float]
+    ) -> Tuple[np.ndarray, List[int]]:
+        """Get the tokens of the texts which are cached and not modified
+
+        Arguments:
+            text_ids {Sequence} -- The ids of the texts
+            times_modified {Sequence[float]} -- The modification times of the texts
+
+        Returns:
+            Tuple[np.ndarray, List[int]] -- Object array with the tokens of every text (None if
+                                            the text is not cached) and the indices of the texts
+                                            that are not cached
+        """
+
+        tokens = np.empty(len(text_ids), dtype=object)
+        missing = []
+        # only the requested texts are loaded, one batch at a time instead of the whole cache
+        for start in range(0, len(text_ids), FEATURE_CACHE_BATCH_SIZE):
+            batch = list(text_ids[start : start + FEATURE_CACHE_BATCH_SIZE])
+            cached = {
+                feature["_id"]: feature for feature in self.load_features(self.version, batch)
+            }
+            for i, text_id in enumerate(batch, start):
+                feature = cached.get(text_id)
+                if feature is not None and feature["time_modified"] == times_modified[i]:
+                    tokens[i] = feature["tokens"]
+                else:
+                    missing.append(i)
+        logger.info(
+            "Feature cache: %d of %d texts cached", len(text_ids) - len(missing), len(text_ids)
+        )
+        return tokens, missing
+
+    def tokenize(self, texts: Iterable[str], n_jobs: int = 1) -> List[list]:
+        """Preprocess and stem texts
+
+        Arguments:
+            texts {Iterable[str]} -- The raw texts
+
+        Keyword Arguments:
+            n_jobs {int} -- Number of processes used for preprocessing (default: {1})
+
+        Returns:
+            List[list] -- The tokens of every text
+        """
+
+        return [self.analyzer(desc) for desc in self.preprocessor.transform_many(texts, n_jobs)]
+
+    def save_tokens(
+        self, text_ids: Sequence, times_modified: Sequence[float], tokens: Sequence[list]
+    ) -> None:
+        self.save_features(
+            self.version,
+            [
+                {"_id": text_id, "time_modified": time_modified, "tokens": text_tokens}
+                for text_id, time_modified, text_tokens in zip(text_ids, times_modified, tokens)
+            ],
+        )
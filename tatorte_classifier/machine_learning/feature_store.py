@@ -0,0 +1,217 @@
+"""
+Usage:
+    from tatorte_classifier.machine_learning.feature_store import FeatureStore, corpus_snapshot
+
+    feature_store = FeatureStore("models/.features", max_entries=8)
+    key = feature_store.key(corpus_snapshot(text_ids, times_modified, y), vect_params, 0.3, 900)
+    features = feature_store.load(key)  # None, if it isn't stored
+    feature_store.save(key, features)
+
+The feature store keeps the fitted TfidfVectorizer together with the tf-idf matrices and the
+categories of the train/test split. A training run with the same texts, cleaning rules, tf-idf
+parameters and split parameters as an earlier one only trains its classifier on the stored
+matrices and skips preprocessing, stemming and vocabulary building entirely.
+
+Every entry is a directory: vectorizer.sav (dill), x_train.npz and x_test.npz (CSR matrices),
+y_train.npy and y_test.npy. It is written next to its final path and renamed, so other
+processes never load a half written entry. The least recently used entries are deleted, when
+there are more than max_entries.
+"""
+import os
+import json
+import shutil
+import hashlib
+import logging
+from typing import Optional, Sequence
+
+import dill
+import numpy as np
+import scipy.sparse
+import sklearn
+
+from tatorte_classifier.machine_learning.cleaning_rules import CleaningRules, cleaning_rules
+
+logger = logging.getLogger(__name__)
+
+# increase, when the layout of an entry changes
+FEATURE_STORE_FORMAT = 1
+
+
+class Features:
+    def __init__(self, vectorizer, x_train, x_test, y_train: np.ndarray, y_test: np.ndarray):
+        """The fitted vectorizer and the tf-idf matrices (or the hashed term counts of an
+        incremental model) of a train/test split
+
+        Arguments:
+            vectorizer {TfidfVectorizer} -- The vectorizer fitted on the training texts
+            x_train {scipy.sparse.csr_matrix} -- The tf-idf matrix of the training texts
+            x_test {scipy.sparse.csr_matrix} -- The tf-idf matrix of the test texts
+            y_train {np.ndarray} -- The categories of the training texts
+            y_test {np.ndarray} -- The categories of the test texts
+        """
+
+        self.vectorizer = vectorizer
+        self.x_train = x_train
+        self.x_test = x_test
+        self.y_train = y_train
+        self.y_test = y_test
+
+
+def corpus_snapshot(text_ids: Sequence, times_modified: Sequence[float], y: np.ndarray) -> str:
+    """A hash of the training texts, which changes when a text is added, deleted, modified or
+    relabeled
+
+    Arguments:
+        text_ids {Sequence} -- The ids of the texts
+        times_modified {Sequence[float]} -- The modification times of the texts
+        y {np.ndarray} -- The categories of the texts
+
+    Returns:
+        str -- The snapshot hash
+    """
+
+    snapshot = hashlib.sha1()
+    snapshot.update(" ".join(str(text_id) for text_id in text_ids).encode("utf-8"))
+    snapshot.update(np.ascontiguousarray(times_modified, dtype=float).tobytes())
+    snapshot.update(np.ascontiguousarray(y, dtype=np.int64).tobytes())
+    return snapshot.hexdigest()[:16]
+
+
+def snapshot_seed(snapshot: str) -> int:
+    """The random state for balancing and splitting the texts of a snapshot. The split of a
+    snapshot is always the same, so the stored matrices of different vect_params share it
+    """
+
+    return int(snapshot[:8], 16)
+
+
+class FeatureStore:
+    def __init__(self, path: str, max_entries: int = 8, version: str = ""):
+        """Disk cache for fitted vectorizers and their tf-idf matrices
+
+        Arguments:
+            path {str} -- The directory of the entries
+
+        Keyword Arguments:
+            max_entries {int} -- Maximum number of stored entries (default: {8})
+            version {str} -- The version of the preprocessing, e.g. FeatureCache.version
+                             (default: {""})
+        """
+
+        self.path = path
+        self.max_entries = max_entries
+        self.version = version
+
+    def key(
+        self,
+        snapshot: str,
+        vect_params: dict,
+        test_size: float,
+        values_per_category: int,
+        rules: CleaningRules = None,
+        incremental: bool = False,
+    ) -> str:
+        """The key of the features of a training run
+
+        Arguments:
+            snapshot {str} -- The corpus_snapshot of the texts
+            vect_params {dict} -- The params of the TfidfVectorizer
+            test_size {float}
+            values_per_category {int}
+
+        Keyword Arguments:
+            rules {CleaningRules} -- (default: {the rules loaded from CLEANING_RULES_PATH})
+            incremental {bool} -- Whether the features are hashed for an incremental model
+                                  (default: {False})
+
+        Returns:
+            str -- The key
+        """
+
+        config = [
+            FEATURE_STORE_FORMAT,
+            sklearn.__version__,
+            self.version,
+            snapshot,
+            (rules or cleaning_rules).version,
+            vect_params,
+            test_size,
+            values_per_category,
+        ]
+        if incremental:
+            config.append("incremental")
+        return hashlib.sha1(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+    def contains(self, key: str) -> bool:
+        return os.path.isdir(os.path.join(self.path, key))
+
+    def load(self, key: str) -> Optional[Features]:
+        """Load stored features
+
+        Arguments:
+            key {str} -- The key of the features
+
+        Returns:
+            Optional[Features] -- The features or None, if they aren't stored
+        """
+
+        entry = os.path.join(self.path, key)
+        try:
+            with open(os.path.join(entry, "vectorizer.sav"), "rb") as f:
+                vectorizer = dill.load(f)
+            features = Features(
+                vectorizer,
+                scipy.sparse.load_npz(os.path.join(entry, "x_train.npz")),
+                scipy.sparse.load_npz(os.path.join(entry, "x_test.npz")),
+                np.load(os.path.join(entry, "y_train.npy")),
+                np.load(os.path.join(entry, "y_test.npy")),
+            )
+            # the modification time of the directory orders the entries for the eviction
+            os.utime(entry)
+        except OSError:
+            # not stored or evicted by another process in the meantime
+            return None
+        logger.info("Loaded features %s: %s", key, features.x_train.shape)
+        return features
+
+    def save(self, key: str, features: Features) -> None:
+        """Store features and evict the least recently used entries
+
+        Arguments:
+            key {str} -- The key of the features
+            features {Features} -- The features
+        """
+
+        entry = os.path.join(self.path, key)
+        tmp_entry = "{}.tmp-{}".format(entry, os.getpid())
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+        os.makedirs(tmp_entry)
+        with open(os.path.join(tmp_entry, "vectorizer.sav"), "wb") as f:
+            dill.dump(features.vectorizer, f)
+        scipy.sparse.save_npz(
+            os.path.join(tmp_entry, "x_train.npz"), features.x_train.tocsr(), compressed=False
+        )
+        scipy.sparse.save_npz(
+            os.path.join(tmp_entry, "x_test.npz"), features.x_test.tocsr(), compressed=False
+        )
+        np.save(os.path.join(tmp_entry, "y_train.npy"), features.y_train)
+        np.save(os.path.join(tmp_entry, "y_test.npy"), features.y_test)
+        try:
+            os.rename(tmp_entry, entry)
+        except OSError:
+            # another process stored the same features first
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+        logger.info("Saved features %s", key)
+        self._evict()
+
+    def _evict(self) -> None:
+        entries = []
+        for name in os.listdir(self.path):
+            try:
+                if ".tmp-" not in name:
+                    entries.append((os.stat(os.path.join(self.path, name)).st_mtime, name))
+            except OSError:
+                pass
+        for _, name in sorted(entries, reverse=True)[self.max_entries :]:
+            shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+            logger.info("Evicted features %s", name)
@@ -15,39 +15,107 @@ Versions:
 
 """
 import os
+import time
 import logging
+from typing import Tuple
 
 import dill
 import numpy as np
 
-from configuration import MODEL_DIR, MIN_DESC_LEN, MIN_PREDICTING_PROBA
+from configuration import (
+    COMPACT_INFERENCE,
+    MODEL_DIR,
+    MIN_DESC_LEN,
+    MIN_PREDICTING_PROBA,
+    SHARED_MODEL_WEIGHTS,
+)
+from tatorte_classifier.machine_learning.linear_inference import get_compiled_model, top_k
 from tatorte_classifier.machine_learning.model import Model
+from tatorte_classifier.machine_learning.model_format import (
+    convert_model_file,
+    is_being_saved,
+    is_model_dir,
+    ArrayPipeline,
+    load_model_dir,
+)
+from tatorte_classifier.metrics import PREDICTION_STAGE_SECONDS, metrics
 
 logger = logging.getLogger(__name__)
 
+# the model directories converted from .sav files, relative to MODEL_DIR
+SHARED_MODEL_DIR = ".shared"
+# seconds a missing model is waited for, while its model directory is being replaced
+MODEL_SAVE_TIMEOUT = 1.0
+
 
 # --------------------------------
 # loading the model
 # --------------------------------
 def load_model(model_id) -> Model:
-    """Loads the model
+    """Loads the model, either a model directory or a .sav file
+
+    Raises:
+        FileNotFoundError: If the model doesn't exist
 
     Returns:
         The loaded model
     """
 
+    deadline = time.time() + MODEL_SAVE_TIMEOUT
+    while (
+        not os.path.exists(f"{MODEL_DIR}/{model_id}")
+        and is_being_saved(f"{MODEL_DIR}/{model_id}")
+        and time.time() < deadline
+    ):
+        time.sleep(0.01)
+
     model = None
-    if os.path.isfile(f"{MODEL_DIR}/{model_id}"):
+    if is_model_dir(f"{MODEL_DIR}/{model_id}"):
+        model = load_model_dir(f"{MODEL_DIR}/{model_id}")
+    elif os.path.isfile(f"{MODEL_DIR}/{model_id}") and SHARED_MODEL_WEIGHTS:
+        try:
+            model = load_model_dir(
+                convert_model_file(
+                    f"{MODEL_DIR}/{model_id}", f"{MODEL_DIR}/{SHARED_MODEL_DIR}/{model_id}"
+                )
+            )
+        except Exception as err:
+            logger.warning("Could not convert model %s: %s", model_id, str(err))
+            model = dill.load(open(f"{MODEL_DIR}/{model_id}", "rb"))
+    elif os.path.isfile(f"{MODEL_DIR}/{model_id}"):
         model = dill.load(open(f"{MODEL_DIR}/{model_id}", "rb"))
     else:
-        logger.warning("File %s/%s does not exist", MODEL_DIR, model_id)
-        model = Model("sgd", {}, {})  # random model if no model exists
+        raise FileNotFoundError("The model {} doesn't exist".format(model_id))
     return model
 
 
 # ------------------
 # Predicting Classes
 # ------------------
+def _predict_proba(descs, model: Model) -> np.ndarray:
+    """pipeline.predict_proba, which observes the time of the vectorizer and the classifier
+    separately, if the metrics are enabled
+    """
+
+    pipeline = model.pipeline
+    if not metrics.enabled:
+        return pipeline.predict_proba(descs)
+    if isinstance(pipeline, ArrayPipeline):
+        vectorizers, classifier = [pipeline.vectorizer], pipeline.classifier
+    elif hasattr(pipeline, "steps"):
+        vectorizers = [step for _, step in pipeline.steps[:-1]]
+        classifier = pipeline.steps[-1][1]
+    else:
+        with PREDICTION_STAGE_SECONDS.time(stage="classify"):
+            return pipeline.predict_proba(descs)
+    X = descs
+    with PREDICTION_STAGE_SECONDS.time(stage="vectorize"):
+        for vectorizer in vectorizers:
+            X = vectorizer.transform(X)
+    with PREDICTION_STAGE_SECONDS.time(stage="classify"):
+        return classifier.predict_proba(X)
+
+
 def _predict_classes(desc: np.ndarray, model: Model, n_preds: int) -> np.ndarray:
     """predict the classes of the desc
 
@@ -71,14 +139,54 @@ def _predict_classes(desc: np.ndarray, model: Model, n_preds: int) -> np.ndarray
     if len(desc[0]) < MIN_DESC_LEN:
         return [], []
 
-    pred = model.pipeline.predict_proba(desc)[0]
-    pred_idx = np.argsort(-pred)[:n_preds]
+    # sgd models skip the sklearn pipeline, which is slow for a single text
+    compact = get_compiled_model(model) if COMPACT_INFERENCE else None
+    if compact is not None:
+        with PREDICTION_STAGE_SECONDS.time(stage="compact"):
+            pred = compact.predict_proba_one(desc[0])
+    else:
+        pred = _predict_proba(desc, model)[0]
+    pred_idx = top_k(pred[np.newaxis], n_preds)[0]
     if pred[pred_idx[0]] < MIN_PREDICTING_PROBA:
         return [], []
     pred = pred[pred_idx]
     return pred_idx, pred
 
 
+def _predict_classes_batch(
+    descs: np.ndarray, model: Model, n_preds: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """predict the classes of many descs with a single call of the pipeline
+
+    Arguments:
+        descs {np.array} -- The *preprocessed* descriptions
+        model {Model}
+        n_preds {int} -- The number of classes returned for each description
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]
+             [0] -- Array with shape (len(descs), n_preds) with the predicted classes
+             [1] -- Array with shape (len(descs), n_preds) with their probabilities
+             [2] -- Boolean array with shape (len(descs),), False for descriptions that are too
+                    short or are not predicted with enough probability
+    """
+    descs = np.asarray(descs, dtype=str)
+    valid = np.char.str_len(descs) >= MIN_DESC_LEN
+    if not valid.any():
+        return np.zeros((len(descs), n_preds), dtype=int), np.zeros((len(descs), n_preds)), valid
+
+    # only the descriptions which are long enough are passed to the pipeline
+    probas = _predict_proba(descs[valid], model)
+    n_preds = min(n_preds, probas.shape[1])
+    pred_idx = np.zeros((len(descs), n_preds), dtype=int)
+    pred = np.zeros((len(descs), n_preds))
+    valid_idx = top_k(probas, n_preds)
+    pred_idx[valid] = valid_idx
+    pred[valid] = np.take_along_axis(probas, valid_idx, axis=1)
+    valid &= pred[:, 0] >= MIN_PREDICTING_PROBA
+    return pred_idx, pred, valid
+
+
 # ----------------------
 # Puting it all together
 # ----------------------
@@ -96,3 +204,64 @@ def get_predictions(desc: np.ndarray, model: Model, n_classes: int) -> np.ndarra
 
     pred = _predict_classes(desc, model, n_classes)
     return pred
+
+
+def get_batch_predictions(
+    descs: np.ndarray, model: Model, n_classes: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Get the predictions for many descriptions at once
+
+    Arguments:
+        descs {np.array} -- The *preprocessed* descriptions
+        model {Model}
+        n_classes {int} -- The number of classes returned for each description
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray] -- classes, probabilities and a mask of the
+                                                     descriptions that could be classified
+    """
+
+    return _predict_classes_batch(descs, model, n_classes)
+
+
+def get_prediction_list(desc: str, model: Model, n_classes: int) -> list:
+    """Get the predictions of one description in the format of the api
+
+    Arguments:
+        desc {str} -- The *preprocessed* description
+        model {Model}
+        n_classes {int} -- The maximum number of classes
+
+    Returns:
+        list -- [{"category": 2, "probability": 0.57}, ...], empty if the description can't be
+                classified
+    """
+
+    preds = np.asarray(get_predictions([desc], model, n_classes)).T
+    return [{"category": pred_idx, "probability": pred} for pred_idx, pred in preds]
+
+
+def get_batch_prediction_lists(descs: np.ndarray, model: Model, n_classes: int) -> list:
+    """Get the predictions of many descriptions in the format of the api
+
+    Arguments:
+        descs {np.array} -- The *preprocessed* descriptions
+        model {Model}
+        n_classes {int} -- The maximum number of classes
+
+    Returns:
+        list -- A list like the one of get_prediction_list for every description
+    """
+
+    pred_idx, pred, valid = get_batch_predictions(descs, model, n_classes)
+    return [
+        [
+            {"category": category, "probability": probability}
+            for category, probability in zip(categories, probabilities)
+        ]
+        if is_valid
+        else []
+        for categories, probabilities, is_valid in zip(
+            pred_idx.tolist(), pred.tolist(), valid.tolist()
+        )
+    ]
@@ -0,0 +1,345 @@
+"""
+Usage:
+    from tatorte_classifier.machine_learning.hyperparameter_search import (
+        expand_search_space,
+        search,
+    )
+
+    trials = expand_search_space(
+        {
+            "clf": "sgd",
+            "clf_params": {"loss": "log", "alpha": {"log_uniform": [1e-6, 1e-3]}},
+            "vect_params": {"ngram_range": [[1, 1], [1, 2]]},
+        },
+        n_trials=20,
+    )
+    best = search(x, y, trials, n_jobs=-1, on_trial=print)
+
+A search space is a dict (or a list of dicts, e.g. one per classifier) with the keys clf,
+clf_params and vect_params like the metadata of a model. A list of values is a choice, so a
+parameter which is a list itself has to be wrapped in another list, e.g. "ngram_range": [[1, 2]].
+Without n_trials every combination is tried (grid search), with n_trials as many random
+combinations are drawn, then {"uniform": [low, high]} and {"log_uniform": [low, high]} can be
+used for float parameters as well.
+
+The texts are cleaned, balanced and split once for all trials. The TfidfVectorizer is fitted
+once for every distinct vect_params (or loaded from the feature store) and its matrices are
+shared by all trials with these vect_params, so only the classifiers are trained in parallel
+with joblib (in forked processes). Poor trials are stopped early by successive halving: all
+trials are trained on a small part of the training data, only the best 1/eta of them are
+trained on eta times as much data, until the last ones are trained on all of it.
+
+The trials are ranked on validation texts held out of the training data (val_acc), not on the
+test texts. Only the best trial is evaluated on the test texts (test_acc), so its test accuracy
+isn't biased by the selection.
+"""
+import copy
+import json
+import math
+import time
+import logging
+from itertools import product
+from typing import Callable, List, Tuple
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.metrics import accuracy_score
+from sklearn.pipeline import Pipeline
+
+from tatorte_classifier.machine_learning.feature_store import FeatureStore, snapshot_seed
+from tatorte_classifier.machine_learning.model import Model
+from tatorte_classifier.machine_learning.train_model import (
+    create_features,
+    split_data,
+    use_vectorizer,
+)
+
+logger = logging.getLogger(__name__)
+
+# maximum number of trials of one search
+MAX_TRIALS = 100
+# the training data of the first rung of the successive halving has at least this many texts
+MIN_RUNG_SIZE = 100
+
+
+def _choices(value) -> list:
+    if isinstance(value, list):
+        return value
+    if isinstance(value, dict):
+        raise ValueError("Distributions like {} are only allowed with n_trials".format(value))
+    return [value]
+
+
+def _sample(value, rng: np.random.RandomState):
+    if isinstance(value, list):
+        return copy.deepcopy(value[rng.randint(len(value))])
+    if isinstance(value, dict) and "uniform" in value:
+        low, high = value["uniform"]
+        return float(rng.uniform(low, high))
+    if isinstance(value, dict) and "log_uniform" in value:
+        low, high = value["log_uniform"]
+        return float(math.exp(rng.uniform(math.log(low), math.log(high))))
+    if isinstance(value, dict):
+        raise ValueError("Unknown distribution {}".format(value))
+    return value
+
+
+def _grid(space: dict) -> List[dict]:
+    clf_params = space.get("clf_params", {})
+    vect_params = space.get("vect_params", {})
+    clf_names = list(clf_params)
+    vect_names = list(vect_params)
+    trials = []
+    for clf, clf_values, vect_values in product(
+        _choices(space["clf"]),
+        product(*[_choices(clf_params[name]) for name in clf_names]),
+        product(*[_choices(vect_params[name]) for name in vect_names]),
+    ):
+        trials.append(
+            {
+                "clf": clf,
+                "clf_params": copy.deepcopy(dict(zip(clf_names, clf_values))),
+                "vect_params": copy.deepcopy(dict(zip(vect_names, vect_values))),
+            }
+        )
+    return trials
+
+
+def expand_search_space(space, n_trials: int = None, random_state: int = None) -> List[dict]:
+    """Get the trials of a search space
+
+    Arguments:
+        space {dict, list} -- The search space or a list of search spaces
+
+    Keyword Arguments:
+        n_trials {int} -- Number of random trials, None for a grid search (default: {None})
+        random_state {int} -- Seed of the random search (default: {None})
+
+    Raises:
+        ValueError: If the space is invalid or has more than MAX_TRIALS trials
+
+    Returns:
+        List[dict] -- The trials as dicts with the keys clf, clf_params and vect_params
+    """
+
+    spaces = space if isinstance(space, list) else [space]
+    if not spaces or not all(isinstance(space, dict) and "clf" in space for space in spaces):
+        raise ValueError("Every search space needs a clf")
+
+    if n_trials is None:
+        trials = [trial for space in spaces for trial in _grid(space)]
+    else:
+        rng = np.random.RandomState(random_state)
+        trials = []
+        for _ in range(int(n_trials)):
+            space = spaces[rng.randint(len(spaces))]
+            trials.append(
+                {
+                    "clf": _sample(space["clf"], rng),
+                    "clf_params": {
+                        name: _sample(value, rng)
+                        for name, value in space.get("clf_params", {}).items()
+                    },
+                    "vect_params": {
+                        name: _sample(value, rng)
+                        for name, value in space.get("vect_params", {}).items()
+                    },
+                }
+            )
+    if not trials or len(trials) > MAX_TRIALS:
+        raise ValueError(
+            "A search needs between 1 and {} trials, got {}".format(MAX_TRIALS, len(trials))
+        )
+    return trials
+
+
+def _vect_key(vect_params: dict) -> str:
+    return json.dumps(vect_params, sort_keys=True)
+
+
+def _rung_sizes(n_trials: int, n_train: int, eta: int, n_rungs: int) -> List[int]:
+    """The number of training texts of every rung of the successive halving
+    """
+
+    if n_trials <= 1 or not eta or n_rungs <= 1:
+        return [n_train]
+    n_rungs = min(n_rungs, int(math.ceil(math.log(n_trials, eta))) + 1)
+    sizes = [int(n_train / eta ** (n_rungs - 1 - rung)) for rung in range(n_rungs)]
+    return sorted({min(n_train, max(size, MIN_RUNG_SIZE)) for size in sizes})
+
+
+def _fit_trial(steps, x_train, y_train, x_val, y_val) -> Tuple:
+    """Train the classifier of a trial on the tf-idf matrix. Runs in a joblib worker
+
+    Returns:
+        Tuple -- The fitted steps, train and validation accuracy, fit time and an error message
+    """
+
+    try:
+        pipeline = Pipeline([(name, clone(step)) for name, step in steps])
+        start = time.perf_counter()
+        pipeline.fit(x_train, y_train)
+        fit_time = time.perf_counter() - start
+        train_acc = accuracy_score(y_train, pipeline.predict(x_train))
+        val_acc = accuracy_score(y_val, pipeline.predict(x_val))
+        return pipeline.steps, train_acc, val_acc, fit_time, ""
+    except Exception as err:
+        return None, 0.0, 0.0, 0.0, str(err)
+
+
+def search(
+    x: np.ndarray,
+    y: np.ndarray,
+    trials: List[dict],
+    test_size: float = 0.3,
+    values_per_category: int = 900,
+    tokens: np.ndarray = None,
+    n_jobs: int = 1,
+    eta: int = 3,
+    n_rungs: int = 3,
+    validation_size: float = 0.2,
+    progress: Callable[[str], None] = None,
+    on_trial: Callable[[dict, Model], None] = None,
+    feature_store: FeatureStore = None,
+    snapshot: str = None,
+) -> dict:
+    """Train the trials in parallel and stop the poor ones early
+
+    Arguments:
+        x {np.ndarray} -- The texts
+        y {np.ndarray} -- The categories
+        trials {List[dict]} -- The trials of expand_search_space
+
+    Keyword Arguments:
+        test_size {float} -- (default: {0.3})
+        values_per_category {int} -- (default: {900})
+        tokens {np.ndarray} -- The already preprocessed and stemmed texts (default: {None})
+        n_jobs {int} -- Number of processes training classifiers, -1 for all cores
+                        (default: {1})
+        eta {int} -- Only the best 1/eta trials of a rung advance to the next one, 0 disables
+                     the early stopping (default: {3})
+        n_rungs {int} -- Maximum number of rungs (default: {3})
+        validation_size {float} -- Share of the training texts the trials are ranked on
+                                   instead of being trained on (default: {0.2})
+        progress {Callable} -- Called with the name of every stage (default: {None})
+        on_trial {Callable} -- Called with the result and the trained model (None for stopped
+                               and failed trials) as soon as a trial is finished
+                               (default: {None})
+        feature_store {FeatureStore} -- Stores the fitted vectorizers and their matrices
+                                        (default: {None})
+        snapshot {str} -- The corpus_snapshot of the texts, needed for the feature store
+                          (default: {None})
+
+    Raises:
+        ValueError: If all trials failed
+
+    Returns:
+        dict -- The result of the best trial with the keys metadata, performance_data (with the
+                test_acc of the trial), state and error_message
+    """
+
+    # one fitted vectorizer and one pair of matrices for every distinct vect_params, from the
+    # feature store or computed on a split which is shared by all of them
+    models = [Model(trial["clf"], trial["clf_params"], trial["vect_params"]) for trial in trials]
+    features = {}
+    split = None
+    for trial, model in zip(trials, models):
+        key = _vect_key(trial["vect_params"])
+        if key not in features:
+            store_key = None
+            if feature_store is not None and snapshot:
+                store_key = feature_store.key(
+                    snapshot, trial["vect_params"], test_size, values_per_category
+                )
+                features[key] = feature_store.load(store_key)
+            if features.get(key) is None:
+                if split is None:
+                    split = split_data(
+                        x,
+                        y,
+                        test_size,
+                        values_per_category,
+                        tokens=tokens,
+                        random_state=snapshot_seed(snapshot) if snapshot else None,
+                        progress=progress,
+                    )
+                    if progress is not None:
+                        progress("vectorizing")
+                features[key] = create_features(
+                    model.pipeline.steps[0][1], split, analyzed=tokens is not None
+                )
+                if store_key is not None:
+                    feature_store.save(store_key, features[key])
+        use_vectorizer(model, features[key].vectorizer)
+
+    if progress is not None:
+        progress("searching")
+    results = [
+        {
+            "metadata": dict(
+                trial, test_size=test_size, values_per_category=values_per_category
+            ),
+            "performance_data": {},
+            "state": "stopped",
+            "error_message": "",
+        }
+        for trial in trials
+    ]
+    alive = list(range(len(trials)))
+    # the split is the same for all vect_params, also for stored features of the same snapshot.
+    # The training texts are shuffled, the last of them are the validation texts
+    y_train = next(iter(features.values())).y_train
+    n_fit = len(y_train) - max(1, int(len(y_train) * validation_size))
+    sizes = _rung_sizes(len(trials), n_fit, eta, n_rungs)
+    # the pool of the multiprocessing backend is terminated at the end, the reusable workers of
+    # the default loky backend would keep the training process from exiting
+    with Parallel(n_jobs=n_jobs, backend="multiprocessing") as parallel:
+        for rung, size in enumerate(sizes):
+            fitted = parallel(
+                delayed(_fit_trial)(
+                    models[i].pipeline.steps[1:],
+                    features[_vect_key(trials[i]["vect_params"])].x_train[:size],
+                    y_train[:size],
+                    features[_vect_key(trials[i]["vect_params"])].x_train[n_fit:],
+                    y_train[n_fit:],
+                )
+                for i in alive
+            )
+            for i, (steps, train_acc, val_acc, fit_time, error) in zip(alive, fitted):
+                results[i]["performance_data"] = {
+                    "train_acc": train_acc,
+                    "val_acc": val_acc,
+                    "train_size": size,
+                    "fit_time": fit_time,
+                }
+                if error:
+                    results[i].update(state="failed", error_message=error)
+                elif rung == len(sizes) - 1:
+                    results[i]["state"] = "done"
+                    models[i].pipeline.steps[1:] = steps
+
+            ranked = sorted(
+                (i for i in alive if results[i]["state"] != "failed"),
+                key=lambda i: results[i]["performance_data"]["val_acc"],
+                reverse=True,
+            )
+            if rung < len(sizes) - 1:
+                ranked = ranked[: int(math.ceil(len(ranked) / eta))]
+            for i in alive:
+                if i not in ranked and on_trial is not None:
+                    on_trial(results[i], None)
+            alive = ranked
+            logger.info("Search rung %d: %d texts, %d trials left", rung, size, len(alive))
+
+    if not alive:
+        raise ValueError("All trials failed: {}".format(results[0]["error_message"]))
+    # the test texts are only used for the accuracy of the chosen trial
+    best = alive[0]
+    best_features = features[_vect_key(trials[best]["vect_params"])]
+    y_pred = Pipeline(models[best].pipeline.steps[1:]).predict(best_features.x_test)
+    results[best]["performance_data"]["test_acc"] = accuracy_score(best_features.y_test, y_pred)
+    for i in alive:
+        if on_trial is not None:
+            on_trial(results[i], models[i])
+    return results[best]
@@ -0,0 +1,101 @@
+"""
+Usage:
+    from tatorte_classifier.machine_learning.incremental import load_incremental_model, update_model
+
+    model = load_incremental_model("model-8d5e4706")
+    model, progressive_acc, n_texts = update_model(model, x_changed, y_changed)
+
+An incremental model is a sgd model trained with {"incremental": true} in its metadata. Its
+texts are hashed into a fixed number of columns instead of a vocabulary, and the idf is fitted
+once on the training texts of the full training and kept fixed afterwards. So the columns and
+their weights mean the same for every update and the classifier can learn the texts which were
+added or relabeled since the model was trained with SGDClassifier.partial_fit, which takes
+seconds instead of the minutes of a full training. A full training refits the idf.
+
+Before the classifier learns the changed texts, it predicts them, so the accuracy of the old
+model on the changed texts (the progressive accuracy) is measured without holding texts back.
+"""
+import logging
+from typing import Tuple
+
+import numpy as np
+from sklearn.metrics import accuracy_score
+from sklearn.pipeline import Pipeline
+
+from tatorte_classifier.machine_learning.cleaning_rules import CleaningRules
+from tatorte_classifier.machine_learning.get_prediction import load_model
+from tatorte_classifier.machine_learning.model import Model
+from tatorte_classifier.machine_learning.train_model import clean_data, token_vectorizer
+
+logger = logging.getLogger(__name__)
+
+
+def load_incremental_model(model_url: str) -> Model:
+    """Load a fresh copy of an incremental model, which can be updated without changing the
+    model which is used for predictions
+
+    Arguments:
+        model_url {str} -- The filename of the model in MODEL_DIR
+
+    Raises:
+        FileNotFoundError: If the model doesn't exist
+        ValueError: If the model isn't incremental
+
+    Returns:
+        Model -- The model
+    """
+
+    model = load_model(model_url)
+    if not getattr(model, "incremental", False):
+        raise ValueError("{} is not an incremental model".format(model_url))
+    return model
+
+
+def update_model(
+    model: Model,
+    x: np.ndarray,
+    y: np.ndarray,
+    tokens: np.ndarray = None,
+    n_epochs: int = 1,
+    rules: CleaningRules = None,
+) -> Tuple[Model, float, int]:
+    """Update an incremental model with changed texts. The model is changed in place
+
+    Arguments:
+        model {Model} -- The incremental model
+        x {np.ndarray} -- The texts added or relabeled since the model was trained
+        y {np.ndarray} -- Their categories
+
+    Keyword Arguments:
+        tokens {np.ndarray} -- The already preprocessed and stemmed texts (default: {None})
+        n_epochs {int} -- Number of passes over the texts (default: {1})
+        rules {CleaningRules} -- (default: {the rules loaded from CLEANING_RULES_PATH})
+
+    Raises:
+        ValueError: If none of the texts can be learned
+
+    Returns:
+        Tuple[Model, float, int] -- The model, the progressive accuracy and the number of
+                                    learned texts
+    """
+
+    x, y = clean_data(x, y, tokens=tokens, rules=rules)
+    classifier = model.pipeline.steps[-1][1]
+    # partial_fit can't add categories to a trained classifier, they need a full training
+    known = np.isin(y, classifier.classes_)
+    if not known.all():
+        logger.warning("Skipping %d texts of categories the model doesn't know", (~known).sum())
+    x, y = x[known], y[known]
+    if not len(y):
+        raise ValueError("None of the changed texts can be learned by the model")
+
+    steps = model.pipeline.steps[:-1]
+    if tokens is not None:
+        # hashing has no fitted state, so the tokens are hashed into the columns of the model
+        steps = [("vect", token_vectorizer(steps[0][1]))] + steps[1:]
+    features = Pipeline(steps).transform(x)
+    progressive_acc = accuracy_score(y, classifier.predict(features))
+    for _ in range(n_epochs):
+        classifier.partial_fit(features, y)
+    logger.info("Updated model with %d texts, progressive accuracy %.3f", len(y), progressive_acc)
+    return model, progressive_acc, len(y)
@@ -0,0 +1,225 @@
+"""
+Usage:
+    from tatorte_classifier.machine_learning.linear_inference import compile_model, top_k
+
+    compact = compile_model(model)  # None, if the model isn't a linear sgd model
+    proba = compact.predict_proba_one(desc)
+    pred_idx = top_k(proba[np.newaxis], 3)[0]
+
+The prediction of a sgd model is tokenize -> tf-idf -> one sparse dot product with coef_. For a
+single short text the validation and the allocation of the sparse matrices of the sklearn
+pipeline (or the scipy matrices of the ArrayPipeline) take much longer than the arithmetic.
+CompactLinearModel predicts one text with a few small numpy operations on the columns of its
+tokens. It uses the arrays of the model as they are: the terms of a model directory are looked
+up with searchsorted like ArrayVectorizer.lookup and only the columns of coef_ of the tokens are
+read, so the memory mapped arrays stay shared by the server processes. Its probabilities match
+the ones of pipeline.predict_proba.
+
+benchmarks/bench_inference.py compares the latencies of both paths.
+"""
+import weakref
+from typing import Callable, Optional
+
+import numpy as np
+
+from tatorte_classifier.machine_learning.model import StemmingAnalyzer
+from tatorte_classifier.machine_learning.model_format import (
+    ArrayLinearClassifier,
+    ArrayModel,
+    ArrayVectorizer,
+    linear_proba,
+)
+
+
+class CompactLinearModel:
+    def __init__(
+        self,
+        analyzer,
+        lookup: Callable[[list], np.ndarray],
+        idf: Optional[np.ndarray],
+        coef: np.ndarray,
+        intercept: np.ndarray,
+        classes: np.ndarray,
+        loss: str,
+        binary: bool = False,
+        norm: str = "l2",
+        sublinear_tf: bool = False,
+    ):
+        """predict_proba of a tf-idf vectorizer and a linear classifier for one text at a time
+
+        Arguments:
+            analyzer {StemmingAnalyzer} -- Splits a document into stemmed tokens
+            lookup {Callable} -- Returns the columns of a list of tokens, -1 for unknown tokens
+            idf {Optional[np.ndarray]} -- The idf vector or None
+            coef {np.ndarray} -- Shape (n_classes, n_features), (1, n_features) for 2 classes.
+                                 It isn't copied, only the columns of the tokens are read
+            intercept {np.ndarray}
+            classes {np.ndarray}
+            loss {str} -- The loss the classifier was trained with
+
+        Keyword Arguments:
+            binary {bool} -- Whether all non zero term counts are set to 1 (default: {False})
+            norm {str} -- l1, l2 or None (default: {"l2"})
+            sublinear_tf {bool} -- Whether the term counts are replaced by 1 + log(count)
+                                   (default: {False})
+        """
+
+        self.analyzer = analyzer
+        self.lookup = lookup
+        self.idf = idf
+        self.coef = coef
+        self.intercept = np.asarray(intercept, dtype=np.float64)
+        self.classes_ = classes
+        self.loss = loss
+        self.binary = binary
+        self.norm = norm
+        self.sublinear_tf = sublinear_tf
+
+    def decision_function_one(self, doc) -> np.ndarray:
+        """The scores of one text, shape (n_classes,), (1,) for 2 classes
+        """
+
+        columns = self.lookup(self.analyzer(doc))
+        columns = columns[columns >= 0]
+        if not len(columns):
+            return self.intercept.copy()
+        columns, counts = np.unique(columns, return_counts=True)
+        weights = counts.astype(np.float64)
+        if self.binary:
+            weights[:] = 1
+        if self.sublinear_tf:
+            np.log(weights, weights)
+            weights += 1
+        if self.idf is not None:
+            weights *= self.idf[columns]
+        if self.norm == "l2":
+            weights /= np.sqrt(weights.dot(weights))
+        elif self.norm == "l1":
+            weights /= np.abs(weights).sum()
+        return self.coef[:, columns].dot(weights) + self.intercept
+
+    def predict_proba_one(self, doc) -> np.ndarray:
+        """The probabilities of one text, shape (n_classes,)
+        """
+
+        scores = self.decision_function_one(doc).astype(np.float64)
+        if len(scores) == 1:
+            return linear_proba(scores, self.loss)[0]
+        return linear_proba(scores[np.newaxis], self.loss)[0]
+
+    def predict_proba(self, docs) -> np.ndarray:
+        return np.vstack([self.predict_proba_one(doc) for doc in docs])
+
+
+def _vocabulary_lookup(vocabulary: dict) -> Callable[[list], np.ndarray]:
+    get = vocabulary.get
+
+    def lookup(tokens: list) -> np.ndarray:
+        return np.fromiter((get(token, -1) for token in tokens), np.int64, len(tokens))
+
+    return lookup
+
+
+def _from_pipeline(model) -> Optional[CompactLinearModel]:
+    steps = dict(model.pipeline.steps)
+    vect = steps.get("vect")
+    clf = steps.get("clf")
+    if (
+        set(steps) != {"vect", "clf"}
+        or not hasattr(vect, "vocabulary_")
+        or not isinstance(vect.analyzer, StemmingAnalyzer)
+        or not hasattr(clf, "coef_")
+    ):
+        return None
+    return CompactLinearModel(
+        vect.analyzer,
+        _vocabulary_lookup(vect.vocabulary_),
+        vect.idf_ if vect.use_idf else None,
+        clf.coef_,
+        clf.intercept_,
+        clf.classes_,
+        clf.loss,
+        vect.binary,
+        vect.norm,
+        vect.sublinear_tf,
+    )
+
+
+def _from_arrays(model: ArrayModel) -> Optional[CompactLinearModel]:
+    vect = model.pipeline.vectorizer
+    clf = model.pipeline.classifier
+    if not isinstance(vect, ArrayVectorizer) or not isinstance(clf, ArrayLinearClassifier):
+        return None
+    # the (memory mapped) arrays of the model directory are used as they are
+    return CompactLinearModel(
+        vect.analyzer,
+        vect.lookup,
+        vect.idf,
+        clf.coef,
+        clf.intercept,
+        clf.classes_,
+        clf.loss,
+        vect.binary,
+        vect.norm,
+        vect.sublinear_tf,
+    )
+
+
+def compile_model(model) -> Optional[CompactLinearModel]:
+    """Build the compact inference of a model
+
+    Arguments:
+        model {Model, ArrayModel} -- The trained model
+
+    Returns:
+        Optional[CompactLinearModel] -- None, if the model isn't a tf-idf vectorizer followed by
+                                        a linear classifier with probability estimates
+    """
+
+    if isinstance(model, ArrayModel):
+        compact = _from_arrays(model)
+    elif hasattr(model, "pipeline") and hasattr(model.pipeline, "steps"):
+        compact = _from_pipeline(model)
+    else:
+        return None
+    if compact is None or compact.loss not in ("log", "log_loss", "modified_huber"):
+        return None
+    return compact
+
+
+# the compiled models of the loaded models, they are dropped together with the models
+_compiled = weakref.WeakKeyDictionary()
+_NOT_COMPILABLE = object()
+
+
+def get_compiled_model(model) -> Optional[CompactLinearModel]:
+    """compile_model, but every model is only compiled once
+    """
+
+    try:
+        compact = _compiled[model]
+    except KeyError:
+        compact = compile_model(model)
+        _compiled[model] = _NOT_COMPILABLE if compact is None else compact
+    return None if compact is _NOT_COMPILABLE else compact
+
+
+def top_k(probas: np.ndarray, k: int) -> np.ndarray:
+    """The columns of the k highest probabilities of every row, the highest first. Only the k
+    columns are sorted instead of all of them
+
+    Arguments:
+        probas {np.ndarray} -- Shape (n_samples, n_classes)
+        k {int}
+
+    Returns:
+        np.ndarray -- Shape (n_samples, min(k, n_classes))
+    """
+
+    k = min(k, probas.shape[1])
+    if k < probas.shape[1]:
+        idx = np.argpartition(-probas, k - 1, axis=1)[:, :k]
+    else:
+        idx = np.broadcast_to(np.arange(k), probas.shape)
+    order = np.argsort(-np.take_along_axis(probas, idx, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(idx, order, axis=1)
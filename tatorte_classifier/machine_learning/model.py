@@ -1,20 +1,102 @@
-from sklearn.feature_extraction.text import TfidfVectorizer
+import re
+
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer, TfidfVectorizer
 from sklearn.pipeline import Pipeline
 
 from nltk.corpus import stopwords
 from nltk.stem import SnowballStemmer
 
+# the token pattern of the default analyzer of the TfidfVectorizer
+TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+# the vect_params of an incremental model, which belong to its TfidfTransformer
+TFIDF_TRANSFORMER_PARAMS = {"norm", "use_idf", "smooth_idf", "sublinear_tf"}
+# the default number of columns of the hashed feature space of an incremental model
+N_HASHED_FEATURES = 2 ** 20
+
+
+class StemmingAnalyzer:
+    def __init__(
+        self, language: str = "german", ignore_stopwords: bool = True, max_cache_size: int = 200000
+    ):
+        """Splits a document into tokens like the default analyzer of the TfidfVectorizer and
+        stems them. Stems are memoized in a bounded dict, because most tokens of the texts
+        repeat. When the cache is full, new tokens are stemmed but not cached anymore.
+
+        Keyword Arguments:
+            language {str} -- The language of the SnowballStemmer (default: {"german"})
+            ignore_stopwords {bool} -- Whether stopwords are left unstemmed (default: {True})
+            max_cache_size {int} -- Maximum number of cached stems (default: {200000})
+        """
+
+        self.language = language
+        self.ignore_stopwords = ignore_stopwords
+        self.max_cache_size = max_cache_size
+        self.cache = {}
+        self.n_tokens = 0
+        self.n_stemmed = 0
+        self._stemmer = SnowballStemmer(language, ignore_stopwords=ignore_stopwords)
+
+    def __call__(self, doc: str) -> list:
+        cache = self.cache
+        tokens = TOKEN_PATTERN.findall(doc.lower())
+        stems = [cache.get(token) for token in tokens]
+        self.n_tokens += len(tokens)
+        for i, stem in enumerate(stems):
+            if stem is None:
+                stem = self._stemmer.stem(tokens[i])
+                self.n_stemmed += 1
+                if len(cache) < self.max_cache_size:
+                    cache[tokens[i]] = stem
+                stems[i] = stem
+        return stems
+
+    def stats(self) -> dict:
+        """Returns:
+            dict -- the number of tokens, the cache size and the hit rate of the cache
+        """
+
+        return {
+            "tokens": self.n_tokens,
+            "cache_size": len(self.cache),
+            "hit_rate": 1 - self.n_stemmed / self.n_tokens if self.n_tokens else 0.0,
+        }
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_stemmer"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._stemmer = SnowballStemmer(self.language, ignore_stopwords=self.ignore_stopwords)
+
 
 class Model:
-    def __init__(self, clf: str, clf_params: dict, vect_params: dict, scale_params: dict = {}):
+    def __init__(
+        self,
+        clf: str,
+        clf_params: dict,
+        vect_params: dict,
+        scale_params: dict = {},
+        incremental: bool = False,
+    ):
         """[summary]
  
         Arguments:
             clf {str} -- The Classifier. Options are sgd, nn, svm
             clf_params {dict} -- The params for the classifier
             vect_params {dict} -- The params for the TfidfVectorizer
+
+        Keyword Arguments:
+            incremental {bool} -- Use a HashingVectorizer with a fixed number of features
+                                  (vect_params n_features) and a TfidfTransformer instead of the
+                                  TfidfVectorizer, so the classifier can be updated with
+                                  partial_fit later. Only sgd (default: {False})
         """
 
+        if incremental and clf != "sgd":
+            raise ValueError("Only sgd models can be incremental")
+        self.incremental = incremental
         self.stemmer = self._build_stemmer()
         self.pipeline = self._build_pipeline(clf, clf_params, vect_params, scale_params)
 
@@ -22,23 +104,49 @@ class Model:
         return self.pipeline.predict(x)
 
     def _build_stemmer(self):
-        stemmer = SnowballStemmer("german", ignore_stopwords=True)
-        analyzer = TfidfVectorizer().build_analyzer()
-
-        def stemmed_words(doc):
-            return (stemmer.stem(w) for w in analyzer(doc))
-
-        return stemmed_words
+        return StemmingAnalyzer("german", ignore_stopwords=True)
 
-    def _build_pipeline(self, clf, clf_params, vect_params, scale_params):
-        pipeline_steps = [
+    def _build_vectorizer_steps(self, vect_params: dict) -> list:
+        if not self.incremental:
+            return [
+                (
+                    "vect",
+                    TfidfVectorizer(
+                        stop_words=set(stopwords.words("german")),
+                        analyzer=self.stemmer,
+                        **vect_params
+                    ),
+                )
+            ]
+        # hashing needs no vocabulary, so texts with new words can be learned without changing
+        # the columns. The idf is fitted with the classifier and stays fixed for the updates
+        hashing_params = {
+            name: value
+            for name, value in vect_params.items()
+            if name not in TFIDF_TRANSFORMER_PARAMS
+        }
+        hashing_params.setdefault("n_features", N_HASHED_FEATURES)
+        return [
             (
                 "vect",
-                TfidfVectorizer(
-                    stop_words=set(stopwords.words("german")), analyzer=self.stemmer, **vect_params
+                HashingVectorizer(
+                    analyzer=self.stemmer, alternate_sign=False, norm=None, **hashing_params
+                ),
+            ),
+            (
+                "tfidf",
+                TfidfTransformer(
+                    **{
+                        name: value
+                        for name, value in vect_params.items()
+                        if name in TFIDF_TRANSFORMER_PARAMS
+                    }
                 ),
-            )
+            ),
         ]
+
+    def _build_pipeline(self, clf, clf_params, vect_params, scale_params):
+        pipeline_steps = self._build_vectorizer_steps(vect_params)
         if clf == "sgd":
             from sklearn.linear_model import SGDClassifier
 
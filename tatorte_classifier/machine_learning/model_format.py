@@ -0,0 +1,489 @@
+"""
+Usage:
+    from tatorte_classifier.machine_learning.model_format import load_model_dir, save_model_dir
+
+    save_model_dir(model, "models/model-8d5e4706")
+    model = load_model_dir("models/model-8d5e4706")
+    model.pipeline.predict_proba(descs)
+
+A model directory contains a manifest.json and the arrays of the model as .npy files:
+    vocabulary_terms.npy    -- the terms of the vocabulary as sorted utf-8 bytes
+    vocabulary_columns.npy  -- the column of every term in the tf-idf matrix
+    idf.npy                 -- the idf vector (if the vectorizer uses idf)
+    coef.npy, intercept.npy -- the weights of a linear classifier (sgd)
+    coefs_<i>.npy, intercepts_<i>.npy -- the weights of the layers of a neural network (nn)
+
+The arrays are memory mapped when the model is loaded, so loading is nearly instant and all
+processes serving the same model share its pages. The predictions are computed with numpy and
+scipy like the sklearn pipeline does, so the format doesn't depend on the sklearn version the
+model was trained with. Models which can't be stored as arrays (svm, models with another
+analyzer) are stored as model.sav with dill in the same directory.
+
+Old .sav models are converted into a model directory once by convert_model_file, so their
+arrays are shared by the processes, too.
+"""
+import io
+import os
+import json
+import fcntl
+import shutil
+import zipfile
+from typing import Tuple
+
+import dill
+import numpy as np
+import scipy.sparse as sp
+from scipy.special import expit
+
+from tatorte_classifier.machine_learning.model import StemmingAnalyzer
+
+FORMAT_VERSION = 1
+MANIFEST = "manifest.json"
+PICKLE_FILE = "model.sav"
+
+
+class ArrayVectorizer:
+    def __init__(self, analyzer, terms, columns, idf, n_features, binary, norm, sublinear_tf):
+        """The transform of a fitted TfidfVectorizer
+
+        Arguments:
+            analyzer {StemmingAnalyzer} -- Splits a document into stemmed tokens
+            terms {np.ndarray} -- The sorted terms of the vocabulary as utf-8 bytes
+            columns {np.ndarray} -- The column of every term
+            idf {np.ndarray} -- The idf vector or None
+            n_features {int} -- The number of columns
+            binary {bool} -- Whether all non zero term counts are set to 1
+            norm {str} -- l1, l2 or None
+            sublinear_tf {bool} -- Whether the term counts are replaced by 1 + log(count)
+        """
+
+        self.analyzer = analyzer
+        self.terms = terms
+        self.columns = columns
+        self.idf = idf
+        self.n_features = n_features
+        self.binary = binary
+        self.norm = norm
+        self.sublinear_tf = sublinear_tf
+
+    def lookup(self, tokens: list) -> np.ndarray:
+        """Get the columns of the tokens, -1 for tokens which are not in the vocabulary
+        """
+
+        columns = np.full(len(tokens), -1, dtype=np.int64)
+        if not tokens or not len(self.terms):
+            return columns
+        max_len = self.terms.dtype.itemsize
+        encoded = [token.encode("utf-8") for token in tokens]
+        # tokens longer than the longest term would be truncated by numpy and can't be terms
+        short = np.fromiter((len(token) <= max_len for token in encoded), bool, len(encoded))
+        candidates = np.array(
+            [token for token, is_short in zip(encoded, short) if is_short], dtype=self.terms.dtype
+        )
+        positions = np.minimum(np.searchsorted(self.terms, candidates), len(self.terms) - 1)
+        found = self.terms[positions] == candidates
+        columns[np.flatnonzero(short)[found]] = self.columns[positions[found]]
+        return columns
+
+    def transform(self, docs) -> sp.csr_matrix:
+        tokens = [self.analyzer(doc) for doc in docs]
+        lengths = np.fromiter((len(doc_tokens) for doc_tokens in tokens), np.int64, len(tokens))
+        rows = np.repeat(np.arange(len(tokens)), lengths)
+        columns = self.lookup([token for doc_tokens in tokens for token in doc_tokens])
+        known = columns >= 0
+        rows = rows[known]
+        columns = columns[known]
+
+        X = sp.csr_matrix(
+            (np.ones(len(columns)), (rows, columns)), shape=(len(tokens), self.n_features)
+        )
+        X.sum_duplicates()
+        if self.binary:
+            X.data[:] = 1
+        if self.sublinear_tf:
+            np.log(X.data, X.data)
+            X.data += 1
+        if self.idf is not None:
+            X.data *= self.idf[X.indices]
+        if self.norm is not None:
+            if self.norm == "l2":
+                norms = np.sqrt(np.asarray(X.multiply(X).sum(axis=1)).ravel())
+            else:
+                norms = np.asarray(abs(X).sum(axis=1)).ravel()
+            norms[norms == 0] = 1
+            X.data /= np.repeat(norms, np.diff(X.indptr))
+        return X
+
+
+def _softmax(x):
+    x = np.exp(x - x.max(axis=1)[:, np.newaxis])
+    return x / x.sum(axis=1)[:, np.newaxis]
+
+
+ACTIVATIONS = {
+    "identity": lambda x: x,
+    "logistic": expit,
+    "tanh": np.tanh,
+    "relu": lambda x: np.maximum(x, 0),
+    "softmax": _softmax,
+}
+
+
+def linear_proba(scores: np.ndarray, loss: str) -> np.ndarray:
+    """The probabilities of the decision function of a SGDClassifier like its predict_proba
+
+    Arguments:
+        scores {np.ndarray} -- Shape (n_samples, n_classes), (n_samples,) for 2 classes
+        loss {str} -- The loss the classifier was trained with
+
+    Raises:
+        ValueError: If the loss has no probability estimates
+
+    Returns:
+        np.ndarray -- Shape (n_samples, n_classes)
+    """
+
+    binary = scores.ndim == 1
+    if loss in ("log", "log_loss"):
+        prob = expit(scores)
+        if binary:
+            return np.vstack([1 - prob, prob]).T
+        return prob / prob.sum(axis=1)[:, np.newaxis]
+    if loss == "modified_huber":
+        prob = (np.clip(scores, -1, 1) + 1) / 2
+        if binary:
+            return np.vstack([1 - prob, prob]).T
+        prob_sum = prob.sum(axis=1)
+        all_zero = prob_sum == 0
+        prob[all_zero] = 1
+        prob_sum[all_zero] = scores.shape[1]
+        return prob / prob_sum[:, np.newaxis]
+    raise ValueError("probability estimates are not available for loss={!r}".format(loss))
+
+
+class ArrayLinearClassifier:
+    def __init__(self, classes, coef, intercept, loss):
+        """predict_proba of a fitted SGDClassifier
+
+        Arguments:
+            classes {np.ndarray}
+            coef {np.ndarray} -- Shape (n_classes, n_features), (1, n_features) for 2 classes
+            intercept {np.ndarray}
+            loss {str} -- The loss the classifier was trained with
+        """
+
+        self.classes_ = classes
+        self.coef = coef
+        self.intercept = intercept
+        self.loss = loss
+
+    def decision_function(self, X) -> np.ndarray:
+        scores = X.dot(self.coef.T) + self.intercept
+        return scores.ravel() if scores.shape[1] == 1 else scores
+
+    def predict_proba(self, X) -> np.ndarray:
+        return linear_proba(self.decision_function(X), self.loss)
+
+    def predict(self, X) -> np.ndarray:
+        scores = self.decision_function(X)
+        if scores.ndim == 1:
+            return self.classes_[(scores > 0).astype(int)]
+        return self.classes_[scores.argmax(axis=1)]
+
+
+class ArrayMLPClassifier:
+    def __init__(self, classes, coefs, intercepts, activation, out_activation):
+        """predict_proba of a fitted MLPClassifier
+
+        Arguments:
+            classes {np.ndarray}
+            coefs {list} -- The weight matrices of the layers
+            intercepts {list} -- The bias vectors of the layers
+            activation {str} -- The activation of the hidden layers
+            out_activation {str} -- The activation of the output layer
+        """
+
+        self.classes_ = classes
+        self.coefs = coefs
+        self.intercepts = intercepts
+        self.activation = activation
+        self.out_activation = out_activation
+
+    def predict_proba(self, X) -> np.ndarray:
+        activation = X
+        last = len(self.coefs) - 1
+        for i, (coef, intercept) in enumerate(zip(self.coefs, self.intercepts)):
+            activation = activation.dot(coef) + intercept
+            activation = ACTIVATIONS[self.out_activation if i == last else self.activation](
+                activation
+            )
+        if len(self.classes_) == 2:
+            activation = activation.ravel()
+            return np.vstack([1 - activation, activation]).T
+        return activation
+
+    def predict(self, X) -> np.ndarray:
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+
+class ArrayPipeline:
+    def __init__(self, vectorizer, classifier):
+        self.vectorizer = vectorizer
+        self.classifier = classifier
+        self.classes_ = classifier.classes_
+
+    def predict_proba(self, docs) -> np.ndarray:
+        return self.classifier.predict_proba(self.vectorizer.transform(docs))
+
+    def predict(self, docs) -> np.ndarray:
+        return self.classifier.predict(self.vectorizer.transform(docs))
+
+
+class ArrayModel:
+    def __init__(self, pipeline: ArrayPipeline, manifest: dict):
+        """A model loaded from the arrays of a model directory. It has the interface of Model
+        needed for predictions
+        """
+
+        self.pipeline = pipeline
+        self.stemmer = pipeline.vectorizer.analyzer
+        self.manifest = manifest
+
+    def __call__(self, x):
+        return self.pipeline.predict(x)
+
+
+def _model_arrays(model) -> Tuple[dict, dict]:
+    """The manifest entries and the arrays of a model, None if it can't be stored as arrays
+    """
+
+    steps = dict(model.pipeline.steps)
+    vect = steps["vect"]
+    clf = steps["clf"]
+    if not isinstance(vect.analyzer, StemmingAnalyzer) or set(steps) != {"vect", "clf"}:
+        return None
+
+    vocabulary = sorted((term.encode("utf-8"), column) for term, column in vect.vocabulary_.items())
+    max_len = max((len(term) for term, _ in vocabulary), default=1)
+    arrays = {
+        "vocabulary_terms": np.array([term for term, _ in vocabulary], dtype="S{}".format(max_len)),
+        "vocabulary_columns": np.array([column for _, column in vocabulary], dtype=np.int64),
+    }
+    if vect.use_idf:
+        arrays["idf"] = np.asarray(vect.idf_)
+    manifest = {
+        "analyzer": {
+            "language": vect.analyzer.language,
+            "ignore_stopwords": vect.analyzer.ignore_stopwords,
+        },
+        "vectorizer": {
+            "n_features": len(vect.vocabulary_),
+            "binary": bool(vect.binary),
+            "norm": vect.norm,
+            "sublinear_tf": bool(vect.sublinear_tf),
+        },
+        "classes": clf.classes_.tolist(),
+    }
+
+    clf_type = type(clf).__name__
+    if clf_type == "SGDClassifier":
+        manifest["classifier"] = {"type": "linear", "loss": clf.loss}
+        arrays["coef"] = np.asarray(clf.coef_)
+        arrays["intercept"] = np.asarray(clf.intercept_)
+    elif clf_type == "MLPClassifier":
+        manifest["classifier"] = {
+            "type": "mlp",
+            "activation": clf.activation,
+            "out_activation": clf.out_activation_,
+            "n_layers": len(clf.coefs_),
+        }
+        for i, (coef, intercept) in enumerate(zip(clf.coefs_, clf.intercepts_)):
+            arrays["coefs_{}".format(i)] = coef
+            arrays["intercepts_{}".format(i)] = intercept
+    else:
+        return None
+    if "idf" in arrays:
+        # the idf has the precision of the weights, e.g. float32 for compacted models
+        weights = arrays["coef"] if "coef" in arrays else arrays["coefs_0"]
+        arrays["idf"] = arrays["idf"].astype(weights.dtype)
+    return manifest, arrays
+
+
+def save_model_dir(model, path: str, metadata: dict = None) -> None:
+    """Save a model as model directory. The directory is written next to path first and then
+    renamed, so a loading process never sees a half written model
+
+    Arguments:
+        model {Model} -- The trained model
+        path {str} -- The path of the directory
+
+    Keyword Arguments:
+        metadata {dict} -- Stored in the manifest as "metadata" (default: {None})
+    """
+
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    model_arrays = _model_arrays(model)
+    if model_arrays is None:
+        manifest = {"type": "pickle", "file": PICKLE_FILE}
+        with open(os.path.join(tmp_path, PICKLE_FILE), "wb") as f:
+            dill.dump(model, f)
+    else:
+        manifest, arrays = model_arrays
+        manifest["type"] = "arrays"
+        manifest["arrays"] = {}
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_path, name + ".npy"), np.ascontiguousarray(array))
+            manifest["arrays"][name] = name + ".npy"
+    manifest["format_version"] = FORMAT_VERSION
+    if metadata is not None:
+        manifest["metadata"] = metadata
+    # the manifest is written last, a directory without manifest is incomplete
+    with open(os.path.join(tmp_path, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    if os.path.exists(path):
+        old_path = path + ".old"
+        shutil.rmtree(old_path, ignore_errors=True)
+        os.rename(path, old_path)
+        os.rename(tmp_path, path)
+        # processes which mapped the old arrays keep them until they are unmapped
+        shutil.rmtree(old_path, ignore_errors=True)
+    else:
+        os.rename(tmp_path, path)
+
+
+def load_model_dir(path: str, mmap: bool = True):
+    """Load a model directory
+
+    Arguments:
+        path {str} -- The path of the directory
+
+    Keyword Arguments:
+        mmap {bool} -- Whether the arrays are memory mapped (default: {True})
+
+    Raises:
+        ValueError: If the model directory has an unknown format version
+
+    Returns:
+        ArrayModel or Model -- Model for models stored with dill
+    """
+
+    manifest = read_manifest(path)
+    if manifest.get("format_version") != FORMAT_VERSION:
+        raise ValueError("Unknown model format version {}".format(manifest.get("format_version")))
+    if manifest["type"] == "pickle":
+        with open(os.path.join(path, manifest["file"]), "rb") as f:
+            return dill.load(f)
+
+    mmap_mode = "r" if mmap else None
+    arrays = {
+        name: np.load(os.path.join(path, filename), mmap_mode=mmap_mode)
+        for name, filename in manifest["arrays"].items()
+    }
+    vectorizer = ArrayVectorizer(
+        StemmingAnalyzer(**manifest["analyzer"]),
+        arrays["vocabulary_terms"],
+        arrays["vocabulary_columns"],
+        arrays.get("idf"),
+        **manifest["vectorizer"]
+    )
+    classes = np.asarray(manifest["classes"])
+    clf_manifest = manifest["classifier"]
+    if clf_manifest["type"] == "linear":
+        classifier = ArrayLinearClassifier(
+            classes, arrays["coef"], arrays["intercept"], clf_manifest["loss"]
+        )
+    else:
+        n_layers = clf_manifest["n_layers"]
+        classifier = ArrayMLPClassifier(
+            classes,
+            [arrays["coefs_{}".format(i)] for i in range(n_layers)],
+            [arrays["intercepts_{}".format(i)] for i in range(n_layers)],
+            clf_manifest["activation"],
+            clf_manifest["out_activation"],
+        )
+    return ArrayModel(ArrayPipeline(vectorizer, classifier), manifest)
+
+
+def read_manifest(path: str) -> dict:
+    with open(os.path.join(path, MANIFEST)) as f:
+        return json.load(f)
+
+
+def convert_model_file(model_path: str, path: str) -> str:
+    """Convert a model pickled with dill into a model directory, so its arrays can be memory
+    mapped and shared by all processes. Only one process converts the model, the others wait
+    for the file lock and use the converted model. The model is converted again when the
+    modification time of the pickle changes
+
+    Arguments:
+        model_path {str} -- The path of the .sav file
+        path {str} -- The path of the model directory
+
+    Returns:
+        str -- The path of the model directory
+    """
+
+    source = {"file": os.path.basename(model_path), "mtime": os.stat(model_path).st_mtime}
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            converted = is_model_dir(path) and read_manifest(path).get("metadata") == {
+                "source": source
+            }
+            if not converted:
+                with open(model_path, "rb") as f:
+                    model = dill.load(f)
+                save_model_dir(model, path, metadata={"source": source})
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+    return path
+
+
+def is_model_dir(path: str) -> bool:
+    return os.path.isfile(os.path.join(path, MANIFEST))
+
+
+def is_being_saved(path: str) -> bool:
+    """Whether save_model_dir is writing the model directory, path is missing for a moment
+    while an existing directory is replaced
+    """
+
+    return os.path.isdir(path + ".tmp")
+
+
+def model_mtime(path: str) -> float:
+    """The modification time of a model file or of the manifest of a model directory, which is
+    written last, without listing the files of the directory
+    """
+
+    if os.path.isdir(path):
+        path = os.path.join(path, MANIFEST)
+    return os.stat(path).st_mtime
+
+
+def model_dir_stat(path: str) -> Tuple[float, int]:
+    """The modification time of the manifest and the summed size of the files of a model
+    directory
+    """
+
+    mtime = model_mtime(path)
+    size = sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+    return mtime, size
+
+
+def zip_model_dir(path: str) -> io.BytesIO:
+    """Zip a model directory in memory for downloading it
+    """
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
+        for entry in sorted(os.scandir(path), key=lambda entry: entry.name):
+            if entry.is_file():
+                zip_file.write(entry.path, os.path.join(os.path.basename(path), entry.name))
+    buffer.seek(0)
+    return buffer
@@ -0,0 +1,242 @@
+"""
+Usage:
+    from tatorte_classifier.machine_learning.model_registry import model_registry
+
+    model = model_registry.get("model-8d5e4706.sav")
+    model_registry.stats()
+
+The registry keeps deserialized models in memory, so a prediction does not have to load the
+model file on every request. Models are evicted least recently used first as soon as the
+configured number of models or the byte budget is exceeded and are reloaded when the
+modification time of their file (the manifest of a model directory) changes.
+"""
+import os
+import time
+import logging
+from collections import OrderedDict
+from threading import Lock
+from typing import Callable, Optional, Tuple
+
+from configuration import MODEL_DIR, MODEL_CACHE_SIZE, MODEL_CACHE_MAX_BYTES
+from tatorte_classifier.machine_learning.get_prediction import load_model
+from tatorte_classifier.machine_learning.model import Model
+from tatorte_classifier.machine_learning.model_format import (
+    ArrayModel,
+    model_dir_stat,
+    model_mtime,
+)
+from tatorte_classifier.metrics import MODEL_LOAD_SECONDS, metrics
+
+logger = logging.getLogger(__name__)
+
+
+class _CachedModel:
+    def __init__(self, model: Model, mtime: float, size: int):
+        self.model = model
+        self.mtime = mtime
+        self.size = size
+
+
+class ModelRegistry:
+    def __init__(
+        self,
+        loader: Callable[[str], Model],
+        model_dir: str,
+        max_models: int = 4,
+        max_bytes: int = 0,
+    ):
+        """LRU cache for deserialized models
+
+        Arguments:
+            loader {Callable} -- Loads a model given its filename in model_dir
+            model_dir {str} -- The directory the model files are stored in
+
+        Keyword Arguments:
+            max_models {int} -- Maximum number of models kept in memory (default: {4})
+            max_bytes {int} -- Maximum summed file size of the models kept in memory. The file
+                               size is used as an estimate for the memory a model needs.
+                               0 means no limit (default: {0})
+        """
+
+        self.loader = loader
+        self.model_dir = model_dir
+        self.max_models = max_models
+        self.max_bytes = max_bytes
+        self._models = OrderedDict()
+        self._lock = Lock()
+        self._loading_locks = {}
+        self._hits = 0
+        self._misses = 0
+        self._reloads = 0
+        self._evictions = 0
+        self._load_time = 0.0
+        self._last_load_time = 0.0
+
+    def get(self, model_id: str) -> Model:
+        """Get a model from memory or load it, if it is not loaded or its file changed
+
+        Arguments:
+            model_id {str} -- The filename of the model
+
+        Returns:
+            Model -- The loaded model
+        """
+
+        try:
+            mtime, size = self._stat(model_id)
+        except OSError:
+            # let the loader decide what to do with missing models, but don't cache them
+            with self._lock:
+                self._misses += 1
+            return self.loader(model_id)
+
+        with self._lock:
+            cached = self._models.get(model_id)
+            if cached is not None and cached.mtime == mtime:
+                self._models.move_to_end(model_id)
+                self._hits += 1
+                return cached.model
+            self._misses += 1
+            loading_lock = self._loading_locks.setdefault(model_id, Lock())
+
+        with loading_lock:
+            # another thread could have loaded the model while we were waiting
+            with self._lock:
+                cached = self._models.get(model_id)
+                if cached is not None and cached.mtime == mtime:
+                    self._models.move_to_end(model_id)
+                    return cached.model
+                if cached is not None:
+                    self._reloads += 1
+                    logger.info("Model file %s changed, reloading it", model_id)
+
+            start = time.perf_counter()
+            try:
+                model = self.loader(model_id)
+                load_time = time.perf_counter() - start
+                MODEL_LOAD_SECONDS.observe(load_time)
+
+                with self._lock:
+                    self._load_time += load_time
+                    self._last_load_time = load_time
+                    self._models[model_id] = _CachedModel(model, mtime, size)
+                    self._models.move_to_end(model_id)
+                    self._evict()
+            finally:
+                # also if the model is corrupt, otherwise every bad id would leak a lock
+                with self._lock:
+                    self._loading_locks.pop(model_id, None)
+        logger.info("Loaded model %s in %.3fs", model_id, load_time)
+        return model
+
+    def version(self, model_id: str) -> Optional[float]:
+        """The modification time of a model file, which changes whenever the model is replaced
+
+        Arguments:
+            model_id {str} -- The filename of the model
+
+        Returns:
+            Optional[float] -- The modification time or None, if the model doesn't exist
+        """
+
+        try:
+            # a stat of the manifest, this is called for every cached prediction
+            return model_mtime(os.path.join(self.model_dir, model_id))
+        except OSError:
+            return None
+
+    def _stat(self, model_id: str) -> Tuple[float, int]:
+        path = os.path.join(self.model_dir, model_id)
+        if os.path.isdir(path):
+            return model_dir_stat(path)
+        stat = os.stat(path)
+        return stat.st_mtime, stat.st_size
+
+    def evict(self, model_id: str) -> None:
+        """Remove a model from memory
+
+        Arguments:
+            model_id {str} -- The filename of the model
+        """
+
+        with self._lock:
+            self._models.pop(model_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._models.clear()
+
+    def stats(self) -> dict:
+        """Statistics about the cached models
+
+        Returns:
+            dict -- hits, misses, reloads, evictions, load times, the currently cached models and
+                    the statistics of their stem caches
+        """
+
+        with self._lock:
+            requests = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / requests if requests else 0.0,
+                "reloads": self._reloads,
+                "evictions": self._evictions,
+                "load_time_total": self._load_time,
+                "load_time_last": self._last_load_time,
+                "cached_models": list(self._models.keys()),
+                # models with memory mapped arrays, which are shared by all processes
+                "shared_models": [
+                    model_id
+                    for model_id, cached in self._models.items()
+                    if isinstance(cached.model, ArrayModel)
+                ],
+                "stem_caches": {
+                    model_id: cached.model.stemmer.stats()
+                    for model_id, cached in self._models.items()
+                    if hasattr(getattr(cached.model, "stemmer", None), "stats")
+                },
+                "cached_bytes": self._cached_bytes(),
+                "max_models": self.max_models,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _cached_bytes(self) -> int:
+        return sum(cached.size for cached in self._models.values())
+
+    def _evict(self) -> None:
+        # the most recently used model is never evicted, even if it exceeds the byte budget
+        while len(self._models) > 1 and (
+            len(self._models) > self.max_models
+            or (self.max_bytes and self._cached_bytes() > self.max_bytes)
+        ):
+            model_id, _ = self._models.popitem(last=False)
+            self._evictions += 1
+            logger.info("Evicted model %s from memory", model_id)
+
+
+model_registry = ModelRegistry(load_model, MODEL_DIR, MODEL_CACHE_SIZE, MODEL_CACHE_MAX_BYTES)
+
+
+@metrics.collector("model_cache_requests_total", "counter", "Model registry lookups by result")
+def _collect_requests():
+    stats = model_registry.stats()
+    return [({"result": "hit"}, stats["hits"]), ({"result": "miss"}, stats["misses"])]
+
+
+@metrics.collector(
+    "model_cache_removals_total", "counter", "Models reloaded or evicted by the model registry"
+)
+def _collect_removals():
+    stats = model_registry.stats()
+    return [({"reason": "reload"}, stats["reloads"]), ({"reason": "eviction"}, stats["evictions"])]
+
+
+@metrics.collector("model_cache_models", "gauge", "Number of models in the model registry")
+def _collect_models():
+    return [({}, len(model_registry.stats()["cached_models"]))]
+
+
+@metrics.collector("model_cache_bytes", "gauge", "File size of the models in the model registry")
+def _collect_bytes():
+    return [({}, model_registry.stats()["cached_bytes"])]
@@ -0,0 +1,372 @@
+"""
+Usage:
+    from tatorte_classifier.machine_learning.prediction_cache import prediction_cache
+
+    preds = prediction_cache.get_prediction_list("current", desc, 3)
+    preds = prediction_cache.get_batch_prediction_lists("model-8d5e4706", descs, 3)
+    prediction_cache.stats()
+
+The prediction cache stores the api predictions of a text, so texts which are classified again
+(e.g. updates of the same press release) skip stemming, tf-idf and predict_proba. The key is the
+filename and the modification time of the model, the number of requested categories and a hash
+of the *preprocessed* text. Replacing a model file changes its modification time, so the old
+predictions are never returned again and are dropped from the cache.
+
+The cache is kept in memory by every server process (least recently used entries are evicted,
+when PREDICTION_CACHE_SIZE is exceeded, and entries expire after PREDICTION_CACHE_TTL seconds)
+or shared by all processes in redis, if PREDICTION_CACHE_URL is a redis url.
+"""
+import json
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+from threading import Lock
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from configuration import PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL, PREDICTION_CACHE_URL
+from tatorte_classifier.machine_learning.current_model import get_versioned_model
+from tatorte_classifier.machine_learning.get_prediction import (
+    get_batch_prediction_lists,
+    get_prediction_list,
+)
+from tatorte_classifier.machine_learning.model import Model
+from tatorte_classifier.metrics import PREDICTION_STAGE_SECONDS, metrics
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBackend:
+    def __init__(
+        self, max_entries: int, ttl: float = 0, clock: Callable[[], float] = time.monotonic
+    ):
+        """LRU cache in the memory of the server process
+
+        Arguments:
+            max_entries {int} -- Maximum number of cached predictions
+
+        Keyword Arguments:
+            ttl {float} -- Seconds after which an entry expires, 0 means never (default: {0})
+            clock {Callable} -- Returns the current time in seconds (default: {time.monotonic})
+        """
+
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self._evictions = 0
+        self._expirations = 0
+
+    def get_many(self, keys: Sequence[str]) -> list:
+        now = self.clock()
+        values = []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] and entry[0] <= now:
+                    del self._entries[key]
+                    self._expirations += 1
+                    entry = None
+                if entry is None:
+                    values.append(None)
+                else:
+                    self._entries.move_to_end(key)
+                    values.append(entry[1])
+        return values
+
+    def set_many(self, items: dict) -> None:
+        expires = self.clock() + self.ttl if self.ttl else 0
+        with self._lock:
+            for key, value in items.items():
+                self._entries[key] = (expires, value)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, prefix: str) -> int:
+        with self._lock:
+            keys = [key for key in self._entries if key.startswith(prefix)]
+            for key in keys:
+                del self._entries[key]
+        return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "size": len(self._entries),
+                "max_size": self.max_entries,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+            }
+
+
+class RedisBackend:
+    def __init__(self, client, ttl: float = 0, namespace: str = "predictions:"):
+        """Cache in redis (or any server speaking its protocol), shared by all server processes.
+        Eviction is left to redis, configure it with maxmemory and maxmemory-policy allkeys-lru
+
+        Arguments:
+            client {redis.Redis} -- The redis client
+
+        Keyword Arguments:
+            ttl {float} -- Seconds after which an entry expires, 0 means never (default: {0})
+            namespace {str} -- Prefix of all keys of the cache (default: {"predictions:"})
+        """
+
+        self.client = client
+        self.ttl = ttl
+        self.namespace = namespace
+
+    @classmethod
+    def from_url(cls, url: str, ttl: float = 0) -> "RedisBackend":
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("PREDICTION_CACHE_URL is a redis url, but redis is not installed")
+        return cls(redis.Redis.from_url(url), ttl)
+
+    def get_many(self, keys: Sequence[str]) -> list:
+        if not keys:
+            return []
+        values = self.client.mget([self.namespace + key for key in keys])
+        return [None if value is None else json.loads(value) for value in values]
+
+    def set_many(self, items: dict) -> None:
+        pipeline = self.client.pipeline()
+        for key, value in items.items():
+            pipeline.set(self.namespace + key, json.dumps(value), ex=int(self.ttl) or None)
+        pipeline.execute()
+
+    def invalidate(self, prefix: str) -> int:
+        keys = list(self.client.scan_iter(match=self.namespace + prefix + "*"))
+        if keys:
+            self.client.delete(*keys)
+        return len(keys)
+
+    def clear(self) -> None:
+        self.invalidate("")
+
+    def stats(self) -> dict:
+        return {"backend": "redis"}
+
+
+class PredictionCache:
+    def __init__(
+        self,
+        backend=None,
+        get_model: Callable[[str], Tuple[str, Optional[float], Model]] = get_versioned_model,
+    ):
+        """Cache for the predictions of the api
+
+        Keyword Arguments:
+            backend {MemoryBackend, RedisBackend} -- Stores the predictions, None disables the
+                                                     cache (default: {None})
+            get_model {Callable} -- Returns the filename, the version and the model for a model
+                                    name (default: {get_versioned_model})
+        """
+
+        self.backend = backend
+        self.get_model = get_model
+        self._lock = Lock()
+        self._versions = {}
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+        self._errors = 0
+
+    def get_prediction_list(self, model_name: str, desc: str, n_classes: int) -> list:
+        """Cached version of get_prediction.get_prediction_list
+
+        Arguments:
+            model_name {str} -- The filename of the model or "current"
+            desc {str} -- The *preprocessed* description
+            n_classes {int} -- The maximum number of classes
+
+        Returns:
+            list -- [{"category": 2, "probability": 0.57}, ...]
+        """
+
+        return self._get(
+            model_name,
+            [desc],
+            n_classes,
+            lambda descs, model: [get_prediction_list(descs[0], model, n_classes)],
+        )[0]
+
+    def get_batch_prediction_lists(
+        self, model_name: str, descs: Sequence[str], n_classes: int
+    ) -> List[list]:
+        """Cached version of get_prediction.get_batch_prediction_lists, only the descriptions
+        which are not cached are predicted
+
+        Arguments:
+            model_name {str} -- The filename of the model or "current"
+            descs {Sequence[str]} -- The *preprocessed* descriptions
+            n_classes {int} -- The maximum number of classes
+
+        Returns:
+            List[list] -- The predictions of every description
+        """
+
+        return self._get(
+            model_name,
+            descs,
+            n_classes,
+            lambda descs, model: get_batch_prediction_lists(descs, model, n_classes),
+        )
+
+    def _get(self, model_name, descs, n_classes, predict) -> List[list]:
+        with PREDICTION_STAGE_SECONDS.time(stage="model"):
+            model_id, version, model = self.get_model(model_name)
+        if self.backend is None or version is None:
+            # the file of the model was removed after it was loaded, it can't be cached
+            return predict(descs, model)
+
+        keys = [self.key(model_id, version, desc, n_classes) for desc in descs]
+        try:
+            self._check_version(model_id, version)
+            with PREDICTION_STAGE_SECONDS.time(stage="cache"):
+                preds = self.backend.get_many(keys)
+        except Exception as err:
+            # an unavailable cache (e.g. redis is down) doesn't fail the predictions
+            self._backend_error("Reading the prediction cache failed", err)
+            return predict(descs, model)
+        missing = [i for i, pred in enumerate(preds) if pred is None]
+        with self._lock:
+            self._hits += len(descs) - len(missing)
+            self._misses += len(missing)
+        if missing:
+            missing_preds = predict([descs[i] for i in missing], model)
+            for i, pred in zip(missing, missing_preds):
+                preds[i] = pred
+            try:
+                with PREDICTION_STAGE_SECONDS.time(stage="cache"):
+                    self.backend.set_many({keys[i]: preds[i] for i in missing})
+            except Exception as err:
+                self._backend_error("Writing the prediction cache failed", err)
+        return preds
+
+    def _backend_error(self, message: str, err: Exception) -> None:
+        with self._lock:
+            self._errors += 1
+        logger.error("%s: %s", message, str(err))
+
+    @staticmethod
+    def key(model_id: str, version: float, desc: str, n_classes: int) -> str:
+        desc_hash = hashlib.sha1(desc.encode("utf-8")).hexdigest()
+        return "{}:{!r}:{}:{}".format(model_id, version, n_classes, desc_hash)
+
+    def _check_version(self, model_id: str, version: float) -> None:
+        # the entries of a replaced model are dropped as soon as its new version is used
+        with self._lock:
+            changed = self._versions.get(model_id, version) != version
+            self._versions[model_id] = version
+        if changed:
+            self.invalidate(model_id)
+            logger.info("Model %s changed, dropped its cached predictions", model_id)
+
+    def invalidate(self, model_id: str) -> int:
+        """Drop the cached predictions of a model
+
+        Arguments:
+            model_id {str} -- The filename of the model
+
+        Returns:
+            int -- The number of dropped predictions
+        """
+
+        if self.backend is None:
+            return 0
+        dropped = self.backend.invalidate(model_id + ":")
+        with self._lock:
+            self._invalidations += 1
+        return dropped
+
+    def clear(self) -> None:
+        if self.backend is not None:
+            self.backend.clear()
+
+    def stats(self) -> dict:
+        """Statistics about the cached predictions
+
+        Returns:
+            dict -- hits, misses and the hit rate (counted per text), invalidations, failed
+                    requests to the backend and the statistics of the backend
+        """
+
+        with self._lock:
+            requests = self._hits + self._misses
+            stats = {
+                "enabled": self.backend is not None,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / requests if requests else 0.0,
+                "invalidations": self._invalidations,
+                "errors": self._errors,
+            }
+        if self.backend is not None:
+            stats.update(self.backend.stats())
+        return stats
+
+
+def create_backend(size: int, ttl: float, url: str = ""):
+    """The backend configured by PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL and
+    PREDICTION_CACHE_URL
+
+    Returns:
+        MemoryBackend, RedisBackend or None, if the cache is disabled
+    """
+
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend.from_url(url, ttl)
+    if size <= 0:
+        return None
+    return MemoryBackend(size, ttl)
+
+
+prediction_cache = PredictionCache(
+    create_backend(PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL, PREDICTION_CACHE_URL)
+)
+
+
+@metrics.collector(
+    "prediction_cache_requests_total",
+    "counter",
+    "Texts looked up in the prediction cache by result",
+)
+def _collect_requests():
+    stats = prediction_cache.stats()
+    return [({"result": "hit"}, stats["hits"]), ({"result": "miss"}, stats["misses"])]
+
+
+@metrics.collector(
+    "prediction_cache_invalidations_total",
+    "counter",
+    "Models whose cached predictions were dropped",
+)
+def _collect_invalidations():
+    return [({}, prediction_cache.stats()["invalidations"])]
+
+
+@metrics.collector(
+    "prediction_cache_errors_total",
+    "counter",
+    "Failed reads and writes of the prediction cache, the texts were predicted uncached",
+)
+def _collect_errors():
+    return [({}, prediction_cache.stats()["errors"])]
+
+
+@metrics.collector(
+    "prediction_cache_size", "gauge", "Number of predictions in the memory prediction cache"
+)
+def _collect_size():
+    stats = prediction_cache.stats()
+    return [({}, stats["size"])] if "size" in stats else []
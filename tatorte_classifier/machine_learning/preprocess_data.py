@@ -1,4 +1,14 @@
 import re
+from multiprocessing import Pool
+from typing import Iterable, List
+
+EMAIL_PATTERN = re.compile(r"\S*@\S*\s?")
+TELEPHONE_PATTERN = re.compile(r"(\(?([\d \-\)\–\+\/\(]+)\)?([ .-–\/]?)([\d]+))")
+LINK_PATTERN = re.compile(
+    r"[-a-zA-Z0-9@:%._\+~#=]{2,256}\.[a-z]{2,6}\b([-a-zA-Z0-9@:%_\+.~#?&//=]*)"
+)
+PUNCTUATION_PATTERN = re.compile(r"[^\w\s]")
+DIGIT_PATTERN = re.compile(r"\d")
 
 
 class DataPreprocessor:
@@ -21,6 +31,12 @@ class DataPreprocessor:
             r"https://",
         ]
         self.remove_keywords_regex = "(" + "|".join(self.keywords_to_remove) + ")"
+        self._keywords_pattern = re.compile(self.remove_keywords_regex)
+        # Removing the keywords and the punctuation afterwards is the same as removing both in
+        # one pass, if the keywords are tried first at every position
+        self._keywords_and_punctuation_pattern = re.compile(
+            self.remove_keywords_regex + "|" + PUNCTUATION_PATTERN.pattern
+        )
 
     def __call__(self, x: str) -> str:
         """This combines all the small preproccessing function together
@@ -36,26 +52,47 @@ class DataPreprocessor:
 
         x = x.lower()
         #  x = x.replace("ß", "ss")
-        x = self._remove_emails(x)
-        x = self._remove_telephone(x)
-        x = self._remove_links(x)
-        x = self._remove_keywords(x)
-        x = self._remove_punctuation(x)
+        # the patterns are only applied, if the text contains a character they need to match
+        if "@" in x:
+            x = self._remove_emails(x)
+        if DIGIT_PATTERN.search(x):
+            x = self._remove_telephone(x)
+        if "." in x:
+            x = self._remove_links(x)
+        x = self._keywords_and_punctuation_pattern.sub("", x)
         return x
 
+    def transform_many(self, x: Iterable[str], n_jobs: int = 1, chunksize: int = 1000) -> List[str]:
+        """Preprocess many descriptions
+
+        Arguments:
+            x {Iterable[str]} -- The raw descriptions
+
+        Keyword Arguments:
+            n_jobs {int} -- Number of processes used for preprocessing. -1 means one process
+                            per cpu (default: {1})
+            chunksize {int} -- Number of descriptions sent to a process at once (default: {1000})
+
+        Returns:
+            List[str] -- The preprocessed descriptions
+        """
+
+        if n_jobs == 1:
+            return [self(i) for i in x]
+        with Pool(None if n_jobs < 0 else n_jobs) as pool:
+            return pool.map(self, x, chunksize)
+
     def _remove_emails(self, x: str) -> str:
-        return re.sub(r"\S*@\S*\s?", "", x)
+        return EMAIL_PATTERN.sub("", x)
 
     def _remove_telephone(self, x: str) -> str:
-        return re.sub(r"(\(?([\d \-\)\–\+\/\(]+)\)?([ .-–\/]?)([\d]+))", "", x)
+        return TELEPHONE_PATTERN.sub("", x)
 
     def _remove_links(self, x: str) -> str:
-        return re.sub(
-            r"[-a-zA-Z0-9@:%._\+~#=]{2,256}\.[a-z]{2,6}\b([-a-zA-Z0-9@:%_\+.~#?&//=]*)", "", x
-        )
+        return LINK_PATTERN.sub("", x)
 
     def _remove_keywords(self, x: str) -> str:
-        return re.sub(self.remove_keywords_regex, "", x)
+        return self._keywords_pattern.sub("", x)
 
     def _remove_punctuation(self, x: str) -> str:
-        return re.sub(r"[^\w\s]", "", x)
+        return PUNCTUATION_PATTERN.sub("", x)
@@ -1,150 +1,452 @@
 import os
+import time
 from typing import Callable, Tuple
 import logging
 
 import dill
 import numpy as np
+from joblib import Parallel, delayed
+from sklearn.base import clone
 from sklearn.metrics import accuracy_score, confusion_matrix
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import StratifiedKFold, train_test_split
+from sklearn.pipeline import Pipeline
 
-from configuration import MODEL_DIR
+from configuration import MODEL_DIR, MODEL_FORMAT
+from tatorte_classifier.machine_learning.cleaning_rules import CleaningRules, cleaning_rules
+from tatorte_classifier.machine_learning.compaction import compact_model
+from tatorte_classifier.machine_learning.feature_store import Features, FeatureStore, snapshot_seed
 from tatorte_classifier.machine_learning.model import Model
+from tatorte_classifier.machine_learning.model_format import save_model_dir
 from tatorte_classifier.machine_learning.preprocess_data import DataPreprocessor
 
 logger = logging.getLogger(__name__)
 
 
-def _change_category(
-    x: np.ndarray, y: np.ndarray, old_category: int, new_category: int, condition: Callable
-) -> np.ndarray:
-    y[np.intersect1d(np.where(condition(x))[0], np.where(y == old_category)[0])] = new_category
-    return y
+def clean_data(
+    x: np.ndarray,
+    y: np.ndarray,
+    n_jobs: int = 1,
+    tokens: np.ndarray = None,
+    rules: CleaningRules = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Apply Data cleaning
+
+    Arguments:
+        x {np.ndarray} -- The texts
+        y {np.ndarray} -- The categories
+
+    Keyword Arguments:
+        n_jobs {int} -- Number of processes used for preprocessing the texts (default: {1})
+        tokens {np.ndarray} -- The already preprocessed and stemmed texts, e.g. from the
+                               FeatureCache. If given, they are returned instead of the
+                               preprocessed texts (default: {None})
+        rules {CleaningRules} -- The rules relabeling and dropping texts
+                                 (default: {the rules loaded from CLEANING_RULES_PATH})
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray] -- The preprocessed texts (or tokens) and categories
+    """
 
+    # automate Data cleaning
+    y, keep = (rules or cleaning_rules).apply(x, y)
+    y = y[keep]
+    if tokens is not None:
+        return tokens[keep], y
+    preprocessed = DataPreprocessor().transform_many(x[keep], n_jobs=n_jobs)
+    # an object array only stores pointers, a str array pads every text to the longest one
+    x = np.empty(len(preprocessed), dtype=object)
+    x[:] = preprocessed
+    return x, y
 
-def _drop_all_containing_keyword(
-    x: np.ndarray, y: np.ndarray, keyword: str, category: int = None
+
+def balance_data(
+    x: np.ndarray, y: np.ndarray, n_per_class: int, random_state: int = None
 ) -> Tuple[np.ndarray, np.ndarray]:
-    """Drop all elements where a keyword in an element text
+    """A function for balancing the data. Given n_per_class the number of elements in each class is reduced to n_elements_per_class
 
     Arguments:
         x {np.ndarray} -- The texts
         y {np.ndarray} -- The categories
-        keyword {str} -- The keyword to filter the elements
+        n_per_class {int} -- The number of elements for each class
 
     Keyword Arguments:
-        category {int} -- If given, it is only filtered from the category given (default: {None})
+        random_state {int} -- Seed for selecting the elements (default: {None})
 
     Returns:
-        Tuple[np.ndarray, np.ndarray] -- The texts and categories
+        Tuple[np.ndarray, np.ndarray] -- Texts and Categories
     """
 
-    str_contain = np.vectorize(lambda x: keyword in x.lower())
-    idxs = np.where(str_contain(x))
-    if category is not None:
-        idxs = np.intersect1d(idxs, np.where(y == category))
-    y = np.delete(y, idxs)
-    x = np.delete(x, idxs)
-    return x, y
+    # select n_per_class random elements of every category and index the data only once
+    rng = np.random.RandomState(random_state)
+    keep = np.zeros(len(y), dtype=bool)
+    for i in np.unique(y):
+        idxs = np.flatnonzero(y == i)
+        if len(idxs) > n_per_class:
+            idxs = rng.choice(idxs, n_per_class, replace=False)
+        keep[idxs] = True
+    return x[keep], y[keep]
 
 
-def clean_data(x: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
-    """Apply Data cleaning
+def create_model(clf: str, clf_params: dict, vect_params: dict, incremental: bool = False) -> Model:
+    model = Model(clf, clf_params, vect_params, incremental=incremental)
+    return model
+
+
+def split_data(
+    x: np.ndarray,
+    y: np.ndarray,
+    test_size: float = 0.3,
+    values_per_category: int = 900,
+    tokens: np.ndarray = None,
+    random_state: int = None,
+    progress: Callable[[str], None] = None,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Clean, balance and split the texts
 
     Arguments:
         x {np.ndarray} -- The texts
         y {np.ndarray} -- The categories
 
+    Keyword Arguments:
+        test_size {float} -- (default: {0.3})
+        values_per_category {int} -- (default: {900})
+        tokens {np.ndarray} -- The already preprocessed and stemmed texts (default: {None})
+        random_state {int} -- Seed for balancing and splitting (default: {None})
+        progress {Callable} -- Called with the name of every stage (default: {None})
+
     Returns:
-        Tuple[np.ndarray, np.ndarray] -- The texts and categories
+        Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray] -- x_train, x_test, y_train, y_test
     """
 
-    # Key:
-    #   1 - Feuer
-    #   2 - Mord
-    #   3 - Überfall/Körperverletzung
-    #   4 - Unfall
-    #   5 - Drogen
-    # automate Data cleaning
-    str_contain = np.vectorize(lambda x: "verkehrskontroll" in x.lower())
-    y = _change_category(x, y, 5, 4, str_contain)
+    logger.info("Preprocessing Data...")
+    logger.info("  Cleaning Data")
+    _report_progress("cleaning", progress)
+    x, y = clean_data(x, y, tokens=tokens)
+    logger.info("  Balancing Data")
+    _report_progress("balancing", progress)
+    x, y = balance_data(x, y, values_per_category, random_state)
+    logger.info("  Splitting Data")
+    split = train_test_split(x, y, test_size=test_size, random_state=random_state)
+    logger.info("Finished Preprocessing!")
+    return split
 
-    str_contain = np.vectorize(lambda x: "eingebroch" in x.lower())
-    y = _change_category(x, y, 4, 3, str_contain)
 
-    x, y = _drop_all_containing_keyword(x, y, "alkohol")
+def _analyzed(doc):
+    # the document is already a list of stemmed tokens, the vectorizer only counts them
+    return doc
 
-    x, y = _drop_all_containing_keyword(x, y, "dienstagmorg", category=3)
 
-    x, y = _drop_all_containing_keyword(x, y, "fahrrad", category=3)
+def token_vectorizer(vectorizer):
+    """An unfitted vectorizer with the params of vectorizer, which takes the already
+    preprocessed and stemmed tokens of the texts (e.g. of the FeatureCache) instead of the texts
+    """
 
-    preprocessor = DataPreprocessor()
-    preprocessor = np.vectorize(preprocessor)
-    x = preprocessor(x)
-    return x, y
+    return type(vectorizer)(**dict(vectorizer.get_params(), analyzer=_analyzed))
 
 
-def balance_data(x: np.ndarray, y: np.ndarray, n_per_class: int) -> Tuple[np.ndarray, np.ndarray]:
-    """A function for balancing the data. Given n_per_class the number of elements in each class is reduced to n_elements_per_class
+def create_features(vectorizer, split: Tuple, analyzed: bool = False) -> Features:
+    """Fit the vectorizer on the training texts and transform the texts of a split
 
     Arguments:
-        x {np.ndarray} -- The texts
-        y {np.ndarray} -- The categories
-        n_per_class {int} -- The number of elements for each class
+        vectorizer {TfidfVectorizer} -- The unfitted vectorizer
+        split {Tuple} -- x_train, x_test, y_train, y_test of split_data
+
+    Keyword Arguments:
+        analyzed {bool} -- Whether the split has the tokens of the texts instead of the texts.
+                           The returned vectorizer analyzes texts anyway (default: {False})
 
     Returns:
-        Tuple[np.ndarray, np.ndarray] -- Texts and Categories
+        Features -- The fitted vectorizer and the tf-idf matrices
     """
 
-    for i in np.unique(y):
-        idxs = np.where(y == i)[0]
-        np.random.shuffle(idxs)
-        idxs = idxs[: (len(idxs) - n_per_class)]
-        x = np.delete(x, idxs)
-        y = np.delete(y, idxs)
-    return x, y
+    x_train, x_test, y_train, y_test = split
+    analyzer = vectorizer.analyzer
+    if analyzed:
+        vectorizer = token_vectorizer(vectorizer)
+    x_train = vectorizer.fit_transform(x_train)
+    x_test = vectorizer.transform(x_test)
+    if analyzed:
+        # the vocabulary and the idf don't depend on the analyzer, the model gets texts again
+        vectorizer.set_params(analyzer=analyzer)
+    logger.info("Fitted vectorizer: %d features", x_train.shape[1])
+    return Features(vectorizer, x_train, x_test, y_train, y_test)
+
+
+def use_vectorizer(model: Model, vectorizer) -> None:
+    """Replace the vectorizer of a model by an already fitted one
+    """
 
+    model.pipeline.steps[0] = ("vect", vectorizer)
+    model.stemmer = vectorizer.analyzer
 
-def create_model(clf: str, clf_params: dict, vect_params: dict) -> Model:
-    model = Model(clf, clf_params, vect_params)
-    return model
+
+def classifier_pipeline(model: Model) -> Pipeline:
+    """The steps of the model after the vectorizer, which work on the tf-idf matrix. Fitting
+    them fits the steps of the model
+    """
+
+    return Pipeline(model.pipeline.steps[1:])
 
 
-def _train_model(x_train: np.ndarray, y_train: np.ndarray, model: Model) -> Model:
-    model.pipeline = model.pipeline.fit(x_train, y_train)
+def _train_model(x_train, y_train: np.ndarray, model: Model) -> Model:
+    # only the classifier is trained, the vectorizer was already fitted by create_features
+    classifier_pipeline(model).fit(x_train, y_train)
     return model
 
 
 def evaluate_model(
-    x_train: np.ndarray, x_test: np.ndarray, y_train: np.ndarray, y_test: np.ndarray, model: Model
+    x_train: np.ndarray,
+    x_test: np.ndarray,
+    y_train: np.ndarray,
+    y_test: np.ndarray,
+    model: Model,
+    labels: np.ndarray = None,
 ) -> Tuple:
+    # the test texts are predicted once for the accuracy and the confusion matrix
+    y_pred = model(x_test)
     return (
         accuracy_score(y_train, model(x_train)),
-        accuracy_score(y_test, model(x_test)),
-        confusion_matrix(y_test, model(x_test)),
+        accuracy_score(y_test, y_pred),
+        confusion_matrix(y_test, y_pred, labels=labels),
     )
 
 
-def save_model(model, model_id):
-    # id = uuid.uuid4().hex[:8]
-    print(os.path.join(MODEL_DIR, "model-{}.sav".format(model_id)))
-    dill.dump(model, open(os.path.join(MODEL_DIR, "model-{}.sav".format(model_id)), "wb"))
-    # return id
+def _fit_fold(steps, x_train, y_train, x_test, y_test, labels) -> dict:
+    """Train the classifier steps on the other folds and evaluate them on one fold. Runs in a
+    joblib worker
+    """
+
+    pipeline = Pipeline([(name, clone(step)) for name, step in steps])
+    start = time.perf_counter()
+    pipeline.fit(x_train, y_train)
+    fit_time = time.perf_counter() - start
+    y_pred = pipeline.predict(x_test)
+    return {
+        "test_acc": accuracy_score(y_test, y_pred),
+        "fit_time": fit_time,
+        "confusion_matrix": confusion_matrix(y_test, y_pred, labels=labels),
+    }
+
+
+def _fold_features(model: Model, x, folds, analyzed: bool = False):
+    """The features of the training folds and the held-out fold of every fold. The vectorizer
+    is fitted on the training folds only, so the held-out fold doesn't leak into the vocabulary
+    and the idf
+    """
+
+    if model.incremental:
+        # the hashed term counts have no vocabulary, the TfidfTransformer is a classifier step
+        for train, test in folds:
+            yield x[train], x[test]
+        return
+
+    # the texts are analyzed once, the vectorizers of the folds count the tokens
+    vectorizer = model.pipeline.steps[0][1]
+    docs = x
+    if not analyzed:
+        docs = np.empty(len(x), dtype=object)
+        docs[:] = [vectorizer.analyzer(doc) for doc in x]
+    for train, test in folds:
+        fold_vectorizer = token_vectorizer(vectorizer)
+        yield fold_vectorizer.fit_transform(docs[train]), fold_vectorizer.transform(docs[test])
+
+
+def cross_validate(
+    model: Model,
+    x,
+    y: np.ndarray,
+    n_folds: int = 5,
+    n_jobs: int = 1,
+    random_state: int = None,
+    analyzed: bool = False,
+) -> dict:
+    """Stratified k-fold cross-validation of a model. The vectorizer is fitted on the training
+    folds of every fold (the texts are stemmed only once) and the classifiers of the folds are
+    trained in parallel
 
+    Arguments:
+        model {Model} -- The model, its vectorizer and classifier steps are cloned for every fold
+        x {np.ndarray} -- The preprocessed training texts (or their tokens), the hashed term
+                          counts for an incremental model
+        y {np.ndarray} -- The categories
 
-def train_model(x, y, clf, clf_params, vect_params, test_size=0.3, values_per_category=900):
-    logger.info("Preprocessing Data...")
-    logger.info("  Cleaning Data")
-    x, y = clean_data(x, y)
-    logger.info("  Balancing Data")
-    x, y = balance_data(x, y, values_per_category)
-    logger.info("  Splitting Data")
-    x_train, x_test, y_train, y_test = train_test_split(x, y, test_size=test_size)
-    logger.info("Finished Preprocessing!")
-    model = create_model(clf, clf_params, vect_params)
+    Keyword Arguments:
+        n_folds {int} -- (default: {5})
+        n_jobs {int} -- Number of processes training folds, -1 for all cores (default: {1})
+        random_state {int} -- Seed for assigning the texts to the folds (default: {None})
+        analyzed {bool} -- Whether x has the tokens of the texts instead of the texts
+                           (default: {False})
+
+    Returns:
+        dict -- The test accuracy and fit time of every fold, their mean and standard deviation
+                and the confusion matrix summed over the folds
+    """
+
+    labels = np.unique(y)
+    folds = list(
+        StratifiedKFold(n_folds, shuffle=True, random_state=random_state).split(
+            np.zeros(len(y)), y
+        )
+    )
+    # the pool of the multiprocessing backend is terminated at the end, like in the search
+    with Parallel(n_jobs=n_jobs, backend="multiprocessing") as parallel:
+        results = parallel(
+            delayed(_fit_fold)(
+                classifier_pipeline(model).steps, x_train, y[train], x_test, y[test], labels
+            )
+            for (train, test), (x_train, x_test) in zip(
+                folds, _fold_features(model, x, folds, analyzed)
+            )
+        )
+    test_accs = [result["test_acc"] for result in results]
+    fit_times = [result["fit_time"] for result in results]
+    return {
+        "folds": [
+            {"test_acc": test_acc, "fit_time": fit_time}
+            for test_acc, fit_time in zip(test_accs, fit_times)
+        ],
+        "mean_test_acc": float(np.mean(test_accs)),
+        "std_test_acc": float(np.std(test_accs)),
+        "mean_fit_time": float(np.mean(fit_times)),
+        "confusion_matrix": sum(result["confusion_matrix"] for result in results).tolist(),
+        "labels": labels.tolist(),
+    }
+
+
+def save_model(
+    model: Model, model_id: str, model_format: str = MODEL_FORMAT, metadata: dict = None
+) -> str:
+    """Save a trained model in MODEL_DIR
+
+    Arguments:
+        model {Model} -- The trained model
+        model_id {str} -- The id of the model
+
+    Keyword Arguments:
+        model_format {str} -- "npy" for a model directory, "sav" for a dill pickle
+                              (default: {MODEL_FORMAT})
+        metadata {dict} -- Stored in the manifest of a model directory (default: {None})
+
+    Returns:
+        str -- The filename of the model in MODEL_DIR
+    """
+
+    if model_format == "sav":
+        filename = "model-{}.sav".format(model_id)
+        with open(os.path.join(MODEL_DIR, filename), "wb") as f:
+            dill.dump(model, f)
+    else:
+        filename = "model-{}".format(model_id)
+        save_model_dir(model, os.path.join(MODEL_DIR, filename), metadata=metadata)
+    logger.info("Saved model %s", os.path.join(MODEL_DIR, filename))
+    return filename
+
+
+def _report_progress(stage: str, progress: Callable[[str], None] = None) -> None:
+    if progress is not None:
+        progress(stage)
+
+
+def train_model(
+    x,
+    y,
+    clf,
+    clf_params,
+    vect_params,
+    test_size=0.3,
+    values_per_category=900,
+    tokens=None,
+    progress=None,
+    feature_store: FeatureStore = None,
+    snapshot: str = None,
+    incremental=False,
+    cv_folds=0,
+    n_jobs=1,
+    compaction: dict = None,
+):
+    """Train a model on a train/test split and evaluate it
+
+    Returns:
+        Tuple -- The model, train and test accuracy, the confusion matrix of the test texts and
+                 a dict with the fit_time, the confusion_matrix and its labels and, with
+                 cv_folds of at least 2, the cross_validate results of the training texts as cv.
+                 With compaction (the params of compact_model) the model is compacted before
+                 it is evaluated and the dict has the compaction report
+    """
+
+    model = create_model(clf, clf_params, vect_params, incremental)
     logger.info("Created Model")
+    key = None
+    features = None
+    split = None
+    if feature_store is not None and snapshot:
+        key = feature_store.key(
+            snapshot, vect_params, test_size, values_per_category, incremental=incremental
+        )
+        features = feature_store.load(key)
+    if features is None:
+        split = split_data(
+            x,
+            y,
+            test_size,
+            values_per_category,
+            tokens=tokens,
+            random_state=snapshot_seed(snapshot) if snapshot else None,
+            progress=progress,
+        )
+        _report_progress("vectorizing", progress)
+        features = create_features(
+            model.pipeline.steps[0][1], split, analyzed=tokens is not None
+        )
+        if key is not None:
+            feature_store.save(key, features)
+    else:
+        logger.info("Reusing the stored features, skipping the preprocessing")
+    use_vectorizer(model, features.vectorizer)
     logger.info("Training Model...")
-    model = _train_model(x_train, y_train, model)
+    _report_progress("training", progress)
+    start = time.perf_counter()
+    model = _train_model(features.x_train, features.y_train, model)
+    evaluation = {"fit_time": time.perf_counter() - start}
     logger.info("Finished training!")
-    train_acc, test_acc, conf_matrix = evaluate_model(x_train, x_test, y_train, y_test, model)
-    return model, train_acc, test_acc, conf_matrix
-
+    if cv_folds and cv_folds > 1:
+        _report_progress("cross_validating", progress)
+        if incremental:
+            x_cv, y_cv = features.x_train, features.y_train
+        else:
+            if split is None:
+                # the stored features have no texts, the split of the snapshot is the same
+                split = split_data(
+                    x,
+                    y,
+                    test_size,
+                    values_per_category,
+                    tokens=tokens,
+                    random_state=snapshot_seed(snapshot),
+                )
+            x_cv, y_cv = split[0], split[2]
+        evaluation["cv"] = cross_validate(
+            model,
+            x_cv,
+            y_cv,
+            cv_folds,
+            n_jobs,
+            random_state=snapshot_seed(snapshot) if snapshot else None,
+            analyzed=tokens is not None,
+        )
+    if compaction is not None:
+        _report_progress("compacting", progress)
+        features, evaluation["compaction"] = compact_model(model, features, **compaction)
+    _report_progress("evaluating", progress)
+    labels = model.pipeline.steps[-1][1].classes_
+    train_acc, test_acc, conf_matrix = evaluate_model(
+        features.x_train,
+        features.x_test,
+        features.y_train,
+        features.y_test,
+        classifier_pipeline(model).predict,
+        labels=labels,
+    )
+    evaluation["confusion_matrix"] = conf_matrix.tolist()
+    evaluation["labels"] = labels.tolist()
+    return model, train_acc, test_acc, conf_matrix, evaluation
@@ -0,0 +1,382 @@
+"""
+Usage:
+    from tatorte_classifier.metrics import PREDICTION_STAGE_SECONDS, metrics
+
+    with PREDICTION_STAGE_SECONDS.time(stage="preprocess"):
+        desc = preprocessor(desc)
+
+    metrics.render()  # the text served by /metrics
+
+Latency histograms and counters of the server process in the Prometheus text format. With
+METRICS_ENABLED=false (the default) time() returns a shared no-op context manager and observe()
+returns right away, so the instrumented code only pays for one attribute lookup, and no Mongo
+command listener is registered. The statistics of the model registry, the prediction cache and
+the training jobs are kept by their modules anyway, they are only read by the collectors when
+/metrics is scraped.
+
+Every server process has its own metrics, like its own model registry and prediction cache.
+The training processes don't report metrics, the durations of the training stages are
+measured by the server process from the stage messages of the training process.
+"""
+import math
+import time
+import bisect
+import logging
+from contextlib import contextmanager
+from threading import Lock
+from typing import Callable, Iterable, List, Sequence, Tuple
+
+from pymongo import monitoring
+
+from configuration import METRICS_ENABLED
+
+logger = logging.getLogger(__name__)
+
+# seconds, from the microseconds of a cached prediction to the seconds of loading a model
+LATENCY_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+# seconds, from a small incremental update to a hyperparameter search
+TRAINING_BUCKETS = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0)
+
+# a sample of a collector: (name, labels, value)
+Sample = Tuple[str, dict, float]
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, int):
+        return str(value)
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{{{}}}".format(
+        ",".join(
+            '{}="{}"'.format(
+                name,
+                str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'),
+            )
+            for name, value in labels.items()
+        )
+    )
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, registry: "MetricsRegistry", name: str, documentation: str, labelnames):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = Lock()
+        self._values = {}
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                "{} needs the labels {}, got {}".format(self.name, self.labelnames, sorted(labels))
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [
+            "# HELP {} {}".format(self.name, self.documentation),
+            "# TYPE {} {}".format(self.name, self.type),
+        ]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            values = dict(self._values)
+        return [
+            (self.name, dict(zip(self.labelnames, key)), value)
+            for key, value in sorted(values.items())
+        ]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, registry, name, documentation, labelnames, buckets=LATENCY_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # the counts of every bucket (the last one is +Inf) and the sum
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[i] += 1
+            counts[-1] += value
+
+    def time(self, **labels):
+        """Observe the seconds spent in a with block
+
+        Returns:
+            A context manager, a shared no-op one if the metrics are disabled
+        """
+
+        if not self.registry.enabled:
+            return _NO_TIMER
+        return self._time(labels)
+
+    @contextmanager
+    def _time(self, labels: dict):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            values = {key: list(counts) for key, counts in self._values.items()}
+        samples = []
+        for key, counts in sorted(values.items()):
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                samples.append(
+                    (self.name + "_bucket", dict(labels, le=_format_value(bound)), cumulative)
+                )
+            samples.append((self.name + "_count", labels, cumulative))
+            samples.append((self.name + "_sum", labels, counts[-1]))
+        return samples
+
+
+class _NoTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_TIMER = _NoTimer()
+
+
+class Stopwatch:
+    def __init__(self, histogram: Histogram, **labels):
+        """Observes the seconds spent in consecutive stages, e.g. the stages of a training job
+
+        Arguments:
+            histogram {Histogram} -- Needs a "stage" label besides the given labels
+        """
+
+        self.histogram = histogram
+        self.labels = labels
+        self.stage = None
+        self._start = 0.0
+
+    def lap(self, stage: str = None, now: float = None) -> None:
+        """Finish the current stage and start the next one
+
+        Keyword Arguments:
+            stage {str} -- The next stage, None only finishes the current one (default: {None})
+            now {float} -- The time.time() the stage changed, e.g. in another process
+                           (default: {None}, the current time)
+        """
+
+        if now is None:
+            now = time.time()
+        if self.stage is not None:
+            self.histogram.observe(max(now - self._start, 0.0), stage=self.stage, **self.labels)
+        self.stage = stage
+        self._start = now
+
+
+class MetricsRegistry:
+    def __init__(self, enabled: bool = True, prefix: str = "tatorte_"):
+        """The metrics of the server process
+
+        Keyword Arguments:
+            enabled {bool} -- False turns observing into a no-op (default: {True})
+            prefix {str} -- Prefix of the names of all metrics (default: {"tatorte_"})
+        """
+
+        self.enabled = enabled
+        self.prefix = prefix
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(self, self.prefix + name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self._register(
+            Histogram(self, self.prefix + name, documentation, labelnames, buckets)
+        )
+
+    def _register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def collector(
+        self, name: str, type: str, documentation: str
+    ) -> Callable[[Callable[[], Iterable[Tuple[dict, float]]]], Callable]:
+        """Decorator for a function, which returns the (labels, value) pairs of a gauge or
+        counter when the metrics are scraped
+
+        Arguments:
+            name {str} -- The name of the metric without the prefix
+            type {str} -- "gauge" or "counter"
+            documentation {str}
+        """
+
+        def register(collect):
+            self._collectors.append((self.prefix + name, type, documentation, collect))
+            return collect
+
+        return register
+
+    def render(self) -> str:
+        """The metrics in the Prometheus text format
+
+        Returns:
+            str -- The text served by /metrics
+        """
+
+        lines = []
+        for metric in self._metrics:
+            lines += metric.header()
+            lines += self._format_samples(metric.samples())
+        for name, type, documentation, collect in self._collectors:
+            try:
+                samples = [(name, labels, value) for labels, value in collect()]
+            except Exception as err:
+                logger.error("Could not collect %s: %s", name, str(err))
+                continue
+            lines += ["# HELP {} {}".format(name, documentation), "# TYPE {} {}".format(name, type)]
+            lines += self._format_samples(samples)
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _format_samples(samples: List[Sample]) -> List[str]:
+        return [
+            "{}{} {}".format(name, _format_labels(labels), _format_value(value))
+            for name, labels, value in samples
+        ]
+
+
+metrics = MetricsRegistry(METRICS_ENABLED)
+
+PREDICTION_SECONDS = metrics.histogram(
+    "prediction_seconds", "Seconds of a prediction request", ["endpoint"]
+)
+PREDICTED_TEXTS = metrics.counter(
+    "predicted_texts_total", "Number of texts classified by the api", ["endpoint"]
+)
+PREDICTION_STAGE_SECONDS = metrics.histogram(
+    "prediction_stage_seconds",
+    "Seconds spent in a stage of a prediction: preprocess, model (getting the model from the "
+    "registry), cache, vectorize (stemming and tf-idf), classify or compact (the compact "
+    "inference of sgd models, vectorizing and classifying)",
+    ["stage"],
+)
+MODEL_LOAD_SECONDS = metrics.histogram(
+    "model_load_seconds", "Seconds of loading a model file into the model registry"
+)
+TRAINING_STAGE_SECONDS = metrics.histogram(
+    "training_stage_seconds",
+    "Seconds spent in a stage of a training job",
+    ["kind", "stage"],
+    TRAINING_BUCKETS,
+)
+TRAINING_JOB_SECONDS = metrics.histogram(
+    "training_job_seconds",
+    "Seconds from the start to the end of a training job",
+    ["kind", "state"],
+    TRAINING_BUCKETS,
+)
+MONGO_COMMAND_SECONDS = metrics.histogram(
+    "mongo_command_seconds",
+    "Seconds of the Mongo commands of the server process",
+    ["command", "collection", "outcome"],
+)
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Observes the duration of every command of the Mongo client it is registered on
+    """
+
+    def __init__(self, histogram: Histogram = MONGO_COMMAND_SECONDS):
+        self.histogram = histogram
+        self._lock = Lock()
+        # the collection of every running command, the other events only know the command name
+        self._collections = {}
+
+    @staticmethod
+    def _request(event) -> tuple:
+        return (event.connection_id, event.request_id)
+
+    def started(self, event) -> None:
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = ""
+        with self._lock:
+            self._collections[self._request(event)] = collection
+
+    def _finished(self, event, outcome: str) -> None:
+        with self._lock:
+            collection = self._collections.pop(self._request(event), "")
+        self.histogram.observe(
+            event.duration_micros / 1e6,
+            command=event.command_name,
+            collection=collection,
+            outcome=outcome,
+        )
+
+    def succeeded(self, event) -> None:
+        self._finished(event, "success")
+
+    def failed(self, event) -> None:
+        self._finished(event, "failure")
+
+
+def mongo_event_listeners() -> list:
+    """The event_listeners of the Mongo clients, none if the metrics are disabled
+    """
+
+    return [MongoCommandListener()] if metrics.enabled else []
@@ -0,0 +1,112 @@
+"""
+Usage:
+    from tatorte_classifier.text_sampler import text_sampler
+
+    text = text_sampler.get()
+
+The sampler keeps a buffer of random text ids, so a request for a random text is a lookup by
+the primary key instead of a $sample aggregation. The buffer is refilled in a background thread
+when it runs low. The texts are sampled uniformly, with RANDOM_SAMPLE_UNLABELED_SHARE unlabeled
+texts can be preferred, so the annotators see them first.
+"""
+import logging
+from collections import deque
+from threading import Lock, Thread
+from typing import Callable, Optional
+
+from configuration import RANDOM_SAMPLE_BUFFER_SIZE, RANDOM_SAMPLE_UNLABELED_SHARE
+from tatorte_classifier.database import UNLABELED_QUERY, get_text, sample_text_ids
+
+logger = logging.getLogger(__name__)
+
+
+class RandomTextSampler:
+    def __init__(
+        self,
+        sample_ids: Callable[..., list],
+        get_text: Callable[..., Optional[dict]],
+        buffer_size: int = 1000,
+        unlabeled_share: float = 0.0,
+        refill_at: float = 0.25,
+    ):
+        """Prefetching sampler for random texts
+
+        Arguments:
+            sample_ids {Callable} -- sample_ids(size, query=None), returns random text ids
+            get_text {Callable} -- get_text(text_id), returns the text or None if it was deleted
+
+        Keyword Arguments:
+            buffer_size {int} -- Number of prefetched ids (default: {1000})
+            unlabeled_share {float} -- Share of unlabeled texts in the buffer. If there are less
+                                       unlabeled texts, the rest are random texts
+                                       (default: {0.0})
+            refill_at {float} -- The buffer is refilled, when less than this share of it is left
+                                 (default: {0.25})
+        """
+
+        self.sample_ids = sample_ids
+        self.get_text = get_text
+        self.buffer_size = buffer_size
+        self.unlabeled_share = unlabeled_share
+        self.refill_at = int(buffer_size * refill_at)
+        self._ids = deque()
+        self._refill_lock = Lock()
+
+    def get(self) -> Optional[dict]:
+        """Get a random text
+
+        Returns:
+            Optional[dict] -- The text, None if there are no texts
+        """
+
+        while True:
+            try:
+                text_id = self._ids.popleft()
+            except IndexError:
+                self._refill()
+                if not self._ids:
+                    return None
+                continue
+            if len(self._ids) < self.refill_at:
+                self._refill_in_background()
+            text = self.get_text(text_id)
+            if text is not None:  # the text could have been deleted in the meantime
+                return text
+
+    def _refill_in_background(self) -> None:
+        if not self._refill_lock.locked():
+            Thread(target=self._refill, daemon=True).start()
+
+    def _refill(self) -> None:
+        with self._refill_lock:
+            # only refill below the low-water mark, another thread could have refilled it
+            if self._ids and len(self._ids) >= self.refill_at:
+                return
+            try:
+                # top up the buffer, $sample returns the ids in random order and the unlabeled
+                # texts are served first. The samples can contain ids which are already buffered
+                n_missing = self.buffer_size - len(self._ids)
+                buffered = set(self._ids)
+                ids = []
+                n_unlabeled = int(n_missing * self.unlabeled_share)
+                if n_unlabeled:
+                    ids = self._unique(self.sample_ids(n_unlabeled, UNLABELED_QUERY), buffered)
+                if len(ids) < n_missing:
+                    ids += self._unique(self.sample_ids(n_missing - len(ids)), buffered)
+                self._ids.extend(ids)
+            except Exception as err:
+                logger.error("Refilling the random text buffer failed: %s", str(err))
+
+    @staticmethod
+    def _unique(ids: list, buffered: set) -> list:
+        unique = []
+        for text_id in ids:
+            if text_id not in buffered:
+                buffered.add(text_id)
+                unique.append(text_id)
+        return unique
+
+
+text_sampler = RandomTextSampler(
+    sample_text_ids, get_text, RANDOM_SAMPLE_BUFFER_SIZE, RANDOM_SAMPLE_UNLABELED_SHARE
+)
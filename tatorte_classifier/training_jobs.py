@@ -0,0 +1,659 @@
+"""
+Usage:
+    from tatorte_classifier.training_jobs import training_jobs
+
+    job_id = training_jobs.submit(metadata)
+    training_jobs.cancel(job_id)
+
+Training jobs are stored in the models collection. A job is queued, then running and ends up
+done, failed or cancelled. Every server process has a bounded queue and TRAINING_WORKERS
+dispatcher threads. A dispatcher loads the texts from the database and trains the model in a
+forked process, so training doesn't compete with the request handling of the server for the
+GIL. The training process only does the CPU work and reports its progress through a pipe, all
+database access stays in the server process. Cancellation is requested through the database,
+so a job can be cancelled from every server process. The server process running the job then
+terminates the process group of the training process, including its joblib workers. The queue
+of a server process is lost when it stops, so it renews the heartbeat of its jobs and the jobs
+without a recent heartbeat are marked failed by the other (or the restarted) server processes.
+
+A hyperparameter search is a training job as well, with {"search": ..., "trials": [...]} as its
+metadata. Its training process sends every finished trial, which is then recorded in the models
+collection with the search_id of the job. The job itself ends up with the best model.
+
+An update of an incremental model is a training job with {"update": {"model_url": ...}} as its
+metadata. Only the texts added or modified since the model was trained are loaded and learned
+with partial_fit, the job ends up with the updated model as a new model. With
+INCREMENTAL_UPDATE_INTERVAL every server process checks regularly whether the current model is
+incremental and texts changed, the process which claims the schedule in the database queues the
+update and the updated model is promoted to the current model.
+"""
+import os
+import time
+import uuid
+import signal
+import logging
+import multiprocessing
+from queue import Full, Queue
+from threading import Lock, Thread
+
+from configuration import (
+    FEATURE_STORE_DIR,
+    FEATURE_STORE_SIZE,
+    INCREMENTAL_UPDATE_EPOCHS,
+    SEARCH_WORKERS,
+    TRAINING_BATCH_SIZE,
+    TRAINING_QUEUE_SIZE,
+    TRAINING_WORKERS,
+)
+from tatorte_classifier import database
+from tatorte_classifier.database import (
+    claim_schedule,
+    count_changed_texts,
+    create_job,
+    create_model,
+    fail_stale_jobs,
+    get_job,
+    get_last_update_job,
+    get_model_by_url,
+    get_training_data,
+    get_text_features,
+    save_text_features,
+    touch_jobs,
+    update_job,
+)
+from tatorte_classifier.machine_learning.current_model import current_model
+from tatorte_classifier.machine_learning.feature_cache import FeatureCache
+from tatorte_classifier.machine_learning.feature_store import FeatureStore, corpus_snapshot
+from tatorte_classifier.machine_learning.hyperparameter_search import search
+from tatorte_classifier.machine_learning.incremental import load_incremental_model, update_model
+from tatorte_classifier.machine_learning.train_model import save_model, train_model
+from tatorte_classifier.metrics import (
+    TRAINING_JOB_SECONDS,
+    TRAINING_STAGE_SECONDS,
+    Stopwatch,
+    metrics,
+)
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+# progress of the job when a stage starts
+STAGE_PROGRESS = {
+    "loading": 0.0,
+    "preprocessing": 0.1,
+    "cleaning": 0.3,
+    "balancing": 0.35,
+    "vectorizing": 0.38,
+    "training": 0.4,
+    "cross_validating": 0.6,
+    "searching": 0.4,
+    "updating": 0.4,
+    "compacting": 0.8,
+    "evaluating": 0.85,
+    "saving": 0.95,
+}
+
+# seconds between two checks whether the cancellation of a running job was requested
+CANCEL_POLL_INTERVAL = 1.0
+# maximum seconds between two checks whether the scheduled update of the current model is due
+SCHEDULE_POLL_INTERVAL = 60.0
+UPDATE_SCHEDULE = "update_current_model"
+# seconds between two renewals of the heartbeat of the jobs of a server process and the age of
+# a heartbeat after which the job is failed, because its server process stopped
+JOB_HEARTBEAT_INTERVAL = 30.0
+STALE_JOB_TIMEOUT = 120.0
+
+feature_cache = FeatureCache(get_text_features, save_text_features)
+feature_store = (
+    FeatureStore(FEATURE_STORE_DIR, FEATURE_STORE_SIZE, feature_cache.version)
+    if FEATURE_STORE_SIZE > 0
+    else None
+)
+
+
+def _send_stage(conn, stage: str) -> None:
+    # the start time of the stage, the server process could be busy when it receives the message
+    conn.send(("stage", (stage, time.time())))
+
+
+def _send_result(conn, message: str, value) -> None:
+    # the end of the last stage, the result is only received when the server process is idle
+    conn.send(("finished", time.time()))
+    conn.send((message, value))
+
+
+def _tokenize_missing(conn, x, tokens, missing):
+    if missing:
+        _send_stage(conn, "preprocessing")
+        missing_tokens = feature_cache.tokenize(x[missing])
+        for i, text_tokens in zip(missing, missing_tokens):
+            tokens[i] = text_tokens
+        conn.send(("features", missing_tokens))
+
+
+def _feature_keys(metadata: dict, snapshot: str) -> list:
+    """The feature store keys of all vect_params of a training job or search
+    """
+
+    if "search" in metadata:
+        options = metadata["search"]
+        vect_params = [trial["vect_params"] for trial in metadata["trials"]]
+    else:
+        options = metadata
+        vect_params = [metadata.get("vect_params", {})]
+    return [
+        feature_store.key(
+            snapshot,
+            params,
+            options.get("test_size", 0.3),
+            options.get("values_per_category", 900),
+            incremental=options.get("incremental", False),
+        )
+        for params in vect_params
+    ]
+
+
+def _refits_vectorizer(metadata: dict) -> bool:
+    """Whether a training job needs the tokens of the texts even with stored features, because
+    its cross-validation fits a vectorizer on the training folds of the texts
+    """
+
+    return (
+        "search" not in metadata
+        and "update" not in metadata
+        and not metadata.get("incremental", False)
+        and (metadata.get("cv_folds") or 0) > 1
+    )
+
+
+def _train_in_process(conn, x, y, tokens, missing, metadata, snapshot):
+    """Runs in the training process. Sends ("stage", (stage, time)), ("features", tokens),
+    ("finished", time) and then ("done", result) or ("failed", error_message) to the server
+    process
+    """
+
+    try:
+        _tokenize_missing(conn, x, tokens, missing)
+        model, train_acc, test_acc, _, evaluation = train_model(
+            x,
+            y,
+            tokens=tokens,
+            progress=lambda stage: _send_stage(conn, stage),
+            feature_store=feature_store,
+            snapshot=snapshot,
+            **dict({"n_jobs": SEARCH_WORKERS}, **metadata)
+        )
+        _send_stage(conn, "saving")
+        manifest_metadata = None
+        if "compaction" in evaluation:
+            manifest_metadata = {"compaction": evaluation["compaction"]}
+        model_url = save_model(model, uuid.uuid4().hex[:8], metadata=manifest_metadata)
+        _send_result(
+            conn,
+            "done",
+            {
+                "model_url": model_url,
+                "performance_data": dict(evaluation, train_acc=train_acc, test_acc=test_acc),
+            },
+        )
+    except Exception as err:
+        _send_result(conn, "failed", str(err))
+    finally:
+        conn.close()
+
+
+def _search_in_process(conn, x, y, tokens, missing, metadata, snapshot):
+    """Runs in the training process of a search. Like _train_in_process, but additionally sends
+    ("trial", result) for every finished trial
+    """
+
+    def on_trial(result, model):
+        result["model_url"] = save_model(model, uuid.uuid4().hex[:8]) if model is not None else ""
+        conn.send(("trial", result))
+
+    try:
+        _tokenize_missing(conn, x, tokens, missing)
+        options = metadata["search"]
+        early_stopping = options.get("early_stopping", True)
+        if not isinstance(early_stopping, dict):
+            early_stopping = {} if early_stopping else {"eta": 0}
+        best = search(
+            x,
+            y,
+            metadata["trials"],
+            test_size=options.get("test_size", 0.3),
+            values_per_category=options.get("values_per_category", 900),
+            tokens=tokens,
+            n_jobs=options.get("n_jobs", SEARCH_WORKERS),
+            eta=early_stopping.get("eta", 3),
+            n_rungs=early_stopping.get("rungs", 3),
+            progress=lambda stage: _send_stage(conn, stage),
+            on_trial=on_trial,
+            feature_store=feature_store,
+            snapshot=snapshot,
+        )
+        _send_result(
+            conn,
+            "done",
+            {
+                "model_url": best["model_url"],
+                "performance_data": best["performance_data"],
+                "best_metadata": best["metadata"],
+            },
+        )
+    except Exception as err:
+        _send_result(conn, "failed", str(err))
+    finally:
+        conn.close()
+
+
+def _update_in_process(conn, x, y, tokens, missing, metadata, snapshot):
+    """Runs in the training process of an update. Like _train_in_process, the updated model is
+    saved as a new model
+    """
+
+    try:
+        _tokenize_missing(conn, x, tokens, missing)
+        _send_stage(conn, "updating")
+        model = load_incremental_model(metadata["update"]["model_url"])
+        model, progressive_acc, n_texts = update_model(
+            model, x, y, tokens=tokens, n_epochs=INCREMENTAL_UPDATE_EPOCHS
+        )
+        _send_stage(conn, "saving")
+        model_url = save_model(model, uuid.uuid4().hex[:8])
+        _send_result(
+            conn,
+            "done",
+            {
+                "model_url": model_url,
+                "performance_data": {
+                    "progressive_acc": progressive_acc,
+                    "updated_texts": n_texts,
+                },
+            },
+        )
+    except Exception as err:
+        _send_result(conn, "failed", str(err))
+    finally:
+        conn.close()
+
+
+def _run_in_process(target, conn, *args):
+    """The entry point of the training process. It starts its own process group, so cancelling
+    the job also terminates the joblib workers of a search or a cross-validation
+    """
+
+    os.setpgrp()
+    # the training process doesn't use the database, but the client of the server process must
+    # not be used after the fork by accident
+    database.reconnect()
+    target(conn, *args)
+
+
+def _terminate(process) -> None:
+    """Terminate the training process and its joblib workers
+    """
+
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        # the training process hasn't started its process group yet or has already exited
+        process.terminate()
+
+
+def _job_kind(metadata: dict) -> str:
+    if "search" in metadata:
+        return "search"
+    if "update" in metadata:
+        return "update"
+    return "train"
+
+
+def _process_target(metadata: dict):
+    return {
+        "search": _search_in_process,
+        "update": _update_in_process,
+        "train": _train_in_process,
+    }[_job_kind(metadata)]
+
+
+class TrainingJobQueue:
+    def __init__(self, n_workers: int = 1, max_queued: int = 10):
+        """Bounded queue for training jobs
+
+        Keyword Arguments:
+            n_workers {int} -- Number of models trained in parallel (default: {1})
+            max_queued {int} -- Maximum number of queued jobs (default: {10})
+        """
+
+        self.n_workers = n_workers
+        self._queue = Queue(maxsize=max_queued)
+        self._workers = []
+        self._lock = Lock()
+        self._submit_lock = Lock()
+        self._watching = False
+        # the jobs of this queue in the database, they are lost when the process stops
+        self.owner = uuid.uuid4().hex
+        # fork, so the texts don't need to be pickled to be passed to the training process
+        self._context = multiprocessing.get_context("fork")
+
+    def submit(self, metadata: dict) -> str:
+        """Queue a training job
+
+        Arguments:
+            metadata {dict} -- The metadata of the model, the arguments of train_model
+
+        Raises:
+            Full: If too many jobs are queued
+
+        Returns:
+            str -- The id of the job
+        """
+
+        # only submit puts jobs into the queue, so the slot checked here is still free when the
+        # job is put into the queue and no job is recorded, which can't be queued
+        with self._submit_lock:
+            if self._queue.full():
+                raise Full("Too many training jobs are queued, please try again later")
+            job_id = str(create_job(metadata, self.owner))
+            self._start_workers()
+            self._queue.put_nowait((job_id, metadata))
+        logger.info("Queued training job %s", job_id)
+        return job_id
+
+    def submit_update(self, model_url: str, promote: bool = False) -> str:
+        """Queue an update of an incremental model with the texts changed since it was trained
+
+        Arguments:
+            model_url {str} -- The filename of the model
+
+        Keyword Arguments:
+            promote {bool} -- Whether the updated model becomes the current model
+                              (default: {False})
+
+        Raises:
+            ValueError: If the model isn't incremental
+            Full: If too many jobs are queued
+
+        Returns:
+            str -- The id of the job
+        """
+
+        base = get_model_by_url(model_url)
+        if base is None or not base["metadata"].get("incremental"):
+            raise ValueError("{} is not an incremental model".format(model_url))
+        return self.submit({"update": {"model_url": model_url, "promote": promote}})
+
+    def update_current_model(self) -> str:
+        """Queue an update of the current model, if it is incremental, texts changed since it was
+        trained (or since its last update failed) and it isn't being updated already. The
+        updated model is promoted
+
+        Returns:
+            str -- The id of the job or None, if no update is needed
+        """
+
+        model_url = current_model.stats()["model"]
+        base = get_model_by_url(model_url) if model_url else None
+        if base is None or not base["metadata"].get("incremental"):
+            return None
+        since = base.get("data_time", 0.0)
+        last_update = get_last_update_job(model_url)
+        if last_update is not None:
+            if last_update["state"] in (QUEUED, RUNNING):
+                return None
+            if last_update["state"] == FAILED:
+                # e.g. none of the changed texts could be learned, don't retry with the same texts
+                since = max(since, last_update.get("time_started", 0.0))
+        if not count_changed_texts(since):
+            return None
+        return self.submit_update(model_url, promote=True)
+
+    def schedule_updates(self, interval: float) -> None:
+        """Update the current model every interval seconds in the background
+
+        Arguments:
+            interval {float} -- Seconds between two updates
+        """
+
+        Thread(target=self._schedule, args=(interval,), daemon=True).start()
+        logger.info("Scheduled updates of the current model every %d seconds", interval)
+
+    def _schedule(self, interval: float) -> None:
+        while True:
+            time.sleep(min(interval, SCHEDULE_POLL_INTERVAL))
+            try:
+                if claim_schedule(UPDATE_SCHEDULE, interval):
+                    job_id = self.update_current_model()
+                    if job_id is not None:
+                        logger.info("Queued scheduled update %s of the current model", job_id)
+            except Exception as err:
+                logger.error("Scheduled update of the current model failed: %s", str(err))
+
+    def watch_jobs(self) -> None:
+        """Renew the heartbeat of the jobs of this server process and fail the jobs of stopped
+        server processes in the background
+        """
+
+        with self._lock:
+            if self._watching:
+                return
+            self._watching = True
+        Thread(target=self._watch, daemon=True).start()
+
+    def _watch(self) -> None:
+        while True:
+            try:
+                touch_jobs(self.owner)
+                n_failed = fail_stale_jobs(time.time() - STALE_JOB_TIMEOUT)
+                if n_failed:
+                    logger.warning("Failed %d jobs of stopped server processes", n_failed)
+            except Exception as err:
+                logger.error("Could not check the training jobs: %s", str(err))
+            time.sleep(JOB_HEARTBEAT_INTERVAL)
+
+    def queued(self) -> int:
+        """The number of jobs waiting for a dispatcher of this server process
+        """
+
+        return self._queue.qsize()
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued or running job
+
+        Arguments:
+            job_id {str} -- The id of the job
+
+        Returns:
+            bool -- False if the job doesn't exist or is already finished
+        """
+
+        if update_job(
+            job_id,
+            {"state": CANCELLED, "cancel_requested": True, "time_finished": time.time()},
+            state=QUEUED,
+        ):
+            return True
+        # the server process which runs the job terminates its training process
+        return update_job(job_id, {"cancel_requested": True}, state=RUNNING)
+
+    def _start_workers(self) -> None:
+        with self._lock:
+            while len(self._workers) < self.n_workers:
+                worker = Thread(target=self._work, daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def _work(self) -> None:
+        while True:
+            job_id, metadata = self._queue.get()
+            kind = _job_kind(metadata)
+            stopwatch = Stopwatch(TRAINING_STAGE_SECONDS, kind=kind)
+            start = time.perf_counter()
+            state = FAILED
+            try:
+                state = self._run(job_id, metadata, stopwatch)
+            except Exception as err:
+                logger.error("Training job %s failed: %s", job_id, str(err))
+                update_job(
+                    job_id,
+                    {"state": FAILED, "error_message": str(err), "time_finished": time.time()},
+                )
+            finally:
+                stopwatch.lap()
+                if state is not None:
+                    TRAINING_JOB_SECONDS.observe(
+                        time.perf_counter() - start, kind=kind, state=state
+                    )
+                self._queue.task_done()
+
+    def _set_stage(
+        self, job_id: str, stage: str, stopwatch: Stopwatch, time_started: float = None
+    ) -> None:
+        stopwatch.lap(stage, time_started)
+        update_job(job_id, {"stage": stage, "progress": STAGE_PROGRESS[stage]})
+
+    def _run(self, job_id: str, metadata: dict, stopwatch: Stopwatch) -> str:
+        """Train the model of a job in a training process and record the result
+
+        Returns:
+            str -- The state the job ended up in or None, if it was cancelled before it started
+        """
+
+        time_started = time.time()
+        if not update_job(job_id, {"state": RUNNING, "time_started": time_started}, state=QUEUED):
+            logger.info("Skipping training job %s, it was cancelled", job_id)
+            return None
+
+        self._set_stage(job_id, "loading", stopwatch)
+        base = None
+        if "update" in metadata:
+            base = get_model_by_url(metadata["update"]["model_url"])
+            if base is None or not base["metadata"].get("incremental"):
+                raise ValueError(
+                    "{} is not an incremental model".format(metadata["update"]["model_url"])
+                )
+            text_ids, times_modified, x, y = get_training_data(
+                TRAINING_BATCH_SIZE, since=base.get("data_time", 0.0)
+            )
+            if not len(y):
+                raise ValueError("No texts were added or modified since the model was trained")
+        else:
+            text_ids, times_modified, x, y = get_training_data(TRAINING_BATCH_SIZE)
+        snapshot = corpus_snapshot(text_ids, times_modified, y)
+        if (
+            feature_store is not None
+            and base is None
+            and not _refits_vectorizer(metadata)
+            and all(feature_store.contains(key) for key in _feature_keys(metadata, snapshot))
+        ):
+            # the training process only trains classifiers on the stored tf-idf matrices
+            tokens, missing = None, []
+        else:
+            tokens, missing = feature_cache.get_cached_tokens(text_ids, times_modified)
+
+        receiver, sender = self._context.Pipe(duplex=False)
+        # joblib can't start the worker processes of a search or a cross-validation in a daemonic
+        # process
+        uses_workers = "search" in metadata or (metadata.get("cv_folds") or 0) > 1
+        process = self._context.Process(
+            target=_run_in_process,
+            args=(_process_target(metadata), sender, x, y, tokens, missing, metadata, snapshot),
+            daemon=not uses_workers,
+        )
+        process.start()
+        sender.close()
+
+        result = None
+        cancelled = False
+        n_trials = 0
+        next_cancel_check = time.monotonic() + CANCEL_POLL_INTERVAL
+        while result is None:
+            # also while the training process keeps sending messages, e.g. the trials of a search
+            if time.monotonic() >= next_cancel_check:
+                next_cancel_check = time.monotonic() + CANCEL_POLL_INTERVAL
+                if get_job(job_id).get("cancel_requested"):
+                    _terminate(process)
+                    cancelled = True
+                    break
+            if not receiver.poll(max(0.0, next_cancel_check - time.monotonic())):
+                continue
+            try:
+                message, value = receiver.recv()
+            except EOFError:  # the process exited without a result
+                break
+            if message == "stage":
+                self._set_stage(job_id, value[0], stopwatch, value[1])
+            elif message == "trial":
+                self._record_trial(job_id, value)
+                n_trials += 1
+                progress = STAGE_PROGRESS["searching"] + 0.55 * n_trials / len(metadata["trials"])
+                update_job(job_id, {"progress": progress, "trials_finished": n_trials})
+            elif message == "finished":
+                stopwatch.lap(None, value)
+            elif message == "features":
+                feature_cache.save_tokens(
+                    [text_ids[i] for i in missing], [times_modified[i] for i in missing], value
+                )
+            else:
+                result = (message, value)
+        process.join()
+        receiver.close()
+
+        time_finished = time.time()
+        timing = {"time_finished": time_finished, "duration": time_finished - time_started}
+        if result is not None and result[0] == DONE:
+            # the newest text the model has learned, an update continues from there
+            data_time = float(times_modified.max()) if len(times_modified) else 0.0
+            fields = dict(result[1], state=DONE, progress=1.0, data_time=data_time, **timing)
+            if base is not None:
+                fields["data_time"] = max(data_time, base.get("data_time", 0.0))
+                fields["metadata"] = dict(base["metadata"], base_model=base["model_url"])
+            update_job(job_id, fields)
+            logger.info("Trained new model %s in job %s", result[1]["model_url"], job_id)
+            if base is not None and metadata["update"].get("promote"):
+                try:
+                    current_model.promote(result[1]["model_url"])
+                except ValueError as err:
+                    logger.error("Could not promote %s: %s", result[1]["model_url"], str(err))
+            return DONE
+        if result is not None:
+            update_job(job_id, dict(state=FAILED, error_message=result[1], **timing))
+            logger.error("Training job %s failed: %s", job_id, result[1])
+            return FAILED
+        if cancelled:
+            update_job(job_id, dict(state=CANCELLED, **timing))
+            logger.info("Cancelled training job %s", job_id)
+            return CANCELLED
+        update_job(
+            job_id,
+            dict(
+                state=FAILED,
+                error_message="Training process exited with code {}".format(process.exitcode),
+                **timing
+            ),
+        )
+        return FAILED
+
+    def _record_trial(self, job_id: str, result: dict) -> None:
+        performance_data = dict(result["performance_data"], state=result["state"])
+        create_model(
+            result["model_url"],
+            performance_data,
+            result["metadata"],
+            result["error_message"],
+            search_id=job_id,
+        )
+
+
+training_jobs = TrainingJobQueue(TRAINING_WORKERS, TRAINING_QUEUE_SIZE)
+
+
+@metrics.collector("training_jobs_queued", "gauge", "Training jobs queued in this server process")
+def _collect_queued():
+    return [({}, training_jobs.queued())]
@@ -0,0 +1,142 @@
+import sys
+import json
+import types
+from unittest import mock
+
+import pytest
+
+pytest.importorskip("starlette")
+pytest.importorskip("httpx")
+mongomock = pytest.importorskip("mongomock")
+
+from starlette.testclient import TestClient  # noqa: E402
+
+try:
+    import motor.motor_asyncio  # noqa: F401
+except ImportError:
+    # the pinned motor doesn't import on newer pythons, the tests replace its collections anyway
+    motor_asyncio = types.ModuleType("motor.motor_asyncio")
+    motor_asyncio.AsyncIOMotorClient = lambda *args, **kwargs: mongomock.MongoClient(*args)
+    sys.modules["motor.motor_asyncio"] = motor_asyncio
+
+from tatorte_classifier import async_database, database  # noqa: E402
+
+
+class AsyncCursor:
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def sort(self, *args):
+        return AsyncCursor(self.cursor.sort(*args))
+
+    def skip(self, n):
+        return AsyncCursor(self.cursor.skip(n))
+
+    def limit(self, n):
+        return AsyncCursor(self.cursor.limit(n))
+
+    async def to_list(self, length):
+        return list(self.cursor)
+
+
+class AsyncCollection:
+    """The part of the motor collection api used by async_database.py on a mongomock collection
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def find(self, *args, **kwargs):
+        return AsyncCursor(self.collection.find(*args, **kwargs))
+
+    def __getattr__(self, name):
+        method = getattr(self.collection, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+
+        return call
+
+
+@pytest.fixture(scope="module")
+def client():
+    db = mongomock.MongoClient().db
+    names = ["texts", "models", "text_features"]
+    patches = [mock.patch.object(database, name, db[name]) for name in names]
+    patches += [
+        mock.patch.object(async_database, name, AsyncCollection(db[name])) for name in names
+    ]
+    for patch in patches:
+        patch.start()
+    from tatorte_classifier.asgi import create_asgi_app
+
+    yield TestClient(create_asgi_app())
+    for patch in patches:
+        patch.stop()
+
+
+def _bson(response):
+    # the bson json is returned as json string like by the flask_restful resources
+    return json.loads(response.json())
+
+
+def test_texts_are_created_paged_and_modified(client):
+    for i in range(3):
+        assert client.post("/api/texts/", json={"data": str(i), "categories": []}).json() == {
+            "success": True
+        }
+    response = client.post(
+        "/api/texts/bulk/",
+        content=b'{"data": "3", "categories": [1]}\n{"data": "4"}\n',
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert response.json()["inserted"] == 1
+    assert [error["index"] for error in response.json()["errors"]] == [1]
+
+    first = client.get("/api/texts/", params={"limit": 3})
+    second = client.get("/api/texts/", params={"after": first.headers["X-Next-Cursor"]})
+    texts = _bson(first) + _bson(second)
+    assert len(texts) == 4 and "X-Next-Cursor" not in second.headers
+
+    text_id = texts[-1]["_id"]["$oid"]
+    assert client.patch("/api/texts/{}/".format(text_id), json={"categories": [2]}).status_code
+    assert _bson(client.get("/api/texts/{}/".format(text_id)))["categories"] == [2]
+    client.delete("/api/texts/{}/".format(text_id))
+    assert _bson(client.get("/api/texts/{}/".format(text_id))) is None
+
+
+def test_models_list_and_missing_model_file(client):
+    database.create_job({"clf": "sgd"})
+    database.create_model("model.sav", {}, {"clf": "sgd"}, None)
+
+    assert [model["model_url"] for model in _bson(client.get("/api/models/"))] == ["model.sav"]
+    assert len(_bson(client.get("/api/jobs/"))) == 1
+    assert client.get("/api/models/missing.sav/").status_code == 404
+    response = client.post(
+        "/api/models/missing.sav/predict/",
+        json={"data": "Einbruch in eine Wohnung", "parameters": {"max_categories": 3}},
+    )
+    assert response.status_code == 400
+
+
+def test_options_and_stats(client):
+    assert client.get("/api/model_options/sgd/").status_code == 200
+    assert client.get("/api/model_options/tree/").status_code == 400
+    assert client.get("/api/categories/").status_code == 200
+    assert "hits" in client.get("/api/model_registry/").json()
+    assert client.get("/api/prediction_cache/").status_code == 200
+
+
+def test_other_routes_are_served_by_the_flask_app(client):
+    response = client.get("/metrics")
+    assert response.status_code == 404 and "METRICS_ENABLED" in response.text
+
+
+def test_compaction_is_only_accepted_for_sgd_and_nn(client):
+    for metadata in (
+        {"clf": "svm", "compaction": {"min_df": 2}},
+        {"clf": "sgd", "incremental": True, "compaction": {"min_df": 2}},
+        {"clf": "sgd", "compaction": {"min_features": 2}},
+    ):
+        response = client.post("/api/models/", json=metadata)
+        assert response.status_code == 400 and "compact" in response.json()["message"]
@@ -0,0 +1,42 @@
+import pytest
+
+from benchmarks.compare import compare
+
+
+def _results(seconds: dict) -> dict:
+    return {
+        "results": [
+            {"benchmark": benchmark, "size": 1000, "seconds": value}
+            for benchmark, value in seconds.items()
+        ]
+    }
+
+
+def test_compare_flags_regressions_above_the_threshold():
+    baseline = _results({"preprocess": 1.0, "train_sgd": 2.0, "train_nn": 3.0})
+    results = _results({"preprocess": 1.1, "train_sgd": 3.0, "predict_batch_sgd": 0.5})
+    rows = {row["benchmark"]: row for row in compare(baseline, results, threshold=0.2)}
+
+    assert not rows["preprocess"]["regression"]
+    assert rows["train_sgd"]["regression"] and rows["train_sgd"]["ratio"] == 1.5
+    assert rows["train_nn"]["seconds"] is None and not rows["train_nn"]["regression"]
+    assert rows["predict_batch_sgd"]["baseline"] is None
+
+
+def test_suite_runs_on_a_small_corpus():
+    pytest.importorskip("mongomock")
+    from benchmarks.suite import run
+
+    results = run([300], clfs=["sgd"], repeat=1, n_requests=20, batch_size=10, log=lambda _: None)
+    benchmarks = [result["benchmark"] for result in results["results"]]
+    assert benchmarks == [
+        "load_training_data",
+        "preprocess",
+        "clean_data",
+        "balance_data",
+        "train_sgd",
+        "predict_single_sgd",
+        "predict_batch_sgd",
+    ]
+    assert all(result["seconds"] > 0 for result in results["results"])
+    assert results["meta"]["sizes"] == [300]
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from tatorte_classifier.machine_learning.cleaning_rules import (
+    DEFAULT_CLEANING_RULES,
+    CleaningRules,
+)
+
+
+def _apply_rules_one_by_one(rules, texts, y):
+    y = np.array(y)
+    drop = np.zeros(len(y), dtype=bool)
+    for rule in rules:
+        contains = np.asarray([rule["keyword"] in text.lower() for text in texts])
+        if rule["action"] == "relabel":
+            y[contains & (y == rule["from"])] = rule["to"]
+        else:
+            drop |= contains & (y == rule["category"]) if "category" in rule else contains
+    return y, ~drop
+
+
+def test_overlapping_keywords_are_all_found():
+    rules = CleaningRules(
+        [
+            {"keyword": "alkohol", "action": "drop"},
+            {"keyword": "alkoholkontrolle", "action": "drop"},
+            {"keyword": "kontroll", "action": "drop"},
+            {"keyword": "holk", "action": "drop"},
+        ]
+    )
+    matches = rules.match(["Eine ALKOHOLKONTROLLE", "alkohol", "nichts"])
+    columns = [rules.keywords.index(k) for k in ["alkohol", "alkoholkontrolle", "kontroll", "holk"]]
+    assert matches[:, columns].tolist() == [
+        [True, True, True, True],
+        [True, False, False, False],
+        [False, False, False, False],
+    ]
+
+
+def test_rules_match_applying_them_one_by_one():
+    texts = [
+        "Bei einer Verkehrskontrolle wurden Drogen gefunden",
+        "In die Wohnung wurde eingebrochen",
+        "Der Fahrer hatte Alkohol getrunken",
+        "Am Dienstagmorgen wurde ein Mann überfallen",
+        "Am Dienstagmorgen brannte ein Haus",
+        "Das Fahrrad wurde gestohlen, es war eingebrochen worden",
+        "Verkehrskontrolle: Bei dem Fahrer war eingebrochen worden",
+    ]
+    y = [5, 4, 2, 3, 1, 4, 5]
+    new_y, keep = CleaningRules(DEFAULT_CLEANING_RULES).apply(texts, y)
+    expected_y, expected_keep = _apply_rules_one_by_one(DEFAULT_CLEANING_RULES, texts, y)
+    assert new_y.tolist() == expected_y.tolist()
+    assert keep.tolist() == expected_keep.tolist()
+
+
+def test_invalid_rules():
+    with pytest.raises(ValueError):
+        CleaningRules([{"keyword": "alkohol", "action": "remove"}])
+    with pytest.raises(ValueError):
+        CleaningRules([{"keyword": "alkohol", "action": "relabel", "from": 1}])
@@ -0,0 +1,59 @@
+import os
+
+import numpy as np
+import pytest
+
+from tatorte_classifier.machine_learning.model_format import load_model_dir, save_model_dir
+from tatorte_classifier.machine_learning.train_model import train_model
+
+sentences = [
+    "Die Feuerwehr löschte den Brand im Dachstuhl",
+    "Der Täter wurde nach dem Mord festgenommen",
+    "Zwei Unbekannte überfielen einen Mann und raubten seine Geldbörse",
+    "Bei dem Verkehrsunfall wurden zwei Autofahrer verletzt",
+]
+x = np.asarray([sentences[i % 4] + " " + sentences[(i * 3) % 4][:15] for i in range(80)])
+y = np.arange(80) % 4 + 1
+
+
+@pytest.mark.parametrize(
+    "clf, clf_params",
+    [
+        ("sgd", {"loss": "log", "max_iter": 20, "tol": None, "random_state": 0}),
+        ("nn", {"hidden_layer_sizes": (8,), "max_iter": 100, "random_state": 0}),
+    ],
+)
+def test_compaction_prunes_features_and_records_the_footprint(tmp_path, clf, clf_params):
+    model, _, test_acc, _, evaluation = train_model(
+        x, y, clf, clf_params, {"min_df": 1}, compaction={"max_features": 10, "min_df": 2}
+    )
+    report = evaluation["compaction"]
+    assert report["before"]["n_features"] > report["after"]["n_features"] == 10
+    assert report["before"]["bytes"] > report["after"]["bytes"]
+    assert report["after"]["test_acc"] == test_acc
+    assert report["params"]["max_features"] == 10
+
+    vect = model.pipeline.named_steps["vect"]
+    assert not hasattr(vect, "stop_words_")
+    assert len(vect.vocabulary_) == 10 and len(vect.idf_) == 10
+
+    path = os.path.join(str(tmp_path), "model")
+    save_model_dir(model, path, metadata={"compaction": report})
+    loaded = load_model_dir(path, mmap=False)
+    assert loaded.manifest["metadata"]["compaction"] == report
+    assert loaded.pipeline.vectorizer.idf.dtype == np.float32
+    np.testing.assert_allclose(
+        loaded.pipeline.predict_proba(x[:8]), model.pipeline.predict_proba(x[:8]), atol=1e-6
+    )
+
+
+def test_pruning_all_features_fails():
+    with pytest.raises(ValueError):
+        train_model(
+            x,
+            y,
+            "sgd",
+            {"max_iter": 5, "tol": None},
+            {},
+            compaction={"min_weight": 1e9},
+        )
@@ -0,0 +1,117 @@
+import os
+import json
+from threading import Event
+
+import pytest
+
+from tatorte_classifier.machine_learning.current_model import CurrentModel
+
+
+class FakePipeline:
+    def __init__(self):
+        self.warmed_up = False
+
+    def predict_proba(self, texts):
+        self.warmed_up = True
+
+
+class FakeModel:
+    def __init__(self, model_id):
+        self.model_id = model_id
+        self.pipeline = FakePipeline()
+
+
+class BlockingLoader:
+    def __init__(self):
+        self.calls = []
+        self.release = Event()
+        self.release.set()
+
+    def __call__(self, model_id):
+        self.calls.append(model_id)
+        self.release.wait()
+        return FakeModel(model_id)
+
+
+@pytest.fixture
+def model_dir(tmp_path):
+    for model_id in ("model-a", "model-b"):
+        os.makedirs(os.path.join(str(tmp_path), model_id))
+    return str(tmp_path)
+
+
+def _current_model(model_dir, loader):
+    return CurrentModel(loader, os.path.join(model_dir, "current.json"), model_dir)
+
+
+def test_promote_and_rollback(model_dir):
+    loader = BlockingLoader()
+    current = _current_model(model_dir, loader)
+    with pytest.raises(ValueError):
+        current.get()
+    with pytest.raises(ValueError):
+        current.promote("model-x")
+
+    current.promote("model-a")
+    current.wait()
+    model = current.get()
+    assert model.model_id == "model-a" and model.pipeline.warmed_up
+
+    # the old model answers, until the new one is warmed up
+    loader.release.clear()
+    current.promote("model-b")
+    assert current.get().model_id == "model-a"
+    loader.release.set()
+    current.wait()
+    assert current.get().model_id == "model-b"
+    with open(os.path.join(model_dir, "current.json")) as f:
+        assert json.load(f)["previous"] == "model-a"
+
+    # the previous model is still loaded
+    assert current.rollback() == "model-a"
+    assert current.get().model_id == "model-a"
+    assert loader.calls == ["model-a", "model-b"]
+
+
+def test_other_processes_follow_the_pointer(model_dir):
+    promoting = _current_model(model_dir, BlockingLoader())
+    promoting.promote("model-a")
+    promoting.wait()
+
+    loader = BlockingLoader()
+    following = _current_model(model_dir, loader)
+    assert following.get().model_id == "model-a"
+
+    promoting.promote("model-b")
+    promoting.wait()
+    loader.release.clear()
+    assert following.get().model_id == "model-a"
+    assert following.stats()["warming"] == "model-b"
+    loader.release.set()
+    following.wait()
+    assert following.get().model_id == "model-b"
+
+
+def test_pointer_changing_during_a_promotion(model_dir):
+    os.makedirs(os.path.join(model_dir, "model-c"))
+    other = _current_model(model_dir, BlockingLoader())
+    other.promote("model-a")
+    other.wait()
+
+    loader = BlockingLoader()
+    current = _current_model(model_dir, loader)
+    assert current.get().model_id == "model-a"
+    loader.release.clear()
+    current.promote("model-b")
+
+    # the pointer changes while model-b is loaded, the active model keeps answering
+    other.promote("model-c")
+    other.wait()
+    assert current.get().model_id == "model-a"
+    assert current.stats()["model"] == "model-c"
+
+    loader.release.set()
+    current.wait()
+    with open(os.path.join(model_dir, "current.json")) as f:
+        assert json.load(f)["previous"] == "model-c"
+    assert current.get().model_id == "model-b"
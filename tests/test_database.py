@@ -0,0 +1,30 @@
+from unittest import mock
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+from tatorte_classifier import database  # noqa: E402
+
+
+@pytest.fixture
+def texts():
+    collection = mongomock.MongoClient().db.texts
+    with mock.patch.object(database, "texts", collection):
+        yield collection
+
+
+def test_pages_go_past_texts_without_time_modified(texts):
+    texts.insert_many([{"data": str(i), "time_modified": float(i % 2)} for i in range(4)])
+    texts.insert_many([{"data": str(i)} for i in range(4, 7)])
+    expected = [text["_id"] for text in texts.find().sort(database.TEXT_ORDER)]
+
+    pages, page = [], database.get_texts_page(limit=2)
+    while page:
+        pages.append([text["_id"] for text in page])
+        page = database.get_texts_page(after=database.encode_text_cursor(page[-1]), limit=2)
+    assert sum(pages, []) == expected and len(pages) == 4
+
+    for previous, page in zip(pages, pages[1:]):
+        cursor = database.encode_text_cursor(texts.find_one({"_id": page[0]}))
+        assert [text["_id"] for text in database.get_texts_page(before=cursor, limit=2)] == previous
@@ -0,0 +1,77 @@
+import numpy as np
+
+from tatorte_classifier.machine_learning import feature_cache as feature_cache_module
+from tatorte_classifier.machine_learning.feature_cache import FeatureCache
+from tatorte_classifier.machine_learning.model import StemmingAnalyzer
+from tatorte_classifier.machine_learning.preprocess_data import DataPreprocessor
+
+
+class InMemoryFeatures:
+    def __init__(self):
+        self.features = {}
+        self.saved = []
+        self.loaded = []
+
+    def load(self, version, text_ids):
+        self.loaded.append(list(text_ids))
+        return [
+            self.features[text_id]
+            for text_id in text_ids
+            if text_id in self.features and self.features[text_id]["version"] == version
+        ]
+
+    def save(self, version, features):
+        self.saved.extend(feature["_id"] for feature in features)
+        for feature in features:
+            self.features[feature["_id"]] = dict(feature, version=version)
+
+
+texts = np.asarray(
+    [
+        "Am Montag brannte ein Haus. Tel.: 0395/5582-2223",
+        "Die Polizei sucht nach Zeugen, Email: pp@berlin.de",
+    ]
+)
+
+
+def _expected_tokens(text):
+    return StemmingAnalyzer()(DataPreprocessor()(text))
+
+
+def test_feature_cache_only_processes_new_and_modified_texts():
+    storage = InMemoryFeatures()
+    feature_cache = FeatureCache(storage.load, storage.save)
+
+    tokens = feature_cache.get_tokens(["a", "b"], [1.0, 1.0], texts)
+    assert [list(t) for t in tokens] == [_expected_tokens(text) for text in texts]
+    assert storage.saved == ["a", "b"]
+
+    storage.saved = []
+    tokens = feature_cache.get_tokens(["a", "b", "c"], [1.0, 2.0, 1.0], np.append(texts, "Neu"))
+    assert storage.saved == ["b", "c"]
+    assert list(tokens[0]) == _expected_tokens(texts[0])
+
+
+def test_feature_cache_is_invalidated_by_preprocessing_changes():
+    storage = InMemoryFeatures()
+    FeatureCache(storage.load, storage.save).get_tokens(["a"], [1.0], texts[:1])
+
+    storage.saved = []
+    changed_analyzer = StemmingAnalyzer(ignore_stopwords=False)
+    FeatureCache(storage.load, storage.save, analyzer=changed_analyzer).get_tokens(
+        ["a"], [1.0], texts[:1]
+    )
+    assert storage.saved == ["a"]
+
+
+def test_feature_cache_only_loads_the_requested_texts(monkeypatch):
+    monkeypatch.setattr(feature_cache_module, "FEATURE_CACHE_BATCH_SIZE", 2)
+    storage = InMemoryFeatures()
+    feature_cache = FeatureCache(storage.load, storage.save)
+    feature_cache.get_tokens(["a", "b", "c"], [1.0, 1.0, 1.0], np.append(texts, "Neu"))
+
+    storage.loaded = []
+    tokens, missing = feature_cache.get_cached_tokens(["c", "a", "d"], [1.0, 1.0, 1.0])
+    assert storage.loaded == [["c", "a"], ["d"]]
+    assert missing == [2]
+    assert list(tokens[1]) == _expected_tokens(texts[0])
@@ -0,0 +1,57 @@
+import os
+
+import numpy as np
+
+from tatorte_classifier.machine_learning.feature_store import FeatureStore, corpus_snapshot
+from tatorte_classifier.machine_learning.train_model import train_model
+
+sentences = [
+    "Die Feuerwehr löschte den Brand im Dachstuhl",
+    "Der Täter wurde nach dem Mord festgenommen",
+    "Zwei Unbekannte überfielen einen Mann und raubten seine Geldbörse",
+    "Bei dem Verkehrsunfall wurden zwei Autofahrer verletzt",
+]
+x = np.asarray([sentences[i % 4] + " " + sentences[(i * 3) % 4][:15] for i in range(80)])
+y = np.arange(80) % 4 + 1
+text_ids = ["text-{}".format(i) for i in range(80)]
+times_modified = np.ones(80)
+clf_params = {"loss": "log", "max_iter": 20, "tol": None, "random_state": 0}
+
+
+def test_corpus_snapshot_changes_with_the_texts():
+    snapshot = corpus_snapshot(text_ids, times_modified, y)
+    assert snapshot == corpus_snapshot(list(text_ids), times_modified.copy(), y.copy())
+    assert snapshot != corpus_snapshot(text_ids, times_modified, np.roll(y, 1))
+    assert snapshot != corpus_snapshot(text_ids, np.append(times_modified[1:], 2.0), y)
+
+
+def test_retraining_skips_the_text_processing(tmp_path):
+    feature_store = FeatureStore(str(tmp_path), max_entries=1)
+    snapshot = corpus_snapshot(text_ids, times_modified, y)
+    model, _, test_acc, _, _ = train_model(
+        x, y, "sgd", clf_params, {}, feature_store=feature_store, snapshot=snapshot
+    )
+    assert len(os.listdir(str(tmp_path))) == 1
+
+    # only the classifier is trained, the texts aren't needed anymore
+    stages = []
+    retrained, _, retrained_acc, _, _ = train_model(
+        None,
+        None,
+        "sgd",
+        clf_params,
+        {},
+        feature_store=feature_store,
+        snapshot=snapshot,
+        progress=stages.append,
+    )
+    assert stages == ["training", "evaluating"]
+    assert retrained_acc == test_acc
+    assert retrained(x).tolist() == model(x).tolist()
+
+    # other vect_params get their own features, the least recently used ones are evicted
+    train_model(
+        x, y, "sgd", clf_params, {"binary": True}, feature_store=feature_store, snapshot=snapshot
+    )
+    key = feature_store.key(snapshot, {"binary": True}, 0.3, 900)
+    assert os.listdir(str(tmp_path)) == [key]
@@ -0,0 +1,37 @@
+import numpy as np
+
+from configuration import MIN_DESC_LEN
+from tatorte_classifier.machine_learning.get_prediction import (
+    get_batch_predictions,
+    get_predictions,
+)
+from tatorte_classifier.machine_learning.model import Model
+
+texts = [
+    "in der nacht brannte ein dachstuhl die feuerwehr konnte das feuer schnell löschen",
+    "ein mann wurde in seiner wohnung getötet die mordkommission ermittelt",
+    "zwei autos stießen an der kreuzung zusammen bei dem unfall wurde niemand verletzt",
+]
+
+
+def _train_model():
+    model = Model("sgd", {"loss": "modified_huber", "max_iter": 100, "tol": None}, {})
+    model.pipeline.fit(np.asarray(texts * 5), np.asarray([0, 1, 3] * 5))
+    return model
+
+
+def test_batch_predictions_match_single_predictions():
+    model = _train_model()
+    descs = texts + ["zu kurz"]
+    pred_idx, pred, valid = get_batch_predictions(descs, model, 2)
+
+    assert valid.tolist() == [True, True, True, False]
+    for desc, categories, probabilities, is_valid in zip(descs, pred_idx, pred, valid):
+        single_idx, single_pred = get_predictions([desc], model, 2)
+        if is_valid:
+            assert list(single_idx) == list(categories)
+            # single texts are predicted by the compact inference
+            assert np.allclose(single_pred, probabilities, atol=1e-6)
+        else:
+            assert len(desc) < MIN_DESC_LEN
+            assert len(single_idx) == 0
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from tatorte_classifier.machine_learning.hyperparameter_search import (
+    expand_search_space,
+    search,
+)
+
+sentences = [
+    "Die Feuerwehr löschte den Brand im Dachstuhl",
+    "Der Täter wurde nach dem Mord festgenommen",
+    "Zwei Unbekannte überfielen einen Mann und raubten seine Geldbörse",
+    "Bei dem Verkehrsunfall wurden zwei Autofahrer verletzt",
+]
+x = np.asarray(
+    [sentences[i % 4] + " " + sentences[(i * 3) % 4][:15] for i in range(400)], dtype=object
+)
+y = np.arange(400) % 4 + 1
+
+
+def test_expand_grid_and_random_space():
+    space = {
+        "clf": "sgd",
+        "clf_params": {"alpha": [1e-5, 1e-4], "loss": "log"},
+        "vect_params": {"ngram_range": [[1, 1], [1, 2]]},
+    }
+    trials = expand_search_space([space, {"clf": "nn"}])
+    assert len(trials) == 5
+    assert trials[0] == {
+        "clf": "sgd",
+        "clf_params": {"alpha": 1e-5, "loss": "log"},
+        "vect_params": {"ngram_range": [1, 1]},
+    }
+
+    space["clf_params"]["alpha"] = {"log_uniform": [1e-6, 1e-3]}
+    trials = expand_search_space(space, n_trials=10, random_state=0)
+    assert len(trials) == 10
+    assert all(1e-6 <= trial["clf_params"]["alpha"] <= 1e-3 for trial in trials)
+    assert trials == expand_search_space(space, n_trials=10, random_state=0)
+    with pytest.raises(ValueError):
+        expand_search_space(space)
+
+
+def test_search_stops_poor_trials_early():
+    trials = expand_search_space(
+        {
+            "clf": "sgd",
+            "clf_params": {"alpha": [1e-4, 1e-3, 10.0], "max_iter": 20, "tol": None},
+            "vect_params": {"sublinear_tf": [True, False]},
+        }
+    )
+    trials.append({"clf": "sgd", "clf_params": {"loss": "unknown"}, "vect_params": {}})
+    reported = []
+    best = search(
+        x,
+        y,
+        trials,
+        values_per_category=100,
+        on_trial=lambda result, model: reported.append((result, model)),
+    )
+
+    assert len(reported) == len(trials)
+    states = [result["state"] for result, _ in reported]
+    assert states.count("failed") == 1
+    assert states.count("done") == 2
+    assert states.count("stopped") == len(trials) - 3
+    assert [model is not None for _, model in reported] == [state == "done" for state in states]
+    assert best["state"] == "done" and best["metadata"]["clf_params"]["alpha"] != 10.0
+    # 56 of the 280 training texts are the validation texts
+    assert best["performance_data"]["train_size"] == 224
+    # the trials are ranked on the validation texts, only the best one is tested
+    assert [result for result, _ in reported if "test_acc" in result["performance_data"]] == [best]
+    evaluated = [result for result, _ in reported if result["state"] != "failed"]
+    assert all("val_acc" in result["performance_data"] for result in evaluated)
+
+    model = reported[-1][1]
+    assert model(x[:4]).tolist() == y[:4].tolist()
+    # the trials with the same vect_params share the fitted vectorizer
+    assert model.stemmer is model.pipeline.named_steps["vect"].analyzer
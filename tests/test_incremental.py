@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from tatorte_classifier.machine_learning.incremental import update_model
+from tatorte_classifier.machine_learning.model import Model
+from tatorte_classifier.machine_learning.train_model import train_model
+
+sentences = [
+    "Die Feuerwehr löschte den Brand im Dachstuhl",
+    "Der Täter wurde nach dem Mord festgenommen",
+    "Zwei Unbekannte überfielen einen Mann und raubten seine Geldbörse",
+    "Bei dem Verkehrsunfall wurden zwei Autofahrer verletzt",
+]
+x = np.asarray([sentences[i % 4] + " " + sentences[(i * 3) % 4][:15] for i in range(80)])
+y = np.arange(80) % 4 + 1
+clf_params = {"loss": "log", "max_iter": 20, "tol": None, "random_state": 0}
+
+
+def test_only_sgd_models_are_incremental():
+    with pytest.raises(ValueError):
+        Model("svm", {}, {}, incremental=True)
+
+
+def test_update_learns_changed_texts():
+    model, _, test_acc, _, _ = train_model(
+        x, y, "sgd", clf_params, {"n_features": 2 ** 12, "sublinear_tf": True}, incremental=True
+    )
+    assert test_acc == 1.0
+    tfidf = model.pipeline.named_steps["tfidf"]
+    idf = tfidf.idf_.copy()
+    assert tfidf.sublinear_tf and len(idf) == 2 ** 12
+
+    # words the model has never seen before get a column without changing the others
+    new_x = np.asarray(["Der Brandstifter zündete die Scheune an, die Feuerwehr löschte"] * 20)
+    new_y = np.full(20, 2)
+    model, progressive_acc, n_texts = update_model(model, new_x, new_y, n_epochs=5)
+    assert (progressive_acc, n_texts) == (0.0, 20)
+    assert model(new_x[:1]).tolist() == [2]
+    assert np.array_equal(model.pipeline.named_steps["tfidf"].idf_, idf)
+
+    # partial_fit can't learn categories the model doesn't know
+    with pytest.raises(ValueError):
+        update_model(model, new_x, np.full(20, 9))
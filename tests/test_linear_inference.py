@@ -0,0 +1,63 @@
+import os
+
+import numpy as np
+import pytest
+
+from tatorte_classifier.machine_learning.linear_inference import (
+    compile_model,
+    get_compiled_model,
+    top_k,
+)
+from tatorte_classifier.machine_learning.model import Model
+from tatorte_classifier.machine_learning.model_format import load_model_dir, save_model_dir
+
+sentences = [
+    "Die Feuerwehr löschte den Brand im Dachstuhl",
+    "Der Täter wurde nach dem Mord festgenommen",
+    "Zwei Unbekannte überfielen einen Mann und raubten seine Geldbörse",
+    "Bei dem Verkehrsunfall wurden zwei Autofahrer verletzt",
+    "Die Beamten fanden Kokain und Cannabis bei der Durchsuchung",
+]
+x = np.asarray([sentences[i % 5] + " " + sentences[(i * 3) % 5][:20] for i in range(60)])
+y = np.arange(60) % 5
+x_test = ["Der Brand wurde von der Feuerwehr gelöscht", "Unbekanntes Wort", "Kokain Kokain Unfall"]
+
+
+@pytest.mark.parametrize(
+    "clf_params, vect_params, y",
+    [
+        ({"loss": "log"}, {}, y),
+        ({"loss": "modified_huber"}, {"sublinear_tf": True, "binary": True}, y),
+        ({"loss": "log"}, {"norm": "l1", "use_idf": False}, y % 2),
+    ],
+)
+def test_compact_model_predicts_like_the_pipeline(tmp_path, clf_params, vect_params, y):
+    model = Model("sgd", dict(clf_params, max_iter=20, tol=None, random_state=0), vect_params)
+    model.pipeline.fit(x, y)
+    path = os.path.join(str(tmp_path), "model")
+    save_model_dir(model, path)
+
+    expected = model.pipeline.predict_proba(x_test)
+    array_model = load_model_dir(path)
+    for source in (model, array_model):
+        compact = compile_model(source)
+        np.testing.assert_allclose(compact.predict_proba(x_test), expected, atol=1e-6)
+    # the memory mapped weights aren't copied
+    assert compact.coef is array_model.pipeline.classifier.coef
+    assert isinstance(compact.coef, np.memmap)
+
+
+def test_only_linear_models_with_probabilities_are_compiled():
+    nn = Model("nn", {"hidden_layer_sizes": (4,), "max_iter": 5}, {})
+    nn.pipeline.fit(x, y)
+    hinge = Model("sgd", {"max_iter": 5, "tol": None}, {})
+    hinge.pipeline.fit(x, y)
+    assert compile_model(nn) is None
+    assert get_compiled_model(hinge) is None
+    assert get_compiled_model(hinge) is None
+
+
+def test_top_k():
+    probas = np.asarray([[0.1, 0.5, 0.15, 0.25], [0.4, 0.3, 0.2, 0.1]])
+    assert top_k(probas, 2).tolist() == [[1, 3], [0, 1]]
+    assert top_k(probas, 10).tolist() == np.argsort(-probas, axis=1).tolist()
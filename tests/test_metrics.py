@@ -0,0 +1,86 @@
+from types import SimpleNamespace
+
+import pytest
+
+from tatorte_classifier.metrics import MetricsRegistry, MongoCommandListener, Stopwatch
+
+
+def test_histograms_and_counters_are_rendered_in_the_prometheus_format():
+    registry = MetricsRegistry(prefix="test_")
+    histogram = registry.histogram("seconds", "Some seconds", ["stage"], buckets=(0.1, 1.0))
+    counter = registry.counter("texts_total", "Some texts", ["endpoint"])
+    histogram.observe(0.05, stage="a")
+    histogram.observe(0.5, stage="a")
+    histogram.observe(5, stage="a")
+    with histogram.time(stage="b"):
+        pass
+    counter.inc(3, endpoint='say "hi"')
+
+    @registry.collector("size", "gauge", "A size")
+    def collect_size():
+        return [({}, 7)]
+
+    lines = registry.render().splitlines()
+    assert "# TYPE test_seconds histogram" in lines
+    assert 'test_seconds_bucket{stage="a",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{stage="a",le="1.0"} 2' in lines
+    assert 'test_seconds_bucket{stage="a",le="+Inf"} 3' in lines
+    assert 'test_seconds_count{stage="a"} 3' in lines
+    assert 'test_seconds_sum{stage="a"} 5.55' in lines
+    assert 'test_seconds_count{stage="b"} 1' in lines
+    assert 'test_texts_total{endpoint="say \\"hi\\""} 3.0' in lines
+    assert "# TYPE test_size gauge" in lines
+    assert "test_size 7" in lines
+    with pytest.raises(ValueError):
+        histogram.observe(1.0, endpoint="a")
+
+
+def test_disabled_metrics_are_no_ops():
+    registry = MetricsRegistry(enabled=False, prefix="test_")
+    histogram = registry.histogram("seconds", "Some seconds", ["stage"])
+    counter = registry.counter("texts_total", "Some texts")
+    with histogram.time(stage="a"):
+        pass
+    histogram.observe(1.0, stage="a")
+    counter.inc()
+    assert histogram.time(stage="a") is histogram.time(stage="b")
+    assert histogram.samples() == [] and counter.samples() == []
+
+
+def test_stopwatch_observes_every_stage():
+    registry = MetricsRegistry(prefix="test_")
+    histogram = registry.histogram("stage_seconds", "Stages", ["kind", "stage"])
+    stopwatch = Stopwatch(histogram, kind="train")
+    stopwatch.lap("loading")
+    stopwatch.lap("training")
+    stopwatch.lap()
+    counts = {
+        labels["stage"]: value
+        for name, labels, value in histogram.samples()
+        if name == "test_stage_seconds_count"
+    }
+    assert counts == {"loading": 1, "training": 1}
+
+
+def test_mongo_listener_observes_commands_by_collection():
+    registry = MetricsRegistry(prefix="test_")
+    histogram = registry.histogram(
+        "mongo_seconds", "Mongo", ["command", "collection", "outcome"], buckets=(0.01,)
+    )
+    listener = MongoCommandListener(histogram)
+    for request_id, (command, outcome) in enumerate([("find", "success"), ("insert", "failure")]):
+        event = SimpleNamespace(
+            command_name=command,
+            command={command: "texts"},
+            connection_id=("localhost", 27017),
+            request_id=request_id,
+            duration_micros=2000,
+        )
+        listener.started(event)
+        getattr(listener, "succeeded" if outcome == "success" else "failed")(event)
+
+    lines = registry.render().splitlines()
+    find = '{command="find",collection="texts",outcome="success"}'
+    insert = '{command="insert",collection="texts",outcome="failure"}'
+    assert "test_mongo_seconds_count" + find + " 1" in lines
+    assert "test_mongo_seconds_sum" + insert + " 0.002" in lines
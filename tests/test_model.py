@@ -0,0 +1,35 @@
+import pickle
+
+from nltk.stem import SnowballStemmer
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from tatorte_classifier.machine_learning.model import StemmingAnalyzer
+
+docs = [
+    "Am Montag Abend brach ein unbekannter Täter in ein Einfamilien Haus nahe vom Alex ein.",
+    "Die Polizei sucht nach Zeugen, die den Täter am Montag gesehen haben.",
+]
+
+
+def test_stemming_analyzer_matches_uncached_stemming():
+    stemmer = SnowballStemmer("german", ignore_stopwords=True)
+    analyzer = TfidfVectorizer().build_analyzer()
+    stemming_analyzer = StemmingAnalyzer()
+
+    for doc in docs * 2:
+        assert stemming_analyzer(doc) == [stemmer.stem(w) for w in analyzer(doc)]
+    assert stemming_analyzer.stats()["hit_rate"] > 0.5
+
+
+def test_stemming_analyzer_cache_is_bounded():
+    stemming_analyzer = StemmingAnalyzer(max_cache_size=3)
+    stemming_analyzer(docs[0])
+    assert len(stemming_analyzer.cache) == 3
+
+
+def test_stemming_analyzer_is_picklable():
+    stemming_analyzer = StemmingAnalyzer()
+    stemming_analyzer(docs[0])
+    loaded = pickle.loads(pickle.dumps(stemming_analyzer))
+    assert loaded.cache == stemming_analyzer.cache
+    assert loaded(docs[1]) == stemming_analyzer(docs[1])
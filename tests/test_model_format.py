@@ -0,0 +1,113 @@
+import os
+import threading
+from unittest import mock
+
+import dill
+import numpy as np
+import pytest
+
+from tatorte_classifier.machine_learning import get_prediction
+from tatorte_classifier.machine_learning.model import Model
+from tatorte_classifier.machine_learning.model_format import (
+    ArrayModel,
+    convert_model_file,
+    load_model_dir,
+    model_dir_stat,
+    save_model_dir,
+)
+
+sentences = [
+    "Die Feuerwehr löschte den Brand im Dachstuhl",
+    "Der Täter wurde nach dem Mord festgenommen",
+    "Zwei Unbekannte überfielen einen Mann und raubten seine Geldbörse",
+    "Bei dem Verkehrsunfall wurden zwei Autofahrer verletzt",
+    "Die Beamten fanden Kokain und Cannabis bei der Durchsuchung",
+]
+x = np.asarray([sentences[i % 5] + " " + sentences[(i * 3) % 5][:20] for i in range(60)])
+y = np.arange(60) % 5
+x_test = np.asarray(
+    ["Der Brand wurde von der Feuerwehr gelöscht", "Unbekanntes Wort", "Kokain Kokain Unfall"]
+)
+
+
+def _trained_model(clf, clf_params, vect_params={}, y=y):
+    model = Model(clf, clf_params, vect_params)
+    model.pipeline.fit(x, y)
+    return model
+
+
+@pytest.mark.parametrize(
+    "clf, clf_params, vect_params, y",
+    [
+        ("sgd", {"loss": "log", "max_iter": 20, "tol": None}, {}, y),
+        ("sgd", {"loss": "modified_huber", "max_iter": 20, "tol": None}, {"sublinear_tf": True}, y),
+        ("sgd", {"loss": "log", "max_iter": 20, "tol": None}, {"norm": "l1"}, y % 2),
+        ("nn", {"hidden_layer_sizes": (8,), "max_iter": 50}, {"binary": True}, y),
+    ],
+)
+def test_model_dir_predicts_like_the_pipeline(tmp_path, clf, clf_params, vect_params, y):
+    model = _trained_model(clf, clf_params, vect_params, y)
+    path = os.path.join(str(tmp_path), "model-a")
+    save_model_dir(model, path)
+
+    loaded = load_model_dir(path)
+    assert isinstance(loaded, ArrayModel)
+    assert isinstance(loaded.pipeline.classifier.classes_, np.ndarray)
+    np.testing.assert_allclose(
+        loaded.pipeline.predict_proba(x_test), model.pipeline.predict_proba(x_test), atol=1e-10
+    )
+    assert loaded(x_test).tolist() == model(x_test).tolist()
+
+
+def test_svm_is_stored_as_pickle(tmp_path):
+    model = _trained_model("svm", {"probability": True})
+    path = os.path.join(str(tmp_path), "model-b")
+    save_model_dir(model, path)
+
+    loaded = load_model_dir(path)
+    assert isinstance(loaded, Model)
+    np.testing.assert_allclose(
+        loaded.pipeline.predict_proba(x_test), model.pipeline.predict_proba(x_test)
+    )
+
+
+def test_saving_replaces_a_model_dir(tmp_path):
+    path = os.path.join(str(tmp_path), "model-c")
+    save_model_dir(_trained_model("sgd", {"loss": "log", "max_iter": 5, "tol": None}), path)
+    mtime, size = model_dir_stat(path)
+    os.utime(os.path.join(path, "manifest.json"), (mtime - 10, mtime - 10))
+
+    save_model_dir(_trained_model("sgd", {"loss": "log", "max_iter": 5, "tol": None}), path)
+    assert model_dir_stat(path)[0] > mtime - 10
+    assert sorted(os.listdir(str(tmp_path))) == ["model-c"]
+
+
+def test_loading_waits_for_a_model_dir_being_replaced(tmp_path):
+    path = os.path.join(str(tmp_path), "model-e")
+    save_model_dir(_trained_model("sgd", {"loss": "log", "max_iter": 5, "tol": None}), path)
+    # the moment between the two renames of save_model_dir
+    os.rename(path, path + ".old")
+    os.makedirs(path + ".tmp")
+    threading.Timer(0.1, os.rename, (path + ".old", path)).start()
+
+    with mock.patch.object(get_prediction, "MODEL_DIR", str(tmp_path)):
+        assert isinstance(get_prediction.load_model("model-e"), ArrayModel)
+        with pytest.raises(FileNotFoundError):
+            get_prediction.load_model("model-f")
+
+
+def test_sav_models_are_converted_once(tmp_path):
+    model_path = os.path.join(str(tmp_path), "model-d.sav")
+    path = os.path.join(str(tmp_path), ".shared", "model-d.sav")
+    with open(model_path, "wb") as f:
+        dill.dump(_trained_model("sgd", {"loss": "log", "max_iter": 5, "tol": None}), f)
+
+    assert isinstance(load_model_dir(convert_model_file(model_path, path)), ArrayModel)
+    mtime = model_dir_stat(path)[0]
+    convert_model_file(model_path, path)
+    assert model_dir_stat(path)[0] == mtime
+
+    # a changed .sav file is converted again
+    os.utime(model_path, (mtime + 10, mtime + 10))
+    convert_model_file(model_path, path)
+    assert load_model_dir(path).manifest["metadata"]["source"]["mtime"] == mtime + 10
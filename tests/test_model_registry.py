@@ -0,0 +1,92 @@
+import os
+
+import pytest
+
+from tatorte_classifier.machine_learning.model_registry import ModelRegistry
+
+
+class CountingLoader:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, model_id):
+        self.calls.append(model_id)
+        return object()
+
+
+def _write_model(model_dir, name, content=b"model", mtime=None):
+    path = os.path.join(str(model_dir), name)
+    with open(path, "wb") as f:
+        f.write(content)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def test_registry_caches_models(tmp_path):
+    _write_model(tmp_path, "model-a.sav")
+    loader = CountingLoader()
+    registry = ModelRegistry(loader, str(tmp_path), max_models=2)
+
+    model = registry.get("model-a.sav")
+    assert registry.get("model-a.sav") is model
+    assert loader.calls == ["model-a.sav"]
+    stats = registry.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_registry_evicts_least_recently_used(tmp_path):
+    for name in ["model-a.sav", "model-b.sav", "model-c.sav"]:
+        _write_model(tmp_path, name)
+    loader = CountingLoader()
+    registry = ModelRegistry(loader, str(tmp_path), max_models=2)
+
+    registry.get("model-a.sav")
+    registry.get("model-b.sav")
+    registry.get("model-a.sav")
+    registry.get("model-c.sav")
+    assert registry.stats()["cached_models"] == ["model-a.sav", "model-c.sav"]
+    assert registry.stats()["evictions"] == 1
+
+
+def test_registry_respects_byte_budget(tmp_path):
+    _write_model(tmp_path, "model-a.sav", b"a" * 100)
+    _write_model(tmp_path, "model-b.sav", b"b" * 100)
+    registry = ModelRegistry(CountingLoader(), str(tmp_path), max_models=10, max_bytes=150)
+
+    registry.get("model-a.sav")
+    registry.get("model-b.sav")
+    assert registry.stats()["cached_models"] == ["model-b.sav"]
+
+
+def test_registry_reloads_changed_files(tmp_path):
+    _write_model(tmp_path, "model-a.sav", mtime=1000)
+    loader = CountingLoader()
+    registry = ModelRegistry(loader, str(tmp_path))
+
+    old_model = registry.get("model-a.sav")
+    _write_model(tmp_path, "model-a.sav", b"new model", mtime=2000)
+    assert registry.get("model-a.sav") is not old_model
+    assert len(loader.calls) == 2
+    assert registry.stats()["reloads"] == 1
+
+
+def test_registry_does_not_cache_missing_models(tmp_path):
+    loader = CountingLoader()
+    registry = ModelRegistry(loader, str(tmp_path))
+
+    registry.get("model-missing.sav")
+    registry.get("model-missing.sav")
+    assert len(loader.calls) == 2
+    assert registry.stats()["cached_models"] == []
+
+
+def test_registry_forgets_the_loading_lock_of_failed_loads(tmp_path):
+    def failing_loader(model_id):
+        raise ValueError("corrupt model")
+
+    registry = ModelRegistry(failing_loader, str(tmp_path))
+    _write_model(tmp_path, "model-corrupt.sav")
+    with pytest.raises(ValueError):
+        registry.get("model-corrupt.sav")
+    assert registry._loading_locks == {}
@@ -0,0 +1,138 @@
+import json
+import fnmatch
+
+import numpy as np
+
+from tatorte_classifier.machine_learning.prediction_cache import (
+    MemoryBackend,
+    PredictionCache,
+    RedisBackend,
+)
+
+descs = [
+    "in der nacht brannte der dachstuhl eines einfamilienhauses vollständig aus",
+    "zwei unbekannte schlugen den geschädigten und raubten seine geldbörse",
+]
+
+
+class CountingPipeline:
+    def __init__(self):
+        self.predicted = []
+
+    def predict_proba(self, descs):
+        self.predicted.extend(descs)
+        return np.tile([0.1, 0.7, 0.2], (len(descs), 1))
+
+
+class FakeModel:
+    def __init__(self):
+        self.pipeline = CountingPipeline()
+
+
+class FakeModels:
+    def __init__(self):
+        self.model = FakeModel()
+        self.version = 1.0
+
+    def __call__(self, model_name):
+        return model_name, self.version, self.model
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeRedis:
+    """Stand-in for the few redis commands the backend uses, without expiration"""
+
+    def __init__(self):
+        self.data = {}
+
+    def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    def pipeline(self):
+        return self
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value.encode("utf-8")
+
+    def execute(self):
+        pass
+
+    def scan_iter(self, match):
+        return [key for key in list(self.data) if fnmatch.fnmatch(key, match)]
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+
+def test_only_uncached_texts_are_predicted():
+    models = FakeModels()
+    cache = PredictionCache(MemoryBackend(10), models)
+
+    first = cache.get_batch_prediction_lists("model-a", descs[:1], 2)
+    assert cache.get_batch_prediction_lists("model-a", descs, 2)[0] == first[0]
+    assert models.model.pipeline.predicted == descs
+    assert cache.get_prediction_list("model-a", descs[0], 2) == first[0]
+    assert cache.get_prediction_list("model-a", descs[0], 3) != first[0]
+    assert len(models.model.pipeline.predicted) == 3
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (2, 3)
+
+
+def test_changed_models_invalidate_their_predictions():
+    models = FakeModels()
+    cache = PredictionCache(MemoryBackend(10), models)
+    cache.get_batch_prediction_lists("model-a", descs, 2)
+    cache.get_batch_prediction_lists("model-b", descs, 2)
+
+    models.version = 2.0
+    cache.get_batch_prediction_lists("model-a", descs, 2)
+    assert len(models.model.pipeline.predicted) == 6
+    assert cache.stats()["size"] == 4
+
+
+def test_memory_backend_evicts_and_expires():
+    clock = FakeClock()
+    backend = MemoryBackend(2, ttl=10, clock=clock)
+    backend.set_many({"a": 1, "b": 2})
+    assert backend.get_many(["a"]) == [1]
+    backend.set_many({"c": 3})
+    assert backend.get_many(["a", "b", "c"]) == [1, None, 3]
+
+    clock.now = 10
+    assert backend.get_many(["a", "c"]) == [None, None]
+    stats = backend.stats()
+    assert (stats["evictions"], stats["expirations"], stats["size"]) == (1, 2, 0)
+
+
+def test_redis_backend():
+    client = FakeRedis()
+    cache = PredictionCache(RedisBackend(client), FakeModels())
+    preds = cache.get_batch_prediction_lists("model-a", descs, 2)
+    assert json.loads(client.data[next(iter(client.data))]) in preds
+
+    assert cache.get_batch_prediction_lists("model-a", descs, 2) == preds
+    assert cache.stats()["hits"] == 2
+    assert cache.invalidate("model-a") == 2
+    assert client.data == {}
+
+
+class BrokenRedis(FakeRedis):
+    def mget(self, keys):
+        raise ConnectionError("redis is down")
+
+
+def test_failing_backend_predicts_uncached():
+    models = FakeModels()
+    cache = PredictionCache(RedisBackend(BrokenRedis()), models)
+    assert len(cache.get_batch_prediction_lists("model-a", descs, 2)) == 2
+    assert models.model.pipeline.predicted == descs
+    assert cache.stats()["errors"] == 1
@@ -0,0 +1,62 @@
+from tatorte_classifier.text_sampler import RandomTextSampler
+
+
+class InMemoryTexts:
+    def __init__(self, labeled, unlabeled):
+        self.texts = {text_id: {"_id": text_id} for text_id in labeled + unlabeled}
+        self.unlabeled = unlabeled
+        self.n_samples = 0
+
+    def sample_ids(self, size, query=None):
+        self.n_samples += 1
+        ids = self.unlabeled if query else list(self.texts)
+        return ids[:size]
+
+    def get_text(self, text_id):
+        return self.texts.get(text_id)
+
+
+def test_sampler_prefers_unlabeled_texts():
+    storage = InMemoryTexts(labeled=["a", "b", "c"], unlabeled=["x", "y"])
+    sampler = RandomTextSampler(
+        storage.sample_ids, storage.get_text, buffer_size=4, unlabeled_share=1.0, refill_at=0
+    )
+
+    texts = [sampler.get()["_id"] for _ in range(4)]
+    assert texts == ["x", "y", "a", "b"]
+    assert storage.n_samples == 2
+
+
+def test_sampler_samples_uniformly_by_default():
+    storage = InMemoryTexts(labeled=["a", "b", "c"], unlabeled=["x", "y"])
+    sampler = RandomTextSampler(storage.sample_ids, storage.get_text, buffer_size=4, refill_at=0)
+
+    assert [sampler.get()["_id"] for _ in range(4)] == ["a", "b", "c", "x"]
+    assert storage.n_samples == 1
+
+
+def test_sampler_doesnt_buffer_ids_twice():
+    storage = InMemoryTexts(labeled=[], unlabeled=["x", "y"])
+    sampler = RandomTextSampler(
+        storage.sample_ids, storage.get_text, buffer_size=4, unlabeled_share=1.0, refill_at=0
+    )
+
+    assert [sampler.get()["_id"] for _ in range(2)] == ["x", "y"]
+    assert storage.n_samples == 2
+    # the buffer was empty, the third text is from a new sample
+    assert sampler.get() == {"_id": "x"}
+    assert storage.n_samples == 4
+
+
+def test_sampler_skips_deleted_texts_and_refills():
+    storage = InMemoryTexts(labeled=["a", "b"], unlabeled=[])
+    sampler = RandomTextSampler(storage.sample_ids, storage.get_text, buffer_size=2, refill_at=0)
+
+    del storage.texts["a"]
+    assert sampler.get() == {"_id": "b"}
+    assert sampler.get() == {"_id": "b"}
+
+
+def test_sampler_without_texts():
+    storage = InMemoryTexts(labeled=[], unlabeled=[])
+    assert RandomTextSampler(storage.sample_ids, storage.get_text).get() is None
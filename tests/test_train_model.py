@@ -0,0 +1,100 @@
+import numpy as np
+
+from tatorte_classifier.machine_learning.model import Model
+from tatorte_classifier.machine_learning.train_model import (
+    _fold_features,
+    balance_data,
+    clean_data,
+    create_features,
+    evaluate_model,
+    train_model,
+)
+
+x = np.asarray(
+    [
+        "Bei einer Verkehrskontrolle wurden Drogen gefunden",
+        "In die Wohnung wurde eingebrochen",
+        "Der Fahrer hatte Alkohol getrunken",
+        "Am Dienstagmorgen wurde ein Mann überfallen",
+        "Am Dienstagmorgen brannte ein Haus",
+        "Das Fahrrad wurde gestohlen",
+    ],
+    dtype=object,
+)
+y = np.asarray([5, 4, 2, 3, 1, 2])
+
+
+def test_clean_data():
+    tokens, categories = clean_data(x, y, tokens=np.arange(len(x)))
+    assert tokens.tolist() == [0, 1, 4, 5]
+    assert categories.tolist() == [4, 3, 1, 2]
+    # the categories of the caller are not changed
+    assert y.tolist() == [5, 4, 2, 3, 1, 2]
+
+
+def test_balance_data():
+    categories = np.asarray([0] * 10 + [1] * 3 + [2] * 6)
+    texts, balanced = balance_data(np.arange(len(categories)), categories, 5)
+    assert np.bincount(balanced).tolist() == [5, 3, 5]
+    assert np.array_equal(categories[texts], balanced)
+    assert np.all(np.diff(texts) > 0)
+
+
+def test_evaluate_model_predicts_the_test_texts_once():
+    predicted = []
+
+    def model(texts):
+        predicted.append(len(texts))
+        return np.ones(len(texts), dtype=int)
+
+    train_acc, test_acc, conf_matrix = evaluate_model(
+        np.arange(4), np.arange(2), np.asarray([1, 1, 2, 2]), np.asarray([1, 2]), model
+    )
+    assert predicted == [2, 4]
+    assert (train_acc, test_acc) == (0.5, 0.5)
+    assert conf_matrix.tolist() == [[1, 0], [1, 0]]
+
+
+def test_cross_validation():
+    sentences = [
+        "Die Feuerwehr löschte den Brand im Dachstuhl",
+        "Der Täter wurde nach dem Mord festgenommen",
+        "Zwei Unbekannte überfielen einen Mann und raubten seine Geldbörse",
+        "Bei dem Verkehrsunfall wurden zwei Autofahrer verletzt",
+    ]
+    texts = np.asarray([sentences[i % 4] + " " + sentences[(i * 3) % 4][:15] for i in range(80)])
+    clf_params = {"max_iter": 20, "tol": None, "random_state": 0}
+    _, _, _, _, evaluation = train_model(
+        texts, np.arange(80) % 4 + 1, "sgd", clf_params, {}, cv_folds=4
+    )
+    cv = evaluation["cv"]
+    assert len(cv["folds"]) == 4
+    assert cv["mean_test_acc"] == np.mean([fold["test_acc"] for fold in cv["folds"]])
+    # every one of the 56 training texts is in the test fold once
+    assert np.sum(cv["confusion_matrix"]) == 56
+    assert cv["labels"] == evaluation["labels"] == [1, 2, 3, 4]
+
+
+def test_folds_fit_the_vectorizer_without_the_held_out_fold():
+    model = Model("sgd", {}, {})
+    folds = [(np.asarray([0, 1, 2, 3]), np.asarray([4, 5])), (np.asarray([2, 3, 4, 5]), [0, 1])]
+    features = list(_fold_features(model, x, folds))
+
+    for (train, test), (x_train, x_test) in zip(folds, features):
+        vocabulary = {token for text in x[train] for token in model.stemmer(text)}
+        assert x_train.shape == (4, len(vocabulary))
+        assert x_test.shape == (2, len(vocabulary))
+
+
+def test_features_of_tokens_match_the_features_of_texts():
+    model = Model("sgd", {}, {})
+    tokens = np.empty(len(x), dtype=object)
+    tokens[:] = [model.stemmer(text) for text in x]
+
+    from_texts = create_features(Model("sgd", {}, {}).pipeline.steps[0][1], (x, x, y, y))
+    from_tokens = create_features(model.pipeline.steps[0][1], (tokens, tokens, y, y), True)
+    assert from_tokens.vectorizer.vocabulary_ == from_texts.vectorizer.vocabulary_
+    assert (from_tokens.x_test != from_texts.x_test).nnz == 0
+    # the fitted vectorizer of the model analyzes texts again
+    assert from_tokens.vectorizer.analyzer is model.stemmer
+    assert (from_tokens.vectorizer.transform(x) != from_texts.x_test).nnz == 0
@@ -0,0 +1,84 @@
+import os
+import time
+import multiprocessing
+from queue import Full
+from unittest import mock
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+from tatorte_classifier import database, training_jobs  # noqa: E402
+
+
+@pytest.fixture
+def models():
+    collection = mongomock.MongoClient().db.models
+    with mock.patch.object(database, "models", collection):
+        yield collection
+
+
+def test_submit_doesnt_record_jobs_of_a_full_queue(models):
+    queue = training_jobs.TrainingJobQueue(n_workers=1, max_queued=1)
+    with mock.patch.object(queue, "_start_workers"):
+        queue.submit({"clf": "sgd"})
+        with pytest.raises(Full):
+            queue.submit({"clf": "sgd"})
+
+    assert models.count_documents({}) == 1
+
+
+def test_stale_jobs_are_failed_and_jobs_arent_listed_as_models(models):
+    database.create_job({"clf": "sgd"}, "alive")
+    database.create_job({"clf": "sgd"}, "stopped")
+    models.insert_one({"state": "running", "time_created": 0.0})
+    models.insert_one({"state": "done", "time_created": 0.0})
+    models.update_many({"owner": {"$ne": "alive"}}, {"$set": {"heartbeat": 0.0}})
+
+    database.touch_jobs("alive")
+    assert database.fail_stale_jobs(time.time() - 60) == 2
+
+    assert [job["owner"] for job in database.get_active_jobs()] == ["alive"]
+    states = sorted(model["state"] for model in database.get_all_models())
+    assert states == ["done", "failed", "failed"]
+
+
+def test_cross_validated_jobs_get_the_tokens_despite_stored_features():
+    assert training_jobs._refits_vectorizer({"clf": "sgd", "cv_folds": 5})
+    assert not training_jobs._refits_vectorizer({"clf": "sgd", "cv_folds": 1})
+    assert not training_jobs._refits_vectorizer({"clf": "sgd", "cv_folds": 5, "incremental": True})
+    assert not training_jobs._refits_vectorizer({"search": {}, "trials": [], "cv_folds": 5})
+
+
+def _sleep_with_worker(conn):
+    worker = multiprocessing.get_context("fork").Process(target=time.sleep, args=(60,))
+    worker.start()
+    conn.send(worker.pid)
+    time.sleep(60)
+
+
+def _is_running(pid):
+    try:
+        with open("/proc/{}/stat".format(pid)) as f:
+            return f.read().split(")")[-1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+@pytest.mark.skipif(not os.path.exists("/proc"), reason="needs /proc")
+def test_terminating_a_training_process_terminates_its_workers():
+    context = multiprocessing.get_context("fork")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(
+        target=training_jobs._run_in_process, args=(_sleep_with_worker, sender)
+    )
+    process.start()
+    worker_pid = receiver.recv()
+
+    training_jobs._terminate(process)
+    process.join(10)
+    for _ in range(100):
+        if not _is_running(worker_pid):
+            break
+        time.sleep(0.1)
+    assert not _is_running(worker_pid)
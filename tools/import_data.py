@@ -1,11 +1,24 @@
-import numpy as np
-import requests
-import tqdm
-
 """
-This tool imports data_x.npy and data_y.npy generated by create_data.ipynb into the mongo db
+This tool imports texts into the mongo db through the bulk ingestion endpoint /api/texts/bulk/
 
+Usage:
+    python tools/import_data.py --npy data_x.npy data_y.npy
+    python tools/import_data.py --jsonl texts.jsonl --url http://localhost:5000
+
+The .npy files are data_x.npy and data_y.npy generated by create_data.ipynb, their categories
+are converted to the categories of the classifier. A JSONL file has one json object with the
+keys data and categories per line. The input is streamed in batches, at most --in-flight
+batches are sent at the same time.
 """
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore, Lock
+
+import numpy as np
+import requests
+import tqdm
 
 
 def convert_to_string(x):
@@ -15,20 +28,145 @@ def convert_to_string(x):
         return x
 
 
-X = np.load("/home/peer/Data/data_x.npy")
-X = np.vectorize(convert_to_string)(X)
-Y = np.load("/home/peer/Data/data_y.npy")
+def convert_categories(y):
+    """Converts the categories of create_data.ipynb, returns -1 for dropped categories
+    """
+
+    if y in (7, 8, 10):
+        return -1
+    # combine categories 3, 4, 5
+    if y in (4, 5):
+        y = 3
+    # change indexes
+    if y == 6:
+        y = 4
+    if y == 9:
+        y = 5
+    return y - 1
+
+
+def read_npy(x_path, y_path, start=0, end=None):
+    """Yields the texts of data_x.npy and data_y.npy. The arrays are memory mapped if possible,
+    so only the current text is read from disk
+    """
+
+    try:
+        X = np.load(x_path, mmap_mode="r")
+    except ValueError:  # object arrays can't be memory mapped
+        X = np.load(x_path, allow_pickle=True)
+    Y = np.load(y_path, mmap_mode="r")
+    for x, y in zip(X[start:end], Y[start:end]):
+        category = convert_categories(int(y))
+        if category >= 0:
+            yield {"data": convert_to_string(x), "categories": [category]}
+
+
+def read_jsonl(path, start=0, end=None):
+    """Yields the texts of a JSONL file
+    """
+
+    with open(path, encoding="utf-8") as f:
+        for i, line in enumerate(f):
+            if end is not None and i >= end:
+                break
+            if i >= start and line.strip():
+                yield json.loads(line)
+
+
+def batches(documents, batch_size):
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def import_data(documents, url, batch_size=1000, in_flight=4):
+    """Send the texts as NDJSON to the bulk ingestion endpoint
+
+    Arguments:
+        documents {Iterable[dict]} -- The texts with the keys data and categories
+        url {str} -- Url of the server
+
+    Keyword Arguments:
+        batch_size {int} -- Number of texts per request (default: {1000})
+        in_flight {int} -- Maximum number of requests sent at the same time (default: {4})
+
+    Returns:
+        Tuple[int, int] -- Number of inserted and failed texts
+    """
+
+    session = requests.Session()
+    slots = BoundedSemaphore(in_flight)
+    lock = Lock()
+    endpoint = url.rstrip("/") + "/api/texts/bulk/"
+    counts = {"inserted": 0, "failed": 0}
+    progress = tqdm.tqdm(unit="texts")
+    time_started = time.time()
+
+    def send(batch):
+        try:
+            body = "\n".join(json.dumps(document) for document in batch)
+            response = session.post(
+                endpoint,
+                data=body.encode("utf-8"),
+                headers={"Content-Type": "application/x-ndjson"},
+            )
+            response.raise_for_status()
+            result = response.json()
+            with lock:
+                counts["inserted"] += result["inserted"]
+                counts["failed"] += len(result["errors"])
+            for error in result["errors"][:3]:
+                tqdm.tqdm.write("Failed: {}".format(error))
+        except Exception as err:
+            with lock:
+                counts["failed"] += len(batch)
+            tqdm.tqdm.write("Request failed: {}".format(err))
+        finally:
+            progress.update(len(batch))
+            progress.set_postfix(
+                texts_per_s="{:.0f}".format(counts["inserted"] / (time.time() - time_started))
+            )
+            slots.release()
+
+    with ThreadPoolExecutor(max_workers=in_flight) as executor:
+        for batch in batches(documents, batch_size):
+            # blocks until a request finished, so only in_flight batches are held in memory
+            slots.acquire()
+            executor.submit(send, batch)
+    progress.close()
+
+    duration = time.time() - time_started
+    print(
+        "Inserted {} texts ({} failed) in {:.1f}s, {:.0f} texts/s".format(
+            counts["inserted"], counts["failed"], duration, counts["inserted"] / max(duration, 1e-9)
+        )
+    )
+    return counts["inserted"], counts["failed"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--npy", nargs=2, metavar=("DATA_X", "DATA_Y"), help=".npy files")
+    source.add_argument("--jsonl", help="JSONL file")
+    parser.add_argument("--url", default="http://localhost:5000", help="Url of the server")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Texts per request")
+    parser.add_argument("--in-flight", type=int, default=4, help="Parallel requests")
+    parser.add_argument("--start", type=int, default=0, help="Index of the first text")
+    parser.add_argument("--end", type=int, default=None, help="Index after the last text")
+    args = parser.parse_args()
+
+    if args.npy:
+        documents = read_npy(args.npy[0], args.npy[1], args.start, args.end)
+    else:
+        documents = read_jsonl(args.jsonl, args.start, args.end)
+    import_data(documents, args.url, args.batch_size, args.in_flight)
 
-X = X[np.intersect1d(np.where(Y != 7), np.intersect1d(np.where(Y != 8), np.where(Y != 10)))]
-Y = Y[np.intersect1d(np.where(Y != 7), np.intersect1d(np.where(Y != 8), np.where(Y != 10)))]
-# combine categories 3, 4, 5
-Y[np.where(Y == 4)[0]] = 3
-Y[np.where(Y == 5)[0]] = 3
-# change indexes
-Y[np.where(Y == 6)[0]] = 4
-Y[np.where(Y == 9)[0]] = 5
-Y -= 1
 
-data = [{"data": x, "categories": [int(y)]} for x, y in zip(X, Y)]
-for i in tqdm.tqdm(data[4000:8000]):
-    requests.post("http://localhost:5000/api/texts", json=i)
+if __name__ == "__main__":
+    main()